@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Calculate graphlets for a whole list of IDs in one process pool
+
+Each worker builds its runner once and keeps it (and its imports) warm for every protein it is
+handed, instead of paying for a Python launch per protein as the one-line-per-ID taskfile does.
+
+Every attempt is recorded in a manifest (see graphlet_helper/manifest.py), so a rerun of the same
+command skips the proteins already done and only retries the failed ones, up to --retries
+attempts in all. --timeout fails a protein that takes too long: its counting is stopped at the
+limit (external binaries are killed, in-process engines stop once their NumPy call under way
+returns, as do the other modes of a multi-mode run) and the worker moves on.
+
+With --batch N, a worker is handed N proteins at a time and builds their contact graphs together,
+in length buckets (see graphlet_helper/batching.py), before counting them one by one. That is only
+faster for very short chains or threshold sweeps.
+
+With --rows, each worker appends its results to a shard of its own as fixed-width rows (see
+graphlet_helper/featurestore.py), sealed when the pool shuts down, instead of the main process
+writing one compressed npz per ID.
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import contextlib
+import multiprocessing.util
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from graphlet_helper.toolbox import Scratch, Timer, listfile, to_array
+from graphlet_helper.cache import ResultCache
+from graphlet_helper.archive import CoordArchive, is_archive
+from graphlet_helper.metrics import Metrics
+from graphlet_helper.manifest import Manifest, Progress, DONE, FAILED, MISSING, time_limit
+from graphlet_helper.featurestore import RowShardWriter
+from count_graphlets import make_runner, modes, thresholds, add_sampling_arguments, sampling_options, LOCAL_MODES
+
+RUNNER = None
+MODE = None
+THRESHOLDS = None
+TIMEOUT = None
+BATCHER = None
+ROWS = None
+METRICS = Metrics()
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("listfile", type=Path, help="List of IDs")
+    parser.add_argument("input_dir", type=Path, help="Directory to look for IDs, or a packed archive")
+    parser.add_argument("output_dir", type=Path, help="Directory to place individual files (or shards)")
+    parser.add_argument("-mode", type=modes, default=['orca'],
+                        help="Mode, comma-separated modes or all, see count_graphlets.py")
+    parser.add_argument("-t", "--threshold", type=int, default=10, dest='threshold',
+                        help="Contact map threshold")
+    parser.add_argument("--thresholds", type=thresholds, default=None,
+                        help="Comma-separated thresholds, see count_graphlets.py")
+    parser.add_argument("--scratch", choices=Scratch.kinds, default='disk',
+                        help="Where the external binaries' input/output files live (orca, grafene)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes")
+    parser.add_argument("--chunksize", type=int, default=4,
+                        help="IDs handed to a worker at a time")
+    parser.add_argument("--batch", type=int, default=0,
+                        help="Build the contact graphs of this many proteins at once per worker, bucketed by "
+                             "length (see graphlet_helper/batching.py); pays off only for very short chains "
+                             "(under ~60 residues) or --thresholds sweeps, and only when counting is cheap")
+    parser.add_argument("--batch-threads", type=int, default=1,
+                        help="torch threads of each worker for --batch")
+    parser.add_argument("--shard-size", type=int, default=0,
+                        help="Write one shard_<listfile>_XXXXX.npz per this many proteins instead of one npz per ID")
+    parser.add_argument("--rows", action='store_true', default=False,
+                        help="Have each worker append its results as rows to its own rows_*.npy shard "
+                             "(see graphlet_helper/featurestore.py) instead of one npz per ID")
+    parser.add_argument("--cache-dir", type=Path, default=None,
+                        help="Result cache shared by the workers, see count_graphlets.py")
+    parser.add_argument("--cache-size", type=float, default=1.,
+                        help="Cache size limit in GiB")
+    parser.add_argument("--metrics", type=Path, default=None,
+                        help="JSON-lines file of per-protein, per-stage timings (see graphlet_helper/metrics.py)")
+    parser.add_argument("--local", action='store_true', default=False,
+                        help="Also save per-residue orbit counts, see count_graphlets.py (not with --shard-size)")
+    parser.add_argument("--manifest", type=Path, default=None,
+                        help="Status log of every protein, output_dir/manifest.tsv by default")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="Attempts per protein, over this and earlier runs, before it is left failed")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Seconds a protein may take (all its thresholds and modes) before it fails")
+    add_sampling_arguments(parser)
+    args = parser.parse_args()
+    if args.local and not any(mode in LOCAL_MODES for mode in args.mode):
+        parser.error(f"--local needs one of the modes {','.join(LOCAL_MODES)}")
+    if args.local and (args.shard_size > 0 or args.rows):
+        parser.error("--local results differ in size per protein and can't be stacked into shards")
+    if args.rows and args.shard_size > 0:
+        parser.error("--rows and --shard-size are two ways of sharding, pick one")
+    return args
+
+def init_worker(modes, threshold, scratch, sweep, cache_dir, cache_size, archive_dir, metrics, sampling=None,
+                timeout=None, local=False, batch_threads=None, rows_dir=None):
+    """
+    Builds the runner (and its cache, archive, instrumentation) once per worker process
+    args:
+        :batch_threads (int) - torch threads of the bucketed graph construction, None: not used
+        :rows_dir (Path) - directory of the worker's row shard, None: results are sent back
+    """
+    global RUNNER, MODE, THRESHOLDS, TIMEOUT, BATCHER, ROWS
+    RUNNER = make_runner(modes, threshold, scratch=scratch, sampling=sampling, local=local)
+    RUNNER.timeout = TIMEOUT = timeout
+    if timeout:
+        # an expired limit must not land in the middle of the pipeline's first, lazy imports
+        for module in ('scipy.sparse', 'scipy.spatial', 'torch'):
+            with contextlib.suppress(ImportError):
+                importlib.import_module(module)
+    MODE = ','.join(modes)
+    if cache_dir is not None:
+        RUNNER.cache = ResultCache(cache_dir, max_bytes=int(cache_size * 2**30))
+    if archive_dir is not None:
+        RUNNER.read_from(CoordArchive(archive_dir))
+    if metrics:
+        RUNNER.instrument(METRICS)
+    THRESHOLDS = sweep
+    if batch_threads is not None:
+        from graphlet_helper.batching import BucketedContacts
+
+        BATCHER = BucketedContacts(sweep or threshold, threads=batch_threads)
+    if rows_dir is not None:
+        ROWS = RowShardWriter(rows_dir)
+        # sealed as the worker exits at pool shutdown; a killed worker leaves its complete rows in a .part
+        multiprocessing.util.Finalize(ROWS, ROWS.close, exitpriority=10)
+
+def compute(input_file, graphs=None):
+    """
+    Runs the worker's runner on one input file (or archived ID)
+    args:
+        :graphs - the input's contact graph (list of graphs for a sweep) if already built
+    returns:
+        :(dict, None, hits, seconds, record) on success, (None, (manifest status, error message),
+         hits, seconds, record) on failure, where `hits` is the number of graphs of this file served
+         from the cache and `record` its metrics (None unless instrumented); the dict is empty when
+         the worker wrote the result to its row shard
+    """
+    hits = RUNNER.cache.hits if RUNNER.cache is not None else 0
+    if RUNNER.metrics is not None:
+        METRICS.begin(RUNNER.protein(input_file), mode=MODE, worker=os.getpid())
+    start = time.perf_counter()
+    try:
+        with time_limit(TIMEOUT):
+            if graphs is not None and THRESHOLDS:
+                result = RUNNER.count_thresholds(graphs, BATCHER.thresholds, RUNNER.protein(input_file))
+            elif graphs is not None:
+                result = RUNNER.cached_count(graphs, RUNNER.protein(input_file), RUNNER.threshold)
+            elif THRESHOLDS:
+                result = RUNNER.run_thresholds(input_file, THRESHOLDS)
+            else:
+                result = RUNNER.run(input_file)
+        error = None
+    except Exception as e:
+        result, error = None, (MISSING if isinstance(e, FileNotFoundError) else FAILED,
+                               f"{type(e).__name__}: {e}")
+    seconds = time.perf_counter() - start
+    # outside the time limit, which must not cut a row short
+    if result is not None and ROWS is not None:
+        try:
+            with RUNNER.stage('save'):
+                ROWS.add(result)
+            result = {}
+        except (OSError, ValueError) as e:
+            result, error = None, (FAILED, f"{type(e).__name__}: {e}")
+    if RUNNER.cache is not None:
+        hits = RUNNER.cache.hits - hits
+    return result, error, hits, seconds, METRICS.end(error=error and error[1], cache_hits=hits)
+
+def compute_batch(input_files):
+    """
+    `compute` of several inputs, whose contact graphs are built together (see BucketedContacts).
+    An input that fails to load (or a batch that fails to build) is run on its own by `compute`,
+    and the time of the shared graph stage is split evenly among the inputs.
+    returns:
+        :list of compute's results, in the order of `input_files`
+    """
+    load = RUNNER.as_adjmat[:-1]
+    coords, load_seconds = {}, {}
+    for i, input_file in enumerate(input_files):
+        start = time.perf_counter()
+        try:
+            coords[i] = to_array(load(input_file))
+        except Exception:
+            continue
+        load_seconds[i] = time.perf_counter() - start
+    start = time.perf_counter()
+    try:
+        graphs = dict(zip(coords, BATCHER(list(coords.values()))))
+    except Exception:
+        graphs = {}
+    shared = (time.perf_counter() - start) / max(len(graphs), 1)
+
+    results = []
+    for i, input_file in enumerate(input_files):
+        result, error, hits, seconds, record = compute(input_file, graphs.get(i))
+        if i in graphs:
+            seconds += load_seconds[i] + shared
+            if record is not None:
+                for stage, stage_seconds in (('load', load_seconds[i]), ('graph', shared)):
+                    record['seconds'][stage] = record['seconds'].get(stage, 0.) + stage_seconds
+                    record['calls'][stage] = record['calls'].get(stage, 0) + 1
+        results.append((result, error, hits, seconds, record))
+    return results
+
+class ShardWriter(object):
+    """Collects results and writes them `size` proteins at a time, stacked like reduce_graphlets.py"""
+    def __init__(self, output_dir, size, name):
+        """
+        args:
+            :name (str) - shards are named shard_{name}_XXXXX.npz, so that the runs of different
+             lists (e.g. make_graphlet_tasks.py chunks) can share output_dir
+        """
+        self.output_dir = output_dir
+        self.size = size
+        self.name = name
+        self.results = []
+        self.written = 0
+
+    def add(self, result):
+        """returns: proteins written to disk by this call (see flush)"""
+        self.results.append(result)
+        if len(self.results) == self.size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """returns: proteins of the shard written, if any"""
+        if not self.results:
+            return []
+        # a resumed run adds shards after those of earlier runs
+        while (self.output_dir / f"shard_{self.name}_{self.written:05d}.npz").exists():
+            self.written += 1
+        outfile = self.output_dir / f"shard_{self.name}_{self.written:05d}.npz"
+        first = self.results[0]
+        # `mat` (or `{mode}_mat` of several modes) is stacked, the rest is shared by every protein
+        mats = {key: np.stack([result[key] for result in self.results], axis=-2)
+                for key in first if key == 'mat' or key.endswith('_mat')}
+        shared = {key: value for key, value in first.items() if key not in mats and key != 'protein'}
+        np.savez_compressed(outfile,
+                            proteins=[result['protein'] for result in self.results],
+                            **shared, **mats)
+        self.written += 1
+        proteins, self.results = [result['protein'] for result in self.results], []
+        return proteins
+
+if __name__ == '__main__':
+    args = arguments()
+
+    inlist = listfile.read(args.listfile)
+    args.output_dir.mkdir(exist_ok=True, parents=True)
+    shards = ShardWriter(args.output_dir, args.shard_size, args.listfile.stem) if args.shard_size > 0 else None
+    METRICS.filename = args.metrics
+    manifest = Manifest(args.manifest or args.output_dir / "manifest.tsv")
+    key = (args.mode, args.thresholds or args.threshold)
+
+    todo = manifest.pending(inlist, *key, attempts=args.retries)
+    print(f"{len(inlist)} IDs, {len(inlist) - len(todo)} done or out of attempts, "
+          f"t={args.thresholds or args.threshold}, mode={','.join(args.mode)}, workers={args.workers}")
+    timer = Timer().start()
+
+    cache_hits = 0
+    graphs = 0
+    progress = Progress(len(todo))
+    archive_dir = args.input_dir if is_archive(args.input_dir) else None
+    seconds = {}
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.mode, args.threshold, args.scratch, args.thresholds,
+                                       args.cache_dir, args.cache_size, archive_dir,
+                                       args.metrics is not None, sampling_options(args), args.timeout,
+                                       args.local, args.batch_threads if args.batch > 0 else None,
+                                       args.output_dir if args.rows else None)) as pool:
+        while todo:
+            input_files = todo if archive_dir is not None else [args.input_dir / f"{ID}.pt" for ID in todo]
+            retry = []
+            if args.batch > 0:
+                batches = [input_files[i:i + args.batch] for i in range(0, len(input_files), args.batch)]
+                outcomes = (outcome for outcomes in pool.map(compute_batch, batches) for outcome in outcomes)
+            else:
+                outcomes = pool.map(compute, input_files, chunksize=args.chunksize)
+            for ID, (result, error, hits, elapsed, record) in zip(todo, outcomes):
+                cache_hits += hits
+                graphs += len(args.thresholds) if args.thresholds else 1
+                start = time.perf_counter()
+                if error is not None:
+                    status, message = error
+                    print(f"\n[E] {ID}: {message}", file=sys.stderr)
+                    # a missing input won't appear by retrying right away
+                    if manifest.record(ID, *key, status, elapsed, message).attempts < args.retries and \
+                            status == FAILED:
+                        retry.append(ID)
+                        progress.total += 1
+                elif args.rows:
+                    manifest.record(ID, *key, DONE, elapsed)
+                elif shards is not None:
+                    seconds[ID] = elapsed
+                    for written in shards.add(result):
+                        manifest.record(written, *key, DONE, seconds.pop(written))
+                else:
+                    np.savez_compressed(args.output_dir / f"{ID}.npz", **result)
+                    manifest.record(ID, *key, DONE, elapsed)
+                if record is not None:
+                    record['seconds']['save'] = record['seconds'].get('save', 0.) + time.perf_counter() - start
+                    record['calls'].setdefault('save', 1)
+                    METRICS.write(record)
+                progress.update(failed=error is not None)
+                print(f"\r{80 * ' '}\r{progress}", end='', flush=True)
+            todo = retry
+
+    if shards is not None:
+        for written in shards.flush():
+            manifest.record(written, *key, DONE, seconds.pop(written))
+
+    timer.stop()
+    failed = [ID for ID in dict.fromkeys(inlist) if not manifest.done(ID, *key)]
+    print(f"\ncomplete in {timer.elapsed_time}, {len(failed)} failed")
+    if args.cache_dir is not None:
+        print(f"cache: {cache_hits} hits out of {graphs} graphs")
+    # per list: the runs of other lists (e.g. make_graphlet_tasks.py chunks) may share output_dir
+    failed_file = args.output_dir / f"failed_{args.listfile.stem}.txt"
+    if failed:
+        listfile.write(failed, failed_file)
+    else:
+        failed_file.unlink(missing_ok=True)
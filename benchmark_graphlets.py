@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the counting modes on synthetic backbones of several sizes and thresholds
+
+Every (mode, residues, threshold) case runs the real runner pipeline on a .pt file, instrumented
+with metrics.Metrics, and appends one JSON line per case to the results file: median seconds per
+stage, proteins/s, edges/s and peak RSS, tagged with a label and the git commit. --compare checks
+a run against an earlier one and exits non-zero on slowdowns beyond --tolerance.
+"""
+
+import sys
+import time
+import json
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+
+import torch
+import numpy as np
+import scipy.sparse as sp
+
+from graphlet_helper.toolbox import Composer, CoordLoader, AdjacencyMatrixMaker
+from graphlet_helper.synthetic import random_backbone
+from graphlet_helper.metrics import Metrics, read_metrics
+from count_graphlets import modemaker, runner_class
+
+def integers(text):
+    return [int(n) for n in text.split(",")]
+
+def floats(text):
+    return [float(t) for t in text.split(",")]
+
+def strings(text):
+    return text.split(",")
+
+# graph construction alone: the sparse KD-tree path the runners use and the dense distance map path
+GRAPH_MODES = ('contacts', 'contacts-dense')
+MODES = tuple(modemaker) + GRAPH_MODES
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", type=Path, default=Path("benchmarks.jsonl"),
+                        help="JSON-lines results file, appended to")
+    parser.add_argument("--modes", type=strings, default=['orca-native', 'grafene-native', 'clique', 'contacts'],
+                        help=f"Comma-separated modes, of {','.join(MODES)}")
+    parser.add_argument("--sizes", type=integers, default=[100, 500, 2000, 5000, 20000],
+                        help="Comma-separated residue counts")
+    parser.add_argument("--thresholds", type=floats, default=[6., 8., 10.],
+                        help="Comma-separated contact thresholds")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per case, the median is reported")
+    parser.add_argument("--seed", type=int, default=0, help="Backbone seed")
+    parser.add_argument("--budget", type=float, default=60.,
+                        help="Seconds; once a case of a mode/threshold takes longer, its larger sizes are skipped")
+    parser.add_argument("--label", default=None, help="Name of this run (default: the git commit)")
+    parser.add_argument("--compare", type=Path, default=None,
+                        help="Results file to compare against (its latest run, or --baseline-label)")
+    parser.add_argument("--baseline-label", default=None, help="Run of --compare to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative slowdown of the total reported as a regression")
+    args = parser.parse_args()
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {','.join(sorted(unknown))}")
+    return args
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def to_csr(adjacency):
+    """Dense torch adjacency to the sparse matrix the counters take"""
+    return sp.csr_matrix(adjacency.numpy())
+
+def make_runner(mode, threshold):
+    if mode == 'contacts':
+        runner = runner_class('orca-native')(threshold)
+        runner.count = lambda adjmat, protein: dict(channels=[], mat=np.zeros(0), protein=protein)
+        return runner
+    if mode == 'contacts-dense':
+        runner = runner_class('orca-native')(threshold)
+        runner.as_adjmat = Composer(torch.load, CoordLoader(), AdjacencyMatrixMaker(threshold, selfloop=False), to_csr)
+        runner.count = lambda adjmat, protein: dict(channels=[], mat=np.zeros(0), protein=protein)
+        return runner
+    return runner_class(mode)(threshold)
+
+def run_case(mode, filename, threshold, repeats):
+    """
+    returns:
+        :dict of median stage seconds, total, peak RSS and the contact count of one case
+    """
+    # untimed warm-up: engines and their dependencies are imported on first use
+    make_runner(mode, threshold).run(filename)
+    records = []
+    for _ in range(repeats):
+        metrics = Metrics()
+        runner = make_runner(mode, threshold).instrument(metrics)
+        metrics.begin(filename.stem, mode=mode)
+        runner.run(filename)
+        records.append(metrics.end())
+
+    stages = sorted({name for record in records for name in record['seconds']})
+    total = float(np.median([record['total'] for record in records]))
+    edges = records[0]['graphs'][0]['edges']
+    return dict(seconds={name: float(np.median([record['seconds'].get(name, 0.) for record in records]))
+                         for name in stages},
+                total=total,
+                edges=edges,
+                proteins_per_s=1 / total,
+                edges_per_s=edges / total,
+                peak_rss_mb=max(max(record['peak_rss_mb'].values(), default=0.) for record in records))
+
+def latest_run(records, label=None):
+    """Records of the run called `label`, or of the last run in the file"""
+    if label is None and records:
+        label = records[-1]['label']
+    return {(record['mode'], record['residues'], record['threshold']): record
+            for record in records if record['label'] == label}
+
+def compare(current, baseline, tolerance):
+    """
+    Prints the speed of each case of `current` relative to `baseline`
+    returns:
+        :number of cases slower than baseline by more than `tolerance`
+    """
+    regressions = 0
+    print(f"{'mode':<16}{'residues':>9}{'t':>6}{'base s':>10}{'now s':>10}{'ratio':>8}")
+    for key, record in current.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]['total'], record['total']
+        slower = after > before * (1 + tolerance)
+        regressions += slower
+        print(f"{key[0]:<16}{key[1]:>9}{key[2]:>6g}{before:>10.4f}{after:>10.4f}{after / before:>8.2f}"
+              f"{'  REGRESSION' if slower else ''}")
+    return regressions
+
+if __name__ == '__main__':
+    args = arguments()
+    commit = git_commit()
+    run = dict(label=args.label or commit or time.strftime("%Y%m%d-%H%M%S"), commit=commit,
+               timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), host=platform.node(),
+               python=platform.python_version(), torch=torch.__version__, seed=args.seed,
+               repeats=args.repeats)
+
+    current = {}
+    over_budget = set()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for residues in sorted(args.sizes):
+            filename = Path(tmpdir) / f"backbone_{residues}.pt"
+            torch.save(torch.from_numpy(random_backbone(residues, seed=args.seed)), filename)
+            for mode in args.modes:
+                for threshold in args.thresholds:
+                    if (mode, threshold) in over_budget:
+                        print(f"{mode:<16}{residues:>7} residues  t={threshold:g}  skipped (over budget)")
+                        continue
+                    record = dict(run, mode=mode, residues=residues, threshold=threshold,
+                                  **run_case(mode, filename, threshold, args.repeats))
+                    if record['total'] > args.budget:
+                        over_budget.add((mode, threshold))
+                    current[mode, residues, threshold] = record
+                    with open(args.output, 'a') as fWrite:
+                        print(json.dumps(record), file=fWrite)
+                    stages = "  ".join(f"{name} {seconds:.4f}" for name, seconds in record['seconds'].items())
+                    print(f"{mode:<16}{residues:>7} residues  t={threshold:g}  {record['edges']:>8} edges  "
+                          f"{record['total']:.4f}s  {record['proteins_per_s']:.2f} proteins/s  "
+                          f"{record['edges_per_s']:.0f} edges/s  {record['peak_rss_mb']:.0f} MiB  [{stages}]")
+
+    print(f"results appended to {args.output} as run {run['label']}")
+    if args.compare is not None:
+        records = read_metrics(args.compare)
+        if args.baseline_label is None:
+            # when comparing against the output file, its latest run is this one
+            records = [record for record in records if record['label'] != run['label']]
+        baseline = latest_run(records, args.baseline_label)
+        sys.exit(1 if compare(current, baseline, args.tolerance) else 0)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Check the import time of the light entry points against a budget
+
+Each module is imported and timed in a fresh interpreter (best of --repeats); it must stay within
+its budget and must not pull in torch, scipy or networkx, which only the counting modes need.
+Exits non-zero on any violation, so it can guard changes to the package's imports.
+"""
+
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+
+HEAVY = ('torch', 'scipy', 'networkx')
+
+# module -> import budget in ms; the numpy-free ones are held to a few tens of ms
+BUDGETS = {
+    'graphlet_helper': 25,
+    'graphlet_helper.protocol': 50,
+    'graphlet_helper.metrics': 50,
+    'graphlet_client': 50,
+    'graphlet_helper.toolbox': 250,
+    'make_graphlet_tasks': 300,
+    'reduce_graphlets': 300,
+    'pack_archive': 300,
+    'count_graphlets': 300,
+}
+
+PROBE = "import time, sys; start = time.perf_counter(); import {module}; " \
+        "print(time.perf_counter() - start, *sorted(m for m in {heavy} if m in sys.modules))"
+
+def import_time(module, repeats):
+    """
+    returns:
+        :(best milliseconds, heavy modules imported)
+    """
+    best, loaded = float('inf'), []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                             capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+                             timeout=60).stdout.split()
+        best, loaded = min(best, 1000 * float(out[0])), out[1:]
+    return best, loaded
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5, help="Imports per module, the fastest counts")
+    parser.add_argument("--scale", type=float, default=1., help="Multiplies every budget (slow machines)")
+    args = parser.parse_args()
+
+    failures = 0
+    for module, budget in BUDGETS.items():
+        ms, heavy = import_time(module, args.repeats)
+        ok = ms <= budget * args.scale and not heavy
+        failures += not ok
+        print(f"{module:<28}{ms:>8.1f} ms  (budget {budget * args.scale:.0f} ms)"
+              f"{'  imports ' + ','.join(heavy) if heavy else ''}{'' if ok else '  FAIL'}")
+    sys.exit(1 if failures else 0)
@@ -14,6 +14,9 @@ if __name__ == "__main__":
     parser.add_argument("input_dir", type=Path)
     parser.add_argument("output_npz", type=Path)
     parser.add_argument("-t", type=int, help="Threshold")
+    parser.add_argument("-K", type=int, default=8, help="Largest clique size")
+    parser.add_argument("--all", dest="maximal", action='store_false', default=True,
+                        help="Count every k-clique rather than maximal cliques only")
     parser.add_argument("--quiet", "-q", dest="quiet", action='store_true', default=False)
     
     args = parser.parse_args()
@@ -21,7 +24,7 @@ if __name__ == "__main__":
     proteins = listfile.read( args.listfile )
     N = len(proteins)
     
-    runner = CliqueRunner(args.t)
+    runner = CliqueRunner(args.t, K=args.K, maximal=args.maximal)
 
     output_npz = args.output_npz
     if output_npz is None:
@@ -29,12 +32,16 @@ if __name__ == "__main__":
    
     nc = 2
     mat = None
+    mask = np.zeros(N, dtype=bool)
+    missing = []
     for i, protein in enumerate(proteins):
         try:
             result = runner.run(args.input_dir / f"{protein}.pt")
         except FileNotFoundError:
+            missing.append(protein)
             continue
         features = result['mat']
+        mask[i] = True
         if mat is None:
             nc, d = features.shape
 
@@ -48,6 +55,13 @@ if __name__ == "__main__":
         if not args.quiet:
             print(f"\r{80 * ' '}\rfilling ({i}/{N}, {d}) graphlet count mat", end='', flush=True)
 
-    print(f"\nSaving clique distributions to {output_npz}")
+    print(f"\n{N - len(missing)} counted, {len(missing)} missing")
+    if missing:
+        # rows of missing proteins stay zero and are masked out, as in reduce_graphlets.py
+        listfile.write(missing, Path(output_npz).with_name(f"{Path(output_npz).stem}_missing.txt"))
+    if mat is None:
+        raise FileNotFoundError(f"None of the {N} proteins were found in {args.input_dir}")
 
-    np.savez_compressed(output_npz, proteins=proteins, channels=channels, mat=mat)
+    print(f"Saving clique distributions to {output_npz}")
+
+    np.savez_compressed(output_npz, proteins=proteins, channels=channels, mat=mat, mask=mask)
@@ -2,15 +2,76 @@
 # -*- coding: utf-8 -*-
 
 
+import time
 import argparse
 from pathlib import Path
 
-import torch
 import numpy as np
 
-from graphlet_helper import ORCARunner, GRAFENERunner, CliqueRunner
+import graphlet_helper
+from graphlet_helper.toolbox import Scratch, MultiRunner
+from graphlet_helper.cache import ResultCache
+from graphlet_helper.archive import CoordArchive
+from graphlet_helper.metrics import Metrics
+from graphlet_helper.manifest import Manifest, DONE, FAILED, MISSING, time_limit
 
-modemaker = {'orca': ORCARunner, 'grafene': GRAFENERunner, 'clique': CliqueRunner}
+# runner classes by name, imported only once a mode is used (see runner_class)
+modemaker = {'orca': 'ORCARunner', 'orca-native': 'NativeORCARunner', 'orca-sampled': 'SampledORCARunner',
+             'grafene': 'GRAFENERunner', 'grafene-native': 'NativeGRAFENERunner', 'clique': 'CliqueRunner',
+             'descriptors': 'DescriptorRunner'}
+# modes taking the sampling options (see add_sampling_arguments)
+SAMPLED_MODES = ['orca-sampled']
+# modes that can keep per-residue orbit counts (--local)
+LOCAL_MODES = ['orca', 'orca-native']
+# one counter of each family; the native ones give the same numbers as the binaries
+ALL_MODES = ['orca-native', 'grafene-native', 'clique', 'descriptors']
+
+def thresholds(text):
+    return [float(t) for t in text.split(",")]
+
+def modes(text):
+    """Comma-separated modes, or `all`"""
+    names = ALL_MODES if text == 'all' else text.split(",")
+    unknown = [name for name in names if name not in modemaker]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown mode(s) {','.join(unknown)}, choose from "
+                                         f"{','.join(modemaker)} or all")
+    return names
+
+def runner_class(mode):
+    return getattr(graphlet_helper, modemaker[mode])
+
+def make_runner(modes, threshold, scratch='disk', sampling=None, local=False):
+    """
+    The runner of one mode, or a MultiRunner sharing one load and threshold among several
+    args:
+        :sampling (dict) - options of the sampled modes, see add_sampling_arguments
+        :local (bool) - keep per-residue orbit counts in the LOCAL_MODES (see graphlet_helper/gdv.py)
+    """
+    if local and not any(mode in LOCAL_MODES for mode in modes):
+        raise ValueError(f"per-residue counts need one of the modes {','.join(LOCAL_MODES)}")
+
+    def build(mode):
+        options = (sampling or {}) if mode in SAMPLED_MODES else {}
+        if mode in LOCAL_MODES:
+            options = dict(options, local=local)
+        return runner_class(mode)(threshold, scratch=scratch, **options)
+
+    if len(modes) == 1:
+        return build(modes[0])
+    return MultiRunner({mode: build(mode) for mode in modes}, threshold)
+
+def add_sampling_arguments(parser):
+    parser.add_argument("--samples", type=int, default=2048,
+                        help="orca-sampled: nodes sampled per graph at most (without --budget, smaller graphs "
+                             "are counted exactly)")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="orca-sampled: seconds of sampling per graph at most")
+    parser.add_argument("--confidence", type=float, default=0.95,
+                        help="orca-sampled: level of the intervals saved as `ci_mat`")
+
+def sampling_options(args):
+    return dict(samples=args.samples, budget=args.budget, confidence=args.confidence)
 
 def check_exists(filename):
     filename = Path(filename)
@@ -20,25 +81,103 @@ def check_exists(filename):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Calculate graphlets")
-    parser.add_argument("input_pt", type=check_exists,
-                        help="Input coordinate or distance map file (inferred based on shape)")
+    parser.add_argument("input_pt", type=Path,
+                        help="Input coordinate or distance map file (.pt, or .npy to run without torch; inferred "
+                             "based on shape), or an ID with --archive")
     parser.add_argument("output_npz", type=Path,
                         help="Output features")
     parser.add_argument("-t","--threshold", type=int,
                         help="Contact map threshold", default=10, dest='threshold')
-    parser.add_argument("-mode", choices=['orca', 'grafene'])
+    parser.add_argument("--thresholds", type=thresholds, default=None,
+                        help="Comma-separated thresholds (e.g. 6,8,10,12); computes all of them from one "
+                             "load and saves `mat` with a leading threshold axis")
+    parser.add_argument("--trajectory", action='store_true', default=False,
+                        help="The input is a T x N x 3 stack of frames (e.g. MD snapshots); counts every frame, "
+                             "updating the orca and clique counts from the contacts that change between frames, "
+                             "and saves `mat` with a leading frame axis")
+    parser.add_argument("-mode", type=modes, required=True,
+                        help=f"One of {','.join(modemaker)}, a comma-separated list of them, or all "
+                             f"(={','.join(ALL_MODES)}); several modes share one load and threshold of "
+                             f"the input and are saved as `{{mode}}_channels` / `{{mode}}_mat`")
+    parser.add_argument("--scratch", choices=Scratch.kinds, default='disk',
+                        help="Where the external binaries' input/output files live (orca, grafene)")
+    parser.add_argument("--cache-dir", type=Path, default=None,
+                        help="Result cache; graphs counted before (by any protein) are read from it")
+    parser.add_argument("--cache-size", type=float, default=1.,
+                        help="Cache size limit in GiB, least recently used entries are evicted")
+    parser.add_argument("--archive", type=Path, default=None,
+                        help="Packed archive (see pack_archive.py) to read input_pt from by ID")
+    parser.add_argument("--metrics", type=Path, default=None,
+                        help="Append per-stage timings of this run to a JSON-lines file")
+    parser.add_argument("--local", action='store_true', default=False,
+                        help=f"Also save the per-residue orbit counts ({','.join(LOCAL_MODES)} modes) as uint32 "
+                             f"`gdv` (nodes x 73), read them with graphlet_helper.gdv.load_gdv")
+    parser.add_argument("--manifest", type=Path, default=None,
+                        help="Status log shared by the tasks of a campaign (see graphlet_helper/manifest.py); "
+                             "an ID already done is skipped and every outcome is recorded")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Seconds the protein may take before the run fails")
+    add_sampling_arguments(parser)
 
     args = parser.parse_args()
+    if args.local and not any(mode in LOCAL_MODES for mode in args.mode):
+        parser.error(f"--local needs one of the modes {','.join(LOCAL_MODES)}")
+    if args.trajectory and args.thresholds:
+        parser.error("--trajectory counts one threshold, not --thresholds")
+    manifest = Manifest(args.manifest) if args.manifest is not None else None
+    ID = Path(args.input_pt).stem
+    key = (args.mode, args.thresholds or args.threshold)
+    if manifest is not None and manifest.done(ID, *key):
+        print(f"{ID} already done in {args.manifest}")
+        raise SystemExit(0)
+
+    start = time.perf_counter()
+    try:
+        if args.archive is None:
+            check_exists(args.input_pt)
+    except FileNotFoundError as e:
+        if manifest is not None:
+            manifest.record(ID, *key, MISSING, error=f"{type(e).__name__}: {e}")
+        raise
     
     print(f"input file: {args.input_pt}")
     print(f"output file: {args.output_npz}")
-    print(f"t={args.threshold}, mode={args.mode}") 
-    runner = modemaker[args.mode](args.threshold)
+    print(f"t={args.thresholds or args.threshold}, mode={','.join(args.mode)}{', trajectory' if args.trajectory else ''}") 
+    runner = make_runner(args.mode, args.threshold, scratch=args.scratch, sampling=sampling_options(args),
+                         local=args.local)
+    runner.timeout = args.timeout
+    if args.cache_dir is not None:
+        runner.cache = ResultCache(args.cache_dir, max_bytes=int(args.cache_size * 2**30))
+    if args.archive is not None:
+        runner.read_from(CoordArchive(args.archive))
+    metrics = Metrics(args.metrics)
+    if args.metrics is not None:
+        runner.instrument(metrics)
    
     infile   = args.input_pt    
     outfile  = args.output_npz
 
-    result = runner.run(infile)
+    metrics.begin(runner.protein(infile), mode=','.join(args.mode))
+    try:
+        with time_limit(args.timeout):
+            if args.thresholds:
+                result = runner.run_thresholds(infile, args.thresholds)
+            elif args.trajectory:
+                result = runner.run_frames(infile)
+            else:
+                result = runner.run(infile)
+    except Exception as e:
+        if manifest is not None:
+            manifest.record(ID, *key, MISSING if isinstance(e, FileNotFoundError) else FAILED,
+                            time.perf_counter() - start, f"{type(e).__name__}: {e}")
+        raise
+    if runner.cache is not None:
+        print(runner.cache)
     print("Saving now") 
-    np.savez_compressed(outfile, **result)
+    with metrics.stage('save'):
+        np.savez_compressed(outfile, **result)
+    if args.metrics is not None:
+        metrics.write(metrics.end())
+    if manifest is not None:
+        manifest.record(ID, *key, DONE, time.perf_counter() - start)
     print("complete")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+PR / ROC curves and their areas for graphlet_similarity.py results
+
+Takes a labels file (`protein class` per line; pairs of the same class are the positives) and one
+or more result directories over the same proteins, e.g. one per channel or threshold, and
+evaluates all of them in a single pass over the rows (see graphlet_helper/evaluation.py). Writes
+<result name>.tsv, the curve in the columns of `pr-roc-from-allpair-distance`, per result and
+evaluation.json with the areas to output_dir, and prints the areas.
+"""
+
+import json
+import argparse
+from pathlib import Path
+
+from graphlet_helper.toolbox import Timer
+from graphlet_helper.similarity import load_similarity
+from graphlet_helper.evaluation import Evaluation, load_labels, aucs, write_curve
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("labels", type=Path, help="Class label of every protein, `protein class` per line")
+    parser.add_argument("results", type=Path, nargs='+', help="Result directories (graphlet_similarity.py)")
+    parser.add_argument("-o", "--output-dir", type=Path, default=Path("evaluation"),
+                        help="Directory to write curves and areas to")
+    parser.add_argument("--bins", type=int, default=2**16, help="Score bins per result")
+    parser.add_argument("--chunk", type=int, default=2**22, help="Matrix entries read per step")
+    args = parser.parse_args()
+    if len({result.resolve().name for result in args.results}) < len(args.results):
+        parser.error("result directories must have distinct names")
+    return args
+
+if __name__ == '__main__':
+    args = arguments()
+
+    results = [load_similarity(directory) for directory in args.results]
+    labels = load_labels(args.labels)
+    timer = Timer().start()
+    evaluation = Evaluation(results, labels, bins=args.bins, chunk=args.chunk)
+    curves = evaluation()
+    timer.stop()
+
+    args.output_dir.mkdir(exist_ok=True, parents=True)
+    summary = {}
+    for directory, result, curve in zip(args.results, results, curves):
+        name = directory.resolve().name
+        aupr, auroc = aucs(curve)
+        write_curve(curve, args.output_dir / f"{name}.tsv", sign=evaluation.sign(result))
+        positives, negatives = evaluation.totals(result)
+        summary[name] = dict(result=str(directory), metric=result.get('metric'), channel=result.get('channel'),
+                             top_k=result.get('top_k'), AUPR=aupr, AUROC=auroc,
+                             positives=positives, negatives=negatives)
+        print(f"{name}:\tAUPR = {aupr:.6f}\tAUROC = {auroc:.6f}")
+    with open(args.output_dir / "evaluation.json", 'w') as fWrite:
+        json.dump(summary, fWrite, indent=1)
+    print(f"{int(evaluation.labelled.sum())} of {evaluation.N} proteins labelled, "
+          f"evaluated in {timer.elapsed_time}")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Count graphlets through a running graphlet_server.py
+
+Takes the arguments of count_graphlets.py (cache and metrics options belong to the server), sends
+the request over the server's socket and writes the npz it returns. Needs only the standard
+library, so a call costs a round trip instead of a Python + torch start-up.
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+from graphlet_helper.protocol import default_socket, request
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input_pt", type=Path, nargs='?',
+                        help="Input coordinate or distance map file, or an ID with --archive")
+    parser.add_argument("output_npz", type=Path, nargs='?', help="Output features")
+    parser.add_argument("-t", "--threshold", type=int, default=10, dest='threshold',
+                        help="Contact map threshold")
+    parser.add_argument("--thresholds", default=None, help="Comma-separated thresholds")
+    parser.add_argument("-mode", default='orca', help="Mode, comma-separated modes or all")
+    parser.add_argument("--scratch", default='disk', help="Scratch kind of the external binaries")
+    parser.add_argument("--archive", type=Path, default=None,
+                        help="Packed archive to read input_pt from by ID")
+    parser.add_argument("--samples", type=int, default=2048, help="orca-sampled: nodes sampled per graph at most")
+    parser.add_argument("--budget", type=float, default=None, help="orca-sampled: seconds of sampling per graph at most")
+    parser.add_argument("--confidence", type=float, default=0.95, help="orca-sampled: level of the intervals")
+    parser.add_argument("--socket", type=Path, default=default_socket(), help="Server socket")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds to wait for the result")
+    parser.add_argument("--stats", action='store_true', default=False, help="Print server statistics")
+    parser.add_argument("--shutdown", action='store_true', default=False, help="Stop the server")
+    args = parser.parse_args()
+    if not (args.stats or args.shutdown) and (args.input_pt is None or args.output_npz is None):
+        parser.error("input_pt and output_npz are required")
+    return args
+
+if __name__ == '__main__':
+    args = arguments()
+
+    if args.stats or args.shutdown:
+        header, _ = request(dict(op='stats' if args.stats else 'shutdown'), path=args.socket, timeout=args.timeout)
+        print(json.dumps(header))
+        sys.exit(0)
+
+    if args.archive is None and not args.input_pt.exists():
+        raise FileNotFoundError(f"Can\'t find {args.input_pt}")
+
+    header, payload = request(dict(op='count',
+                                   input=str(args.input_pt if args.archive is not None else args.input_pt.resolve()),
+                                   mode=args.mode,
+                                   threshold=args.threshold,
+                                   thresholds=[float(t) for t in args.thresholds.split(",")] if args.thresholds else None,
+                                   scratch=args.scratch,
+                                   sampling=dict(samples=args.samples, budget=args.budget,
+                                                 confidence=args.confidence),
+                                   archive=str(args.archive.resolve()) if args.archive is not None else None),
+                              path=args.socket, timeout=args.timeout)
+    if not header['ok']:
+        print(f"[E] {args.input_pt}: {header['error']}", file=sys.stderr)
+        sys.exit(75 if header.get('busy') else 1)
+
+    args.output_npz.write_bytes(payload)
+    print(f"{header['protein']} -> {args.output_npz} in {header['seconds']:.3f}s")
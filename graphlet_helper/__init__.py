@@ -1,10 +1,29 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from .compute_grafene_features import GRAFENERunner
-from .compute_orca_graphlets import ORCARunner
-from .count_cliques import CliqueRunner
+import importlib
+
+# runners are imported on first access, so importing the package (or one of its light modules,
+# e.g. toolbox for `listfile`) doesn't pull in the counting engines and their dependencies
+_runners = {
+    'GRAFENERunner': '.compute_grafene_features',
+    'NativeGRAFENERunner': '.compute_grafene_features',
+    'ORCARunner': '.compute_orca_graphlets',
+    'NativeORCARunner': '.compute_orca_graphlets',
+    'SampledORCARunner': '.compute_orca_graphlets',
+    'CliqueRunner': '.count_cliques',
+    'DescriptorRunner': '.count_descriptors',
+}
+
+__all__ = list(_runners)
+
+def __getattr__(name):
+    if name in _runners:
+        return getattr(importlib.import_module(_runners[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
 
 if __name__ == '__main__':
     pass
-
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Packed coordinate / distance map archive
+
+An archive is a directory holding
+    data.f32    - every protein's matrix as float32, back to back (C order)
+    index.tsv   - `ID offset rows cols` per protein, offset counted in float32 elements
+The data file is memory-mapped once, so loading a protein is an index lookup returning a
+zero-copy view instead of opening and unpickling one .pt file per protein.
+"""
+
+import pickle
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .toolbox import load, to_array
+
+def is_archive(directory):
+    return (Path(directory) / "index.tsv").exists()
+
+def pack(proteins, input_dir, directory, workers=8):
+    """
+    Packs `{input_dir}/{ID}.pt` of every ID into an archive
+    args:
+        :proteins (list) - IDs, stored in this order
+        :input_dir (Path) - directory of the .pt files
+        :directory (Path) - archive directory to create
+        :workers (int) - reader threads
+    returns:
+        :list of IDs that could not be read
+    """
+    directory = Path(directory)
+    directory.mkdir(exist_ok=True, parents=True)
+
+    def read(ID):
+        try:
+            x = np.ascontiguousarray(to_array(load(Path(input_dir) / f"{ID}.pt")), dtype=np.float32)
+        except (OSError, RuntimeError, EOFError, pickle.UnpicklingError, TypeError, ValueError):
+            # missing, truncated, corrupt, or not a tensor
+            return None
+        return x if x.ndim == 2 else None
+
+    missing = []
+    offset = 0
+    with open(directory / "data.f32", 'wb') as data, open(directory / "index.tsv", 'w') as index, \
+         ThreadPoolExecutor(max_workers=workers) as pool:
+        for ID, x in zip(proteins, pool.map(read, proteins)):
+            if x is None:
+                missing.append(ID)
+                continue
+            data.write(x.tobytes())
+            print(ID, offset, *x.shape, sep='\t', file=index)
+            offset += x.size
+    return missing
+
+class CoordArchive(object):
+    """
+    Read access to an archive by ID; `load` can stand in for toolbox.load as a Composer's first stage
+    """
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.index = {}
+        with open(self.directory / "index.tsv", 'r') as fRead:
+            for line in fRead:
+                ID, offset, rows, cols = line.split('\t')
+                self.index[ID] = (int(offset), int(rows), int(cols))
+        # copy-on-write: views are writable (as torch.from_numpy expects) but never write back to the archive
+        self.data = (np.memmap(self.directory / "data.f32", dtype=np.float32, mode='c')
+                     if self.index else np.zeros(0, dtype=np.float32))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, ID):
+        return ID in self.index
+
+    @property
+    def proteins(self):
+        return list(self.index)
+
+    def protein(self, key):
+        """ID of a key given as an ID or as a `{ID}.pt` style path"""
+        key = str(key)
+        return key if key in self.index else Path(key).stem
+
+    def shape(self, key):
+        _, rows, cols = self.index[self.protein(key)]
+        return rows, cols
+
+    def __getitem__(self, key):
+        """Zero-copy NumPy view of one protein's matrix"""
+        offset, rows, cols = self.index[self.protein(key)]
+        return self.data[offset:offset + rows * cols].reshape(rows, cols)
+
+    def load(self, key):
+        """Zero-copy view of one protein's matrix, the archive's stand-in for toolbox.load (no torch needed)"""
+        return self[key]
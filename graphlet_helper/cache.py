@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed on-disk cache of runner results
+
+Entries are keyed on a hash of the contact graph together with the threshold, the runner (mode)
+and a digest of the binary or module that does the counting, so unchanged inputs and duplicate
+structures are served without recounting. The store is bounded in size and evicts the least
+recently used entries first; recency is the entry file's mtime, which is refreshed on every hit.
+"""
+
+import os
+import hashlib
+import zipfile
+import tempfile
+import functools
+from pathlib import Path
+
+import numpy as np
+
+@functools.lru_cache(maxsize=None)
+def file_digest(*paths):
+    """sha256 over the contents of one or more files, e.g. the binaries a runner calls"""
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as fRead:
+            for block in iter(lambda: fRead.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+def graph_digest(adjmat):
+    """sha256 of a sparse adjacency's shape and sorted sparsity pattern"""
+    adjmat = adjmat.tocsr()
+    adjmat.sort_indices()
+    h = hashlib.sha256()
+    h.update(np.asarray(adjmat.shape, dtype=np.int64).tobytes())
+    h.update(adjmat.indptr.astype(np.int64).tobytes())
+    h.update(adjmat.indices.astype(np.int64).tobytes())
+    return h.hexdigest()
+
+class ResultCache(object):
+    """
+    Size-bounded LRU store of result dicts, one .npz per key under `directory`
+    """
+    def __init__(self, directory, max_bytes=1 << 30):
+        """
+        args:
+            :directory (str or Path) - where entries live, shared safely between processes
+            :max_bytes (int) - total size the store is trimmed back to when exceeded
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True, parents=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    def key(self, adjmat, threshold, mode, version):
+        """Cache key of counting `adjmat` at `threshold` with runner `mode` at engine `version`"""
+        h = hashlib.sha256()
+        h.update(graph_digest(adjmat).encode())
+        h.update(f"|{float(threshold)!r}|{mode}|{version}".encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.npz"
+
+    def _entries(self):
+        return self.directory.glob("??/*.npz")
+
+    def get(self, key):
+        """
+        returns:
+            :dict of the stored arrays, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                result = {name: data[name] for name in data.files}
+            os.utime(path)
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            # missing, or torn / corrupt: counted again and overwritten
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Stores a result dict atomically, then evicts old entries if over budget"""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as fWrite:
+            np.savez(fWrite, **result)
+        os.replace(tmp, path)
+        self._size += path.stat().st_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the store fits in `max_bytes`"""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort()
+
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses,
+                    hit_rate=self.hits / lookups if lookups else 0., bytes=self._size)
+
+    def __str__(self):
+        stats = self.stats
+        return (f"{self.__class__.__name__}({self.directory}: {stats['hits']} hits, "
+                f"{stats['misses']} misses, {stats['bytes'] / 2**20:.1f} MiB)")
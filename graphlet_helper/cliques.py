@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Clique size distributions of sparse contact graphs
+
+Vertices are relabelled in degeneracy order and every neighbourhood is held as a Python integer
+bitset, so set intersections are single big-int ANDs. Maximal cliques are enumerated with
+Bron–Kerbosch (Tomita pivoting) started from each vertex's later neighbours (Eppstein et al.);
+all k-cliques are enumerated over the same orientation. Only the size histogram is kept.
+
+With `roots`, only the cliques holding at least one root vertex are counted (branches that can't
+reach a root are cut), which is what an incremental update needs: see `local_clique_sizes`.
+"""
+
+import heapq
+
+import numpy as np
+import scipy.sparse as sp
+
+def degeneracy_order(adjmat):
+    """
+    Vertex order that repeatedly removes a vertex of minimum remaining degree
+    args:
+        :adjmat (scipy.sparse matrix) - symmetric adjacency, no self loops
+    returns:
+        :np.ndarray of vertex ids
+    """
+    adjmat = sp.csr_matrix(adjmat)
+    degree = np.diff(adjmat.indptr).tolist()
+    heap = [(d, v) for v, d in enumerate(degree)]
+    heapq.heapify(heap)
+    removed = [False] * len(degree)
+    order = []
+    while heap:
+        d, v = heapq.heappop(heap)
+        if removed[v] or d != degree[v]:
+            continue
+        removed[v] = True
+        order.append(v)
+        for u in adjmat.indices[adjmat.indptr[v]:adjmat.indptr[v + 1]].tolist():
+            if not removed[u]:
+                degree[u] -= 1
+                heapq.heappush(heap, (degree[u], u))
+    return np.asarray(order, dtype=np.int64)
+
+def neighbour_bitsets(adjmat, roots=None):
+    """
+    Integer bitset neighbourhoods, with vertex i of the result being the i-th in degeneracy order
+    args:
+        :roots (array-like) - vertex ids, returned as a bitset in the same order
+    returns:
+        :list of bitsets, or (list of bitsets, root bitset) if `roots` is given
+    """
+    adjmat = sp.csr_matrix(adjmat)
+    order = degeneracy_order(adjmat)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.shape[0])
+
+    adjmat = adjmat[order][:, order].tocsr()
+    adjmat.setdiag(0)
+    adjmat.eliminate_zeros()
+    bitsets = []
+    for v in range(adjmat.shape[0]):
+        bits = 0
+        for u in adjmat.indices[adjmat.indptr[v]:adjmat.indptr[v + 1]].tolist():
+            bits |= 1 << u
+        bitsets.append(bits)
+    if roots is None:
+        return bitsets
+    return bitsets, sum(1 << v for v in set(rank[np.asarray(roots, dtype=np.int64)].tolist()))
+
+def _bits(x):
+    """Yields the set bit positions of x, lowest first"""
+    while x:
+        low = x & -x
+        yield low.bit_length() - 1
+        x ^= low
+
+def maximal_clique_sizes(adjmat, K=8, roots=None):
+    """
+    Histogram of maximal clique sizes
+    args:
+        :roots (array-like) - if given, only cliques holding one of these vertices are counted
+    returns:
+        :np.ndarray (K + 1,) int64, entry k is the number of maximal cliques of size k (sizes above K
+         are counted in entry K)
+    """
+    if roots is None:
+        N = neighbour_bitsets(adjmat)
+        R = (1 << len(N)) - 1
+    else:
+        N, R = neighbour_bitsets(adjmat, roots)
+    counts = [0] * (K + 1)
+
+    def expand(size, P, X, rooted):
+        if not rooted and not P & R:
+            return
+        if not P:
+            if not X:
+                counts[min(size, K)] += 1
+            return
+        # Tomita pivot: the vertex of P | X covering most of P
+        pivot = max(_bits(P | X), key=lambda u: (P & N[u]).bit_count())
+        for v in _bits(P & ~N[pivot]):
+            bit = 1 << v
+            expand(size + 1, P & N[v], X & N[v], rooted or bool(R & bit))
+            P ^= bit
+            X |= bit
+
+    for v, neighbours in enumerate(N):
+        later = neighbours >> (v + 1) << (v + 1)
+        expand(1, later, neighbours ^ later, bool(R >> v & 1))
+    return np.asarray(counts, dtype=np.int64)
+
+def clique_counts(adjmat, K=8, roots=None):
+    """
+    Number of (not necessarily maximal) k-cliques for every k up to K
+    args:
+        :roots (array-like) - if given, only cliques holding one of these vertices are counted
+    returns:
+        :np.ndarray (K + 1,) int64, entry k is the number of k-cliques
+    """
+    if roots is None:
+        N = neighbour_bitsets(adjmat)
+        ALL = R = (1 << len(N)) - 1
+    else:
+        N, R = neighbour_bitsets(adjmat, roots)
+        ALL = (1 << len(N)) - 1
+    later = [neighbours >> (v + 1) << (v + 1) for v, neighbours in enumerate(N)]
+    # plain ints, numpy scalar updates dominate the inner loop otherwise
+    counts = [0] * (K + 1)
+    counts[1] = R.bit_count()
+
+    # a clique is counted once it holds a root: `rooted` cliques count every extension, the others
+    # only the extensions by a root
+    def expand(size, candidates, rooted):
+        if not rooted and not candidates & R:
+            return
+        counts[size] += (candidates if rooted else candidates & R).bit_count()
+        if size == K:
+            return
+        if size + 1 == K:
+            # the last level only needs the sizes of the common neighbourhoods
+            counts[K] += sum((candidates & later[v] & (ALL if rooted or R >> v & 1 else R)).bit_count()
+                             for v in _bits(candidates))
+            return
+        for v in _bits(candidates):
+            common = candidates & later[v]
+            if common:
+                expand(size + 1, common, rooted or bool(R >> v & 1))
+
+    for v in range(len(N)):
+        if later[v] and K >= 2:
+            expand(2, later[v], bool(R >> v & 1))
+    return np.asarray(counts, dtype=np.int64)
+
+def local_clique_sizes(adjmat, nodes, K=8, maximal=True):
+    """
+    Clique histogram (as maximal_clique_sizes / clique_counts) of the cliques holding one of `nodes`,
+    computed on the subgraph of the nodes and their neighbours, which holds all of those cliques
+    and everything that could extend them (so maximality is decided there as in the whole graph)
+    """
+    adjmat = sp.csr_matrix(adjmat)
+    nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+    around = np.union1d(nodes, adjmat[nodes].indices)
+    sub = adjmat[around][:, around]
+    roots = np.searchsorted(around, nodes)
+    if maximal:
+        return maximal_clique_sizes(sub, K=K, roots=roots)
+    return clique_counts(sub, K=K, roots=roots)
@@ -21,14 +21,16 @@ This script modifies that routine to do the following:
 
 import site
 import shlex
-import tempfile
 import subprocess
 from pathlib import Path
 
-import torch
 import numpy as np
+import scipy.sparse as sp
 
-from .toolbox import Composer, Timer, AdjacencyMatrixMaker, CoordLoader
+from .toolbox import load, Composer, Timer, ContactGraphMaker, ContactRunner, Scratch, format_rows
+from .cache import file_digest
+from . import grafene_native
+from .grafene_native import ordered_counts, normalize
 
 psn_approach = "NormOrderedGraphlet-3-4".casefold()
 threshold = "6A"
@@ -43,42 +45,50 @@ def check_exists(filename):
         raise FileNotFoundError(f"Can\'t find {filename}")
     return filename
 
+def leda_text(adjmat):
+    """
+    LEDA representation of a symmetric adjacency matrix, each undirected edge written once
+    args:
+        :adjmat (scipy.sparse.csr_matrix) - adjacency matrix
+    returns:
+        :str - contents of the leda file
+    """
+    # ncount-ordered reads exactly `num_edges` edge lines, so the count has to match the list
+    upper = sp.triu(adjmat, k=1).tocoo()
+    rows, cols = upper.row, upper.col
+    num_nodes = adjmat.shape[0]
+    num_edges = rows.shape[0]
+
+    header = "\n".join(["LEDA.GRAPH", "string", "short", "-2"])
+    nodes = format_rows("|{%d}|\n", np.arange(1, num_nodes + 1)[:, None])
+    edges = format_rows("%d %d 0 |{}|\n", np.column_stack([rows, cols]) + 1)
+    return f"{header}\n{num_nodes}\n{nodes}{num_edges}\n{edges}"
+
 def write_leda(adjmat, filename):
     """
     Writes a leda file to a filename from an adjacency matrix representation
     args:
-        :adjmat (torch.Tensor) - adjacency matrix
+        :adjmat (scipy.sparse.csr_matrix) - adjacency matrix
         :filename (str or Path) - path to write to
     returns:
         :None, writes the file by side effect
     """
-    # count each edge twice and divide by 2
-    num_edges = int(adjmat.sum(dim=1).sum(dim=0) / 2)
-    num_nodes = adjmat.shape[0]
-
-    header = "\n".join(["LEDA.GRAPH", "string", "short", "-2"])
     with open(filename, 'w') as ledafile:
-        # header section
-        print(header, file=ledafile)
-        # node section
-        print(num_nodes, file=ledafile)
-        for i in range(1, num_nodes+1):
-            print("|{"f"{i}""}|", file=ledafile)
-        # edge section
-        print(num_edges, file=ledafile)
-        for i in range(1, num_nodes+1):
-            for j in range(1, num_nodes+1):
-                if adjmat[i-1, j-1]:
-                    print(f"{i} {j} 0 ""|{}|", file=ledafile)
-
-
-class GRAFENERunner(object):
+        ledafile.write(leda_text(adjmat))
+
+
+class GRAFENERunner(ContactRunner):
     """Runs GRAFENE, computes normorderd 3-4 graphlet degree vectors"""
-    def __init__(self, threshold=6):
+    def __init__(self, threshold=6, scratch='disk'):
+        """
+        args:
+            :threshold (float) - contact map threshold
+            :scratch (str) - where the binaries' input/output live, see toolbox.Scratch
+        """
         self.threshold = threshold
-        self.as_adjmat  = Composer(torch.load,
-                                   CoordLoader(silent_if_square=True),
-                                   AdjacencyMatrixMaker(self.threshold, selfloop=False))
+        self.scratch = scratch
+        self.as_adjmat  = Composer(load,
+                                   ContactGraphMaker(self.threshold, selfloop=False))
         
         self.bindir = BIN
         self._count_ordered_path = self.bindir / 'ncount-ordered'
@@ -86,53 +96,65 @@ class GRAFENERunner(object):
 
         self.count_ordered = f"{self._count_ordered_path}"" {ledafile} {ordered_counts}".format
         self.normalize     = f"{self._normalize_graphlets_path}"" {ordered_counts} {normed}".format
+
+    @property
+    def version(self):
+        return file_digest(self._count_ordered_path, self._normalize_graphlets_path, __file__)
         
-    def run(self, filename):
+    def count(self, A, stem):
         """
-        Dispatches a GRAFENE run, reads/records results, cleansu p.
+        Dispatches a GRAFENE run on a sparse adjacency, reads/records results, cleansu p.
         """
-        filename = Path(filename)
-        A = self.as_adjmat(filename)
-        stem = filename.stem
-
-        timer = Timer().start()
-    
-        with tempfile.TemporaryDirectory() as tmpdir:
-            ledafile = Path(tmpdir) / f"tmp_{stem}.gw"
-            counts   = Path(tmpdir) / f"tmp_{stem}.ogf"
-            normed   = Path(tmpdir) / f"tmp_{stem}.norm"
-            
+        with Scratch(self.scratch) as scratch:
             # write down ledafile
-            write_leda(A, ledafile)
+            with self.stage('serialize'):
+                ledafile, stdin = scratch.feed(f"tmp_{stem}.gw", leda_text(A))
+            counts   = scratch.path(f"tmp_{stem}.ogf")
+            normed   = scratch.path(f"tmp_{stem}.norm")
             
             # press out the commands
             count_cmd = self.count_ordered(ledafile=ledafile, ordered_counts=counts)
             norm_cmd  = self.normalize(ordered_counts=counts, normed=normed)
             
             # run commands
-            for cmd in (count_cmd, norm_cmd):
-                subprocess.run(shlex.split(cmd))
+            with self.stage('subprocess'):
+                subprocess.run(shlex.split(count_cmd), input=stdin, pass_fds=scratch.pass_fds,
+                               timeout=self.timeout)
+                subprocess.run(shlex.split(norm_cmd), pass_fds=scratch.pass_fds, timeout=self.timeout)
                 
             # parse vector
-
-            with open(normed, 'r') as normed_counts:
-                normed_vector = np.array(list(map(lambda line: float(line.strip()), normed_counts)))
+            with self.stage('parse'):
+                normed_vector = np.array(scratch.read(f"tmp_{stem}.norm").split(), dtype=float)
                 normed_shape = normed_vector.shape[0]
 
-            with open(counts, 'r') as raw_counts:
-                lines = raw_counts.readlines()
+                lines = scratch.read(f"tmp_{stem}.ogf").splitlines()
                 count_vector = np.array(list(map(lambda line: float(line.strip().split("\t")[1]), lines)))
                 pad_defn = (0, normed_shape - count_vector.shape[0])
                 padded = np.pad(count_vector, pad_defn, 'constant')
 
-        timer.stop()
         return dict(channels=['raw', 'normed'],
                     mat=np.concatenate([padded[None, ...], normed_vector[None, ...]]),
                     protein=stem,
                     )
 
-    def __str__(self):
-        return f"{self.__class__.__name__}({self.threshold})"
+class NativeGRAFENERunner(GRAFENERunner):
+    """Computes the same NormOrderedGraphlet-3-4 features as GRAFENERunner in-process, without the binaries"""
+    @property
+    def version(self):
+        return file_digest(grafene_native.__file__, __file__)
+
+    def count(self, A, stem):
+        """
+        Counts ordered graphlets of the thresholded contact graph directly from its sparse adjacency.
+        """
+        with self.stage('count'):
+            raw = ordered_counts(A).astype(float)
+        normed_vector = normalize(raw)
+        padded = np.pad(raw, (0, normed_vector.shape[0] - raw.shape[0]), 'constant')
+        return dict(channels=['raw', 'normed'],
+                    mat=np.concatenate([padded[None, ...], normed_vector[None, ...]]),
+                    protein=stem,
+                    )
 
 if __name__ == '__main__':
     import argparse
@@ -144,12 +166,16 @@ if __name__ == '__main__':
                         help="Output features")
     parser.add_argument("-t","--threshold", type=int,
                         help="Contact map threshold", default=6, dest='threshold')
+    parser.add_argument("--native", action='store_true', default=False,
+                        help="Count ordered graphlets in-process instead of calling the GRAFENE binaries")
+    parser.add_argument("--scratch", choices=Scratch.kinds, default='disk',
+                        help="Where the binaries' input/output files live")
 
     args = parser.parse_args()
     
     # runs GRAFENE wrapper 
-    runner = GRAFENERunner(args.threshold)
+    runner = (NativeGRAFENERunner if args.native else GRAFENERunner)(args.threshold, scratch=args.scratch)
     result = runner.run(args.input_pt)
 
-    print(f"Finished {args.input_pt} in {resul['mat'].shape}")
+    print(f"Finished {args.input_pt} in {result['mat'].shape}")
     np.savez_compressed(args.output_npz, **result)
@@ -6,120 +6,171 @@ Compute (global) graphlet counts for a thresholded distance map.
 """
 
 import shlex
-import tempfile
 import subprocess
 from pathlib import Path
 
-import torch
 import numpy as np
-import networkx as nx
+import scipy.sparse as sp
 
-from .toolbox import Composer, Timer, AdjacencyMatrixMaker, CoordLoader
+from .toolbox import load, Composer, Timer, ContactGraphMaker, ContactRunner, Scratch, format_rows, stack_results
+from .orca_native import orbit_counts, graphlet_counts, NUM_ORBITS
+from .orca_sampling import sample_graphlets
+from .trajectory import OrbitTracker, frame_changes
+from . import orca_native, orca_sampling
+from .cache import file_digest
+from .gdv import compact
 
 BIN = Path(__file__).resolve().absolute().parent / "bin"
 assert BIN.exists(), "Script not located at same level as ORCA bin/ directory"
 
 def count_graphlets(gdv):
-    """Count graphlets in the whole network."""
-    g = {}
-    g[0] = {'idx': [0], 'nodes': 2}
-
-    g[1] = {'idx': [1, 2], 'nodes': 3}
-    g[2] = {'idx': [3], 'nodes': 3}
-
-    g[3] = {'idx': [4, 5], 'nodes': 4}
-    g[4] = {'idx': [6, 7], 'nodes': 4}
-    g[5] = {'idx': [8], 'nodes': 4}
-    g[6] = {'idx': [9, 10, 11], 'nodes': 4}
-    g[7] = {'idx': [12, 13], 'nodes': 4}
-    g[8] = {'idx': [14], 'nodes': 4}
-
-    g[9] = {'idx': [15, 16, 17], 'nodes': 5}
-    g[10] = {'idx': [18, 19, 20, 21], 'nodes': 5}
-    g[11] = {'idx': [22, 23], 'nodes': 5}
-    g[12] = {'idx': [24, 25, 26], 'nodes': 5}
-    g[13] = {'idx': [27, 28, 29, 30], 'nodes': 5}
-    g[14] = {'idx': [31, 32, 33], 'nodes': 5}
-    g[15] = {'idx': [34], 'nodes': 5}
-    g[16] = {'idx': [35, 36, 37, 38], 'nodes': 5}
-    g[17] = {'idx': [39, 40, 41, 42], 'nodes': 5}
-    g[18] = {'idx': [43, 44], 'nodes': 5}
-    g[19] = {'idx': [45, 46, 47, 48], 'nodes': 5}
-    g[20] = {'idx': [49, 50], 'nodes': 5}
-    g[21] = {'idx': [51, 52, 53], 'nodes': 5}
-    g[22] = {'idx': [54, 55], 'nodes': 5}
-    g[23] = {'idx': [56, 57, 58], 'nodes': 5}
-    g[24] = {'idx': [59, 60, 61], 'nodes': 5}
-    g[25] = {'idx': [62, 63, 64], 'nodes': 5}
-    g[26] = {'idx': [65, 66, 67], 'nodes': 5}
-    g[27] = {'idx': [68, 69], 'nodes': 5}
-    g[28] = {'idx': [70, 71], 'nodes': 5}
-    g[29] = {'idx': [72], 'nodes': 5}
-
-    counts = []
-    for ii in range(0, 30):
-        counts.append(float(gdv[:, g[ii]['idx']].sum())/g[ii]['nodes'])
-
-    return np.asarray(counts, dtype=np.int)
-
-
-
+    """Count graphlets in the whole network: one orbit -> graphlet weight product (see orca_native.MEMBERSHIP)."""
+    return graphlet_counts(gdv)
 
 def to_numpy(tensor):
     return tensor.numpy()
 
-def write_orca_input_file(G, fname):
+def summarize(node_gdv, protein, local=False):
+    """
+    Collapses a node x 73 orbit matrix into raw and normalized global graphlet counts
+    args:
+        :local (bool) - also keep the orbit matrix as `gdv` (see gdv.py)
+    """
+    result = global_channels(count_graphlets(node_gdv), protein)
+    return dict(result, gdv=compact(node_gdv)) if local else result
+
+def global_channels(graph_gdv, protein):
+    """raw and normalized channels of 30 global graphlet counts"""
+    normed_gdv = graph_gdv / graph_gdv.sum()
+
+    graph_gdvs = np.concatenate([graph_gdv[None, :], normed_gdv[None, :]])
+    return dict(channels=['raw', 'normed'], mat=graph_gdvs, protein=protein)
+
+def orca_input_text(adjmat):
+    """Graph edgelist in ORCA's input format, each undirected edge once."""
+    upper = sp.triu(adjmat, k=1).tocoo()
+    edges = np.column_stack([upper.row, upper.col])
+    return f"{adjmat.shape[0]} {edges.shape[0]}\n" + format_rows("%d %d\n", edges)
+
+def write_orca_input_file(adjmat, fname):
     """Write graph edgelist file."""
-    fWrite = open(fname, 'w')
-    fWrite.write("%d %d\n" % (G.order(), G.size()))
-    for (n1, n2) in G.edges():
-        fWrite.write("%d %d\n" % (n1, n2))
-    fWrite.close()
+    with open(fname, 'w') as fWrite:
+        fWrite.write(orca_input_text(adjmat))
+
+def parse_orca_output(text):
+    """Parse the node x 73 graphlet counts written by orca.exe."""
+    return np.fromstring(text, dtype=np.int64, sep=" ").reshape(-1, NUM_ORBITS)
 
 def read_orca_output_file(fname):
     """Read graphlet counts file."""
-    A = np.loadtxt(fname, delimiter=" ")
-    return A
+    with open(fname, 'r') as fRead:
+        return parse_orca_output(fRead.read())
 
-class ORCARunner(object):
+class ORCARunner(ContactRunner):
     """Runs ORCA, computes graphlet degree vectors"""
-    def __init__(self, threshold=6):
+    def __init__(self, threshold=6, scratch='disk', local=False):
+        """
+        args:
+            :threshold (float) - contact map threshold
+            :scratch (str) - where orca.exe's input/output live, see toolbox.Scratch
+            :local (bool) - keep the per-residue orbit counts as `gdv` (see gdv.py)
+        """
         self.threshold = threshold
-        self.as_graph  = Composer(torch.load,
-                                  CoordLoader(silent_if_square=True),
-                                  AdjacencyMatrixMaker(self.threshold, selfloop=False),
-                                  to_numpy,
-                                  nx.from_numpy_matrix)
+        self.scratch = scratch
+        self.local = local
+        self.as_adjmat = Composer(load,
+                                  ContactGraphMaker(self.threshold, selfloop=False))
 
         self.orca_path = (BIN / 'orca.exe').absolute()
         self.cmd_template = f"{self.orca_path}"" 5 {infile} {outfile}" 
 
-    def run(self, filename):
+    @property
+    def version(self):
+        return file_digest(self.orca_path, __file__) + ('-local' if self.local else '')
+
+    def count(self, adjmat, pdb_id):
         """
-        Dispathes an ORCA run, reads/records results, cleans up.
+        Dispathes an ORCA run on a sparse adjacency, reads/records results, cleans up.
         """
-        filename = Path(filename)
-        pdb_id = filename.stem
+        with Scratch(self.scratch) as scratch:
+            with self.stage('serialize'):
+                infile, stdin = scratch.feed(f"tmp_{pdb_id}.in", orca_input_text(adjmat))
+            outfile = scratch.path(f"tmp_{pdb_id}.out")
+            cmd   = shlex.split(self.cmd_template.format(infile=infile, outfile=outfile))
+            with self.stage('subprocess'):
+                subprocess.run(cmd, input=stdin, pass_fds=scratch.pass_fds, timeout=self.timeout)
+            with self.stage('parse'):
+                node_gdv  = parse_orca_output(scratch.read(f"tmp_{pdb_id}.out"))
 
-        graph = self.as_graph(filename)
+        return summarize(node_gdv, pdb_id, self.local)
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            infile  = Path(tmpdir) / f"tmp_{pdb_id}.in"
-            outfile = Path(tmpdir) / f"tmp_{pdb_id}.out"
-            cmd   = shlex.split(self.cmd_template.format(infile=infile, outfile=outfile))
-            write_orca_input_file(graph, infile)
-            subprocess.run(cmd)
-            node_gdv  = read_orca_output_file(outfile) 
+class NativeORCARunner(ORCARunner):
+    """Computes the same graphlet degree vectors as ORCARunner in-process, without orca.exe"""
+    @property
+    def version(self):
+        return file_digest(orca_native.__file__, __file__) + ('-local' if self.local else '')
 
-            graph_gdv = count_graphlets(node_gdv)
-            normed_gdv = graph_gdv / graph_gdv.sum()
+    def count(self, adjmat, pdb_id):
+        """
+        Counts orbits of the thresholded contact graph directly from its sparse adjacency.
+        """
+        with self.stage('count'):
+            node_gdv = orbit_counts(adjmat)
+        return summarize(node_gdv, pdb_id, self.local)
 
-            graph_gdvs = np.concatenate([graph_gdv[None, :], normed_gdv[None, :]]) 
-        
-        return dict(channels=['raw', 'normed'], mat=graph_gdvs, protein=pdb_id)
+    def count_frames(self, graphs, pdb_id):
+        """
+        Orbit counts of every frame of a trajectory, updated in-process from the contacts that change
+        between frames (see trajectory.py) instead of counting each frame from scratch
+        """
+        tracker = OrbitTracker()
+        results = []
+        for adjmat, changes in zip(graphs, frame_changes(graphs)):
+            with self.stage('count'):
+                node_gdv = tracker(adjmat, changes)
+            results.append(summarize(node_gdv, pdb_id, self.local))
+        return dict(stack_results(results), frames=np.arange(len(graphs)), protein=pdb_id)
+
+class SampledORCARunner(NativeORCARunner):
+    """
+    Estimates ORCARunner's global graphlet counts from a sample of nodes (see orca_sampling.py), for
+    structures too large to count exactly. Results have the usual raw / normed channels, plus
+    `ci_mat` (2, 30), the lower and upper bounds of the raw counts at level `confidence`.
+    """
+    def __init__(self, threshold=6, scratch='disk', samples=2048, budget=None, confidence=0.95, seed=0):
+        """
+        args:
+            :threshold (float) - contact map threshold
+            :scratch (str) - unused, for the signature of the other runners
+            :samples (int) - nodes to sample at most; without a budget, smaller graphs are counted exactly
+            :budget (float) - seconds to sample for at most, per graph
+            :confidence (float) - level of the intervals
+            :seed (int) - seed of the node sample
+        """
+        super().__init__(threshold, scratch=scratch)
+        self.samples = samples
+        self.budget = budget
+        self.confidence = confidence
+        self.seed = seed
+
+    @property
+    def version(self):
+        return f"{file_digest(orca_native.__file__, orca_sampling.__file__, __file__)}" \
+               f"-{self.samples}-{self.budget}-{self.confidence}-{self.seed}"
+
+    def count(self, adjmat, pdb_id):
+        """
+        Estimates the global counts of the thresholded contact graph and their intervals.
+        """
+        with self.stage('count'):
+            counts, lower, upper, _ = sample_graphlets(adjmat, self.samples, budget=self.budget,
+                                                       confidence=self.confidence, seed=self.seed)
+        result = global_channels(np.rint(counts).astype(np.int64), pdb_id)
+        return dict(result, ci_mat=np.stack([lower, upper]), confidence=self.confidence)
 
-    def __str__(self):
-        return f"{self.__class__.__name__}({self.threshold})"
+    def count_frames(self, graphs, pdb_id):
+        # estimates don't update incrementally: each frame is sampled on its own
+        return ContactRunner.count_frames(self, graphs, pdb_id)
 
 
 if __name__ == "__main__":
@@ -129,10 +180,16 @@ if __name__ == "__main__":
     parser.add_argument("input_pt", type=Path, help="Input PyTorch tensor file.")
     parser.add_argument("output_npz", type=Path, help="Output NPZ file path")
     parser.add_argument("-t", "--threshold", dest="threshold", type=float, default=6.)
+    parser.add_argument("--native", action='store_true', default=False,
+                        help="Count orbits in-process instead of calling orca.exe")
+    parser.add_argument("--scratch", choices=Scratch.kinds, default='disk',
+                        help="Where orca.exe's input/output files live")
+    parser.add_argument("--local", action='store_true', default=False,
+                        help="Also save the per-residue orbit counts (see gdv.py)")
 
     args = parser.parse_args()
 
-    orca = ORCARunner(args.threshold)
+    orca = (NativeORCARunner if args.native else ORCARunner)(args.threshold, scratch=args.scratch, local=args.local)
 
     print("[I] Running ORCA", end='...')
     result = orca.run(args.input_pt)
@@ -1,46 +1,58 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from pathlib import Path
-
-import torch
 import numpy as np
-import networkx as nx
 
-from .toolbox import Composer, AdjacencyMatrixMaker, CoordLoader
+from . import cliques
+from .toolbox import load, Composer, ContactGraphMaker, ContactRunner, stack_results
+from .trajectory import CliqueTracker, frame_changes
+from .cache import file_digest
 
-class CliqueRunner(object):
-    """Runs GRAFENE, computes normorderd 3-4 graphlet degree vectors"""
-    def __init__(self, threshold=6):
+class CliqueRunner(ContactRunner):
+    """Computes the distribution of clique sizes 2..K of a contact graph"""
+    def __init__(self, threshold=6, K=8, maximal=True, scratch=None):
+        """
+        args:
+            :threshold (float) - contact map threshold
+            :K (int) - largest clique size reported
+            :maximal (bool) - count maximal cliques (sizes above K are dropped), otherwise every k-clique
+            :scratch - unused, accepted like the other runners (no external binaries are run)
+        """
         self.threshold = threshold
-        self.as_adjmat  = Composer(torch.load,
-                                   CoordLoader(silent_if_square=True),
-                                   AdjacencyMatrixMaker(self.threshold, selfloop=False))
+        self.K = K
+        self.maximal = maximal
+        self.as_adjmat  = Composer(load,
+                                   ContactGraphMaker(self.threshold, selfloop=False))
+
+    @property
+    def version(self):
+        return f"{file_digest(cliques.__file__, __file__)}-{'maximal' if self.maximal else 'all'}{self.K}"
 
-    def clique_counts(self, clique_sizes, K=8):
+    def clique_counts(self, adj):
         # Distribution of cliques from size 2 to K
-        min_clique_size = 2 # index offset
-        counts = np.zeros(K - 1, dtype=np.int)
-        for sz in clique_sizes:
-            if sz <= K:
-                counts[ sz - min_clique_size ] += 1
-    
-        return counts
+        if self.maximal:
+            return self.binned(cliques.maximal_clique_sizes(adj, K=self.K + 1))
+        return cliques.clique_counts(adj, K=self.K)[2:]
+
+    def binned(self, sizes):
+        """
+        Sizes 2..K of a maximal clique histogram up to K + 1, whose last entry collects every size
+        above K (not reported). Isolated residues (maximal cliques of size 1) are counted in the
+        last bin, as the networkx-based counts (`counts[sz - 2]` of sz = 1) always did.
+        """
+        raw = sizes[2:-1].copy()
+        raw[-1] += sizes[1]
+        return raw
         
-    def run(self, filename):
+    def count(self, adj, stem):
         """
-        Count clique sizes
+        Count clique sizes of a sparse adjacency
         """
-        stem = Path(filename).stem
+        with self.stage('count'):
+            raw = self.clique_counts(adj)
+        return self.summarize(raw, stem)
 
-        adj = self.as_adjmat(filename)
-
-        G = nx.from_numpy_matrix( adj.numpy() )
-
-        cliques = list(nx.find_cliques(G))
-        clique_sizes = [len(c) for c in cliques]
-
-        raw = self.clique_counts(clique_sizes)
+    def summarize(self, raw, stem):
         normed = raw / sum(raw)
 
         return dict(channels=['raw', 'normed'],
@@ -48,6 +60,19 @@ class CliqueRunner(object):
                     protein=stem,
                     )
 
+    def count_frames(self, graphs, stem):
+        """
+        Clique sizes of every frame of a trajectory, updated from the contacts that change between
+        frames (see trajectory.py)
+        """
+        tracker = CliqueTracker(K=self.K + 1 if self.maximal else self.K, maximal=self.maximal)
+        results = []
+        for adj, changes in zip(graphs, frame_changes(graphs)):
+            with self.stage('count'):
+                counts = tracker(adj, changes)
+            results.append(self.summarize(self.binned(counts) if self.maximal else counts[2:], stem))
+        return dict(stack_results(results), frames=np.arange(len(graphs)), protein=stem)
+
 if __name__ == '__main__':
     pass
 
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from . import descriptors
+from .toolbox import load, Composer, ContactGraphMaker, ContactRunner
+from .cache import file_digest
+
+class DescriptorRunner(ContactRunner):
+    """Computes the network descriptors of GRAFENE's avg-*/max-*/network-density/component binaries"""
+    def __init__(self, threshold=6, scratch=None):
+        """
+        args:
+            :threshold (float) - contact map threshold
+            :scratch - unused, accepted like the other runners (no external binaries are run)
+        """
+        self.threshold = threshold
+        self.as_adjmat  = Composer(load,
+                                   ContactGraphMaker(self.threshold, selfloop=False))
+
+    @property
+    def version(self):
+        return file_digest(descriptors.__file__, __file__)
+
+    def count(self, adj, stem):
+        """
+        Descriptors of a sparse adjacency, in the order of `features`; the channel isn't `raw`,
+        which reduced stores hold as integer counts
+        """
+        with self.stage('count'):
+            values = descriptors.network_descriptors(adj)
+
+        return dict(channels=['descriptors'],
+                    mat=values[None, ...],
+                    features=descriptors.FEATURES,
+                    protein=stem,
+                    )
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+In-process replacement for GRAFENE's network descriptor binaries (`bin/avg-clusc`, `avg-degree`,
+`avg-closec`, `avg-diameter`, `max-diameter`, `max-distance`, `network-density`, `component`),
+computed together from one sparse adjacency instead of one LEDA / shortest-path file and process
+per descriptor.
+
+Degrees come from the CSR row pointers, triangles per node from (A @ A) * A, and components from
+scipy's connected_components. Distances are found by breadth-first search from many sources at
+once: the frontiers of a batch of sources are the columns of a dense matrix F, and one level is
+F <- (A @ F) & ~seen, so each level is a single sparse-dense product. Per-source distance sums,
+reachable counts and the largest distance are accumulated level by level; no distance matrix is
+kept.
+
+The values follow the binaries (checked with `python -m graphlet_helper.descriptors listfile
+input_dir -t T`):
+    avg-clusc        mean over all nodes of 2 t / (d (d - 1)), 0 for d < 2
+    avg-degree       2 E / N
+    avg-closec       mean over non-isolated nodes of 1 / (sum of distances to the nodes they reach)
+    avg-diameter     mean distance over the reachable (ordered) pairs
+    max-diameter     largest distance / C(n, 2), n the number of non-isolated nodes
+    max-distance     largest distance
+    network-density  2 E / (N (N - 1))
+    component        N, E, nodes and edges of the largest component, number of components
+                     (isolated nodes included)
+"""
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+FEATURES = ['avg-clusc', 'avg-degree', 'avg-closec', 'avg-diameter', 'max-diameter', 'max-distance',
+            'network-density', 'nodes', 'edges', 'component-nodes', 'component-edges', 'components']
+
+def as_csr(adjmat):
+    """Binary, symmetric float32 CSR adjacency without self loops"""
+    A = sp.csr_matrix(adjmat, dtype=bool)
+    A = (A + A.T).tocsr()
+    A.setdiag(False)
+    A.eliminate_zeros()
+    return A.astype(np.float32)
+
+def triangles(A):
+    """Triangles each node is in"""
+    return np.asarray((A @ A).multiply(A).sum(axis=1)).ravel().astype(np.int64) // 2
+
+def distance_sums(A, batch=512):
+    """
+    Breadth-first search from every node, `batch` sources at a time
+    returns:
+        :(sums, reached, largest) - per node the sum of distances to and the number of the other
+         nodes it reaches, and the largest distance of the graph
+    """
+    n = A.shape[0]
+    sums, reached, largest = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64), 0
+    for start in range(0, n, batch):
+        sources = np.arange(start, min(n, start + batch))
+        seen = np.zeros((n, sources.shape[0]), dtype=bool)
+        seen[sources, np.arange(sources.shape[0])] = True
+        frontier, depth = seen.astype(np.float32), 0
+        while True:
+            frontier = (A @ frontier > 0) & ~seen
+            found = frontier.sum(axis=0)
+            if not found.any():
+                break
+            depth += 1
+            seen |= frontier
+            sums[sources] += depth * found
+            reached[sources] += found
+            frontier = frontier.astype(np.float32)
+        largest = max(largest, depth)
+    return sums, reached, largest
+
+def network_descriptors(adjmat, batch=512):
+    """
+    Descriptors of a contact graph, in the order of FEATURES
+    args:
+        :adjmat (array-like or scipy.sparse matrix) - N x N adjacency
+        :batch (int) - BFS sources per sparse-dense product
+    returns:
+        :np.ndarray (12,) float64
+    """
+    A = as_csr(adjmat)
+    n = A.shape[0]
+    degree = np.diff(A.indptr).astype(np.int64)
+    edges = int(degree.sum()) // 2
+
+    pairs = degree * (degree - 1)
+    clustering = np.divide(2 * triangles(A), pairs, out=np.zeros(n), where=pairs > 0)
+
+    count, labels = connected_components(A, directed=False)
+    largest_component = np.bincount(labels).argmax() if n else 0
+    component_nodes = int((labels == largest_component).sum())
+    component_edges = int(degree[labels == largest_component].sum()) // 2
+
+    sums, reached, largest = distance_sums(A, batch)
+    connected = reached > 0
+    sources = int(connected.sum())
+    closeness = (1 / sums[connected]).mean() if sources else 0.
+    mean_distance = sums.sum() / reached.sum() if sources else 0.
+    normalized_diameter = largest / (sources * (sources - 1) / 2) if sources > 1 else 0.
+
+    return np.array([clustering.mean() if n else 0., 2 * edges / n if n else 0., closeness, mean_distance,
+                     normalized_diameter, largest, 2 * edges / (n * (n - 1)) if n > 1 else 0.,
+                     n, edges, component_nodes, component_edges, count], dtype=np.float64)
+
+def binary_descriptors(adjmat, timeout=600.):
+    """
+    The same descriptors from GRAFENE's binaries, which network_descriptors reproduces
+    args:
+        :timeout (float) - seconds a binary may take
+    returns:
+        :np.ndarray (12,) float64
+    """
+    import tempfile
+    import subprocess
+    from pathlib import Path
+
+    from .compute_grafene_features import write_leda, BIN
+
+    def run(binary, filename):
+        return subprocess.run([BIN / binary, filename], capture_output=True, text=True, check=True,
+                              timeout=timeout).stdout.split()
+
+    A = as_csr(adjmat)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        leda, ndump, shpath = (Path(tmpdir) / name for name in ("graph.gw", "graph.ndump2", "graph.shpath"))
+        write_leda(A, leda)
+        # bin/sh_path and bin/ncount are 32-bit builds: their outputs are written here instead
+        # (all reachable ordered pairs; node degree and triangles)
+        degree = np.diff(A.indptr)
+        np.savetxt(ndump, np.column_stack([np.arange(A.shape[0]), degree, triangles(A)]), fmt='%d')
+        with open(shpath, 'w') as f:
+            for source in range(A.shape[0]):
+                distances = sp.csgraph.shortest_path(A, unweighted=True, indices=source)
+                for target in np.flatnonzero(np.isfinite(distances)):
+                    if target != source:
+                        print(f"[{source}]({source}) [{target}]({target}) {int(distances[target])}", file=f)
+        expected = [run('avg-clusc', ndump), run('avg-degree', leda), run('avg-closec', shpath),
+                    run('avg-diameter', shpath), run('max-diameter', shpath), run('max-distance', shpath),
+                    run('network-density', leda), run('component', leda)[1:]]
+    return np.array([float(value) for values in expected for value in values])
+
+if __name__ == '__main__':
+    import argparse
+    from pathlib import Path
+
+    from .toolbox import ContactGraphMaker, load, listfile
+
+    parser = argparse.ArgumentParser(description="Check native network descriptors against GRAFENE's binaries")
+    parser.add_argument("listfile", type=Path, help="List of IDs")
+    parser.add_argument("input_dir", type=Path, help="Directory to look for IDs (.pt / .npy)")
+    parser.add_argument("-t", "--threshold", dest="threshold", type=float, default=6.)
+    parser.add_argument("--timeout", type=float, default=600., help="Seconds a binary may take on one graph")
+    args = parser.parse_args()
+
+    maker = ContactGraphMaker(args.threshold, selfloop=False)
+
+    mismatches = 0
+    for ID in listfile.read(args.listfile):
+        infile = next(args.input_dir / f"{ID}{suffix}" for suffix in ('.npy', '.pt')
+                      if (args.input_dir / f"{ID}{suffix}").exists())
+        A = as_csr(maker(load(infile)))
+        same = np.allclose(binary_descriptors(A, args.timeout), network_descriptors(A), rtol=1e-5, atol=1e-6)
+        mismatches += not same
+        print(f"{ID}\t{A.shape[0]}\t{A.nnz // 2}\t{'ok' if same else 'MISMATCH'}")
+
+    print(f"{mismatches} mismatches")
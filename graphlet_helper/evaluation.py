@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+PR / ROC evaluation of all-pairs similarity results, in bounded memory
+
+Replaces `pr-roc-from-allpair-distance`, which parses a text line per pair and sorts all of them.
+Here a pair is positive when both proteins carry the same class label (as the binary's two label
+columns being equal), and scores are not sorted but counted into a fixed number of bins
+(separately for positive and negative pairs) while the result is read in row chunks, so memory
+depends on the chunk and bin counts only. Cumulating the bins from the closest end gives
+TP / FP at every bin edge, hence the curves and their areas; pairs whose scores share a bin count
+as tied, which with the default 2^16 bins changes the areas in the 4th decimal at most.
+
+Results are graphlet_helper.similarity outputs:
+    - dense matrix: every unordered pair of labelled proteins (upper triangle)
+    - top-k tables: every (protein, neighbour) pair kept; curves stop at the k-th neighbour
+      (recall < 1), so their areas are partial
+Several results over the same proteins are evaluated in one pass over the rows.
+"""
+
+import numpy as np
+
+HEADER = ('threshold', 'TP', 'FP', 'TN', 'FN', 'Recall', 'Precision', 'TP rate', 'FP rate',
+          'F-score', 'Accuracy')
+
+# score ranges known in advance; other metrics take a pass over the result to find theirs
+BOUNDS = {'cosine': (-1., 1.)}
+
+def load_labels(filename):
+    """
+    Class labels of proteins, one `protein label` pair per line (blank and # lines skipped)
+    returns:
+        :dict protein -> label
+    """
+    labels = {}
+    with open(filename, 'r') as fRead:
+        for line in fRead:
+            fields = line.split()
+            if fields and not fields[0].startswith('#'):
+                labels[fields[0]] = fields[1]
+    return labels
+
+def area(x, y):
+    """Trapezoidal area under the points (x, y)"""
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    return float(np.sum(np.diff(x) * (y[1:] + y[:-1]) / 2))
+
+class PairHistogram(object):
+    """
+    Counts of positive and negative pairs per score bin, closest bin last
+    """
+    def __init__(self, lo, hi, bins=2**16):
+        """
+        args:
+            :lo, hi (float) - range of the scores (higher is closer); scores outside are clipped
+            :bins (int) - number of bins
+        """
+        self.lo, self.hi, self.bins = float(lo), float(hi), bins
+        self.scale = bins / (self.hi - self.lo) if self.hi > self.lo else 0.
+        self.counts = np.zeros((bins, 2), dtype=np.int64)
+
+    def add(self, scores, same):
+        """
+        args:
+            :scores (array) - pair scores, higher is closer
+            :same (bool array) - whether each pair is positive
+        """
+        index = np.clip(((scores - self.lo) * self.scale).astype(np.int64), 0, self.bins - 1)
+        self.counts += np.bincount(2 * index + same, minlength=2 * self.bins).reshape(self.bins, 2)
+
+    def curve(self, positives, negatives):
+        """
+        args:
+            :positives, negatives (int) - totals, including pairs the histogram never saw
+        returns:
+            :dict of HEADER columns, one entry per non-empty bin, closest first; `threshold` is
+             the bin's lower edge, pairs scoring above it are called positive
+        """
+        counts = self.counts[::-1]
+        filled = counts.sum(axis=1) > 0
+        TP, FP = np.cumsum(counts[:, 1])[filled], np.cumsum(counts[:, 0])[filled]
+        edges = self.lo + (self.bins - 1 - np.arange(self.bins))[filled] / self.scale if self.scale else \
+            np.full(filled.sum(), self.lo)
+        FN, TN = positives - TP, negatives - FP
+        recall = TP / max(positives, 1)
+        precision = TP / np.maximum(TP + FP, 1)
+        fscore = np.divide(2 * precision * recall, precision + recall,
+                           out=np.zeros_like(recall), where=precision + recall > 0)
+        return dict(zip(HEADER, (edges, TP, FP, TN, FN, recall, precision, recall,
+                                 FP / max(negatives, 1), fscore, (TP + TN) / max(positives + negatives, 1))))
+
+def aucs(curve):
+    """
+    returns:
+        :(AUPR, AUROC) of a curve, from (recall 0, precision 1) and (FP rate 0, TP rate 0) on
+    """
+    return (area(np.r_[0., curve['Recall']], np.r_[1., curve['Precision']]),
+            area(np.r_[0., curve['FP rate']], np.r_[0., curve['TP rate']]))
+
+def write_curve(curve, filename, sign=1):
+    """Writes a curve as a tab-separated table like the binary's, thresholds in the result's units"""
+    table = np.column_stack([sign * curve['threshold']] + [curve[name] for name in HEADER[1:]])
+    np.savetxt(filename, table, fmt=['%g'] + ['%d'] * 4 + ['%g'] * 6, delimiter='\t',
+               header='\t'.join(HEADER), comments='')
+
+class Evaluation(object):
+    """
+    PR / ROC curves of one or more results of graphlet_helper.similarity.load_similarity
+    """
+    def __init__(self, results, labels, bins=2**16, chunk=2**22):
+        """
+        args:
+            :results (list of dict) - loaded results, all over the same proteins
+            :labels (dict) - protein -> class; unlabelled proteins are left out
+            :bins (int) - score bins per result
+            :chunk (int) - matrix entries read per step
+        """
+        proteins = results[0]['proteins']
+        if any(list(result['proteins']) != list(proteins) for result in results[1:]):
+            raise ValueError("Results to evaluate together must share their proteins")
+        self.results = results
+        self.bins = bins
+        self.chunk = chunk
+        classes = {label: code for code, label in enumerate(sorted(set(labels.values())))}
+        self.codes = np.array([classes.get(labels.get(protein), -1) for protein in proteins], dtype=np.int64)
+        self.labelled = self.codes >= 0
+
+    @property
+    def N(self):
+        return self.codes.shape[0]
+
+    @staticmethod
+    def sign(result):
+        return 1 if result['closer_is_larger'] else -1
+
+    def row_chunks(self, width):
+        step = max(1, self.chunk // max(width, 1))
+        return [slice(start, min(start + step, self.N)) for start in range(0, self.N, step)]
+
+    def totals(self, result):
+        """(positives, negatives): unordered labelled pairs for a matrix, ordered ones for top-k"""
+        sizes = np.bincount(self.codes[self.labelled])
+        n = int(self.labelled.sum())
+        positives, pairs = int(np.sum(sizes * (sizes - 1))), n * (n - 1)
+        if 'matrix' in result:
+            positives, pairs = positives // 2, pairs // 2
+        return positives, pairs - positives
+
+    def matrix_pairs(self, rows):
+        """
+        Pairs of `rows` in a dense matrix: row i pairs with columns j > i, so only the columns
+        from rows.start on are read
+        returns:
+            :(valid (rows, N - rows.start) bool, same-class labels of the valid entries)
+        """
+        columns = np.arange(rows.start, self.N)
+        valid = (columns[None, :] > np.arange(rows.start, rows.stop)[:, None]) & \
+            self.labelled[None, rows.start:] & self.labelled[rows, None]
+        return valid, (self.codes[rows, None] == self.codes[None, rows.start:])[valid]
+
+    def pairs(self, result, rows, matrix_pairs=None):
+        """
+        Scores (higher is closer) and labels of the pairs of `rows` in a result
+        args:
+            :matrix_pairs - matrix_pairs(rows), shared by the dense results of a pass
+        returns:
+            :(scores, same)
+        """
+        if 'matrix' in result:
+            valid, same = matrix_pairs or self.matrix_pairs(rows)
+            scores = np.asarray(result['matrix'][rows, rows.start:])[valid]
+        else:
+            neighbours = np.asarray(result['indices'][rows])
+            valid = self.labelled[neighbours] & self.labelled[rows, None]
+            scores = np.asarray(result['values'][rows])[valid]
+            same = (self.codes[rows, None] == self.codes[neighbours])[valid]
+        return self.sign(result) * scores.astype(np.float64), same
+
+    def bounds(self, result):
+        """Range of a result's scores (higher is closer), from BOUNDS or a pass over the result"""
+        if result.get('metric') in BOUNDS:
+            return BOUNDS[result['metric']] if self.sign(result) > 0 else \
+                tuple(-bound for bound in BOUNDS[result['metric']][::-1])
+        values = result['matrix'] if 'matrix' in result else result['values']
+        lo, hi = np.inf, -np.inf
+        for rows in self.row_chunks(values.shape[1]):
+            block = self.sign(result) * np.asarray(values[rows], dtype=np.float64)
+            block = block[np.isfinite(block)]
+            if block.size:
+                lo, hi = min(lo, block.min()), max(hi, block.max())
+        return (lo, hi) if lo <= hi else (0., 0.)
+
+    def __call__(self):
+        """
+        returns:
+            :list of curves (see PairHistogram.curve), one per result
+        """
+        histograms = [PairHistogram(*self.bounds(result), bins=self.bins) for result in self.results]
+        width = max(result['matrix'].shape[1] if 'matrix' in result else result['indices'].shape[1]
+                    for result in self.results)
+        dense = any('matrix' in result for result in self.results)
+        for rows in self.row_chunks(width):
+            shared = self.matrix_pairs(rows) if dense else None
+            for result, histogram in zip(self.results, histograms):
+                scores, same = self.pairs(result, rows, shared)
+                finite = np.isfinite(scores)
+                histogram.add(scores[finite], same[finite])
+        return [histogram.curve(*self.totals(result)) for result, histogram in zip(self.results, histograms)]
+
+if __name__ == '__main__':
+    pass
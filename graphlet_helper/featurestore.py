@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Append-only shards of fixed-width feature rows, one shard per worker
+
+A shard is a .npy file of structured rows, one per protein:
+    protein             - the ID as ASCII bytes of fixed width
+    <channel>           - the `mat` features of one channel, (thresholds, d) or (d,), in the dtype
+                          of a reduced store (reduced.channel_dtype); `<mode>/<channel>` for the
+                          results of several modes
+    <key>_mat           - any other per-protein matrix of the result (e.g. orca-sampled's `ci_mat`,
+                          `{mode}_ci_mat`), whole and in its own dtype
+While it is written the shard is `rows_<name>.part`, whose header (padded like reduced.py's)
+says 0 rows; each row is appended and flushed as it comes, so the complete rows of a killed
+worker are still read, counted from the file size. `close` writes the row count into the header,
+appends a footer holding the result's other fields (channels, features, thresholds, ...) and
+renames the shard to `rows_<name>.npy`, so a .npy shard is always whole; a .part whose header
+has a row count was killed while being sealed, and its rows are those the header counts.
+
+Reading is a memory map per shard, and a channel of a shard is one block of rows: reduce_graphlets.py
+--rows fills a reduced store shard by shard without decoding any per-protein file.
+"""
+
+import os
+import json
+import time
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from .reduced import channel_dtype, grow_npy, _npy_header
+
+FOOTER_MAGIC = b'ROWSMETA'
+
+def is_mat(key):
+    return key == 'mat' or key.endswith('_mat')
+
+def mat_keys(result):
+    """{mat key: (channels key, field prefix)} of a result, `{mode}_mat` for each mode of several"""
+    if 'modes' in result:
+        return {f"{mode}_mat": (f"{mode}_channels", f"{mode}/") for mode in result['modes']}
+    return {'mat': ('channels', '')}
+
+def extra_mats(result):
+    """Per-protein matrices of a result other than the channels' `mat`, kept whole as fields"""
+    return [key for key in result if is_mat(key) and key not in mat_keys(result)]
+
+def row_dtype(result, id_bytes=64):
+    """Structured dtype of a result's row: its ID, one field per channel of every mode and the other matrices"""
+    fields = [('protein', f'S{id_bytes}')]
+    for key, (channels, prefix) in mat_keys(result).items():
+        *shape, _, d = np.shape(result[key])
+        for channel in result[channels]:
+            fields.append((f"{prefix}{channel}", channel_dtype(channel), (*shape, d)))
+    for key in extra_mats(result):
+        values = np.asarray(result[key])
+        fields.append((key, values.dtype, values.shape))
+    return np.dtype(fields)
+
+def header_bytes(dtype):
+    """Header size of a shard of `dtype`, with room for any row count, in 64 byte blocks"""
+    return -(-len(_npy_header(dtype, (2**63 - 1,), 0)) // 64) * 64
+
+def as_row(result, dtype):
+    """A result as a row of `dtype`; raises ValueError if it doesn't fit"""
+    row = np.zeros((), dtype=dtype)
+    protein = str(result['protein']).encode('ascii')
+    if len(protein) > dtype['protein'].itemsize:
+        raise ValueError(f"ID {result['protein']} is longer than {dtype['protein'].itemsize} bytes")
+    row['protein'] = protein
+    filled = ['protein']
+    for key, (channels, prefix) in mat_keys(result).items():
+        mat = np.asarray(result[key])
+        for c, channel in enumerate(result[channels]):
+            field, values = f"{prefix}{channel}", mat[..., c, :]
+            if field not in dtype.names or values.shape != dtype[field].shape:
+                raise ValueError(f"{key} channel {channel} of {result['protein']} doesn't fit the shard's rows")
+            row[field] = np.rint(values) if np.issubdtype(dtype[field].base, np.integer) else values
+            filled.append(field)
+    for key in extra_mats(result):
+        values = np.asarray(result[key])
+        if key not in dtype.names or values.shape != dtype[key].shape:
+            raise ValueError(f"{key} of {result['protein']} doesn't fit the shard's rows")
+        row[key] = values
+        filled.append(key)
+    if sorted(filled) != sorted(dtype.names):
+        raise ValueError(f"channels of {result['protein']} differ from the shard's rows")
+    return row
+
+class RowShardWriter(object):
+    """
+    One worker's shard: results are appended as rows as they come, and sealed by `close`
+    """
+    def __init__(self, directory, name=None, id_bytes=64):
+        """
+        args:
+            :directory (Path) - where the shard goes
+            :name (str) - shard name, `{pid}_{time}` by default so that the workers of any run differ
+            :id_bytes (int) - width of the ID field
+        """
+        self.directory = Path(directory)
+        self.name = name or f"{os.getpid()}_{time.time_ns()}"
+        self.id_bytes = id_bytes
+        self.file = None
+        self.dtype = None
+        self.meta = None
+        self.count = 0
+
+    @property
+    def part(self):
+        return self.directory / f"rows_{self.name}.part"
+
+    @property
+    def path(self):
+        return self.directory / f"rows_{self.name}.npy"
+
+    def _open(self, result):
+        self.dtype = row_dtype(result, self.id_bytes)
+        self.meta = {key: np.asarray(value).tolist() for key, value in result.items()
+                     if key != 'protein' and not is_mat(key)}
+        # unbuffered, so that every row reaches the file as soon as it is added
+        self.file = open(self.part, 'xb', buffering=0)
+        self.file.write(_npy_header(self.dtype, (0,), header_bytes(self.dtype)))
+
+    def add(self, result):
+        """Appends a runner result (dict of channels, mat and protein) as one row"""
+        if self.file is None:
+            self._open(result)
+        data = memoryview(as_row(result, self.dtype).tobytes())
+        offset = self.file.tell()
+        try:
+            while data:
+                data = data[self.file.write(data):]
+        except BaseException:
+            # never leave half a row for the next one to be misaligned by
+            self.file.truncate(offset)
+            self.file.seek(offset)
+            raise
+        self.count += 1
+
+    def close(self):
+        """
+        Seals the shard: row count, footer, rename
+        returns:
+            :path of the shard, None if nothing was added
+        """
+        if self.file is None:
+            return None
+        self.file.close()
+        self.file = None
+        grow_npy(self.part, self.dtype, (self.count,), header_bytes(self.dtype))
+        footer = json.dumps(self.meta).encode()
+        with open(self.part, 'ab') as f:
+            f.write(footer + struct.pack('<Q', len(footer)) + FOOTER_MAGIC)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.part, self.path)
+        return self.path
+
+def shard_files(directory):
+    """Sealed shards and those left open by killed workers, in name order"""
+    return sorted([*Path(directory).glob("rows_*.npy"), *Path(directory).glob("rows_*.part")])
+
+def read_rows(path):
+    """
+    returns:
+        :(rows, meta) - memory-mapped structured rows (only the complete ones of a .part) and the
+         footer's fields ({} for a .part)
+    """
+    path = Path(path)
+    with open(path, 'rb') as f:
+        np.lib.format.read_magic(f)
+        shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        offset = f.tell()
+        size = f.seek(0, os.SEEK_END)
+        meta = {}
+        if path.suffix == '.part':
+            # a row count in the header: killed while sealing, with a footer that isn't rows after them
+            count = (size - offset) // dtype.itemsize
+            count = min(count, shape[0]) if shape[0] else count
+        else:
+            count = shape[0]
+            f.seek(size - 16)
+            length, magic = struct.unpack('<Q8s', f.read(16))
+            if magic == FOOTER_MAGIC:
+                f.seek(size - 16 - length)
+                meta = json.loads(f.read(length))
+    rows = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,)) if count \
+        else np.zeros(0, dtype=dtype)
+    return rows, meta
+
+def channels(dtype, mode=None):
+    """{field: channel} of a shard's rows, of one mode if it holds several"""
+    prefix = '' if mode is None else f"{mode}/"
+    return {name: name[len(prefix):] for name in dtype.names
+            if name != 'protein' and not is_mat(name) and name.startswith(prefix) and '/' not in name[len(prefix):]}
+
+def matrices(dtype, mode=None):
+    """{field: key} of the other per-protein matrices of a shard's rows (`ci_mat`), of one mode if it holds several"""
+    prefix = '' if mode is None else f"{mode}_"
+    return {name: name[len(prefix):] for name in dtype.names if is_mat(name) and name.startswith(prefix)}
+
+class RowShards(object):
+    """
+    Read access to the shards of a directory, with an index of where each ID's (first) row is
+    """
+    def __init__(self, directory):
+        self.paths = shard_files(directory)
+        self.shards = [read_rows(path)[0] for path in self.paths]
+        self.index = {}
+        for i, rows in enumerate(self.shards):
+            for j, protein in enumerate(rows['protein'].astype(str)):
+                self.index.setdefault(protein, (i, j))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, protein):
+        return protein in self.index
+
+    @property
+    def proteins(self):
+        return list(self.index)
+
+    def __getitem__(self, protein):
+        return self.result(protein)
+
+    def result(self, protein, mode=None):
+        """
+        A protein's row (of one mode, for shards of several) as a result: dict of channels, mat,
+        the other matrices (e.g. ci_mat) and protein
+        """
+        i, j = self.index[protein]
+        fields = channels(self.shards[i].dtype, mode)
+        if not fields:
+            raise KeyError(f"no channels of mode {mode} in {self.paths[i]}")
+        row = self.shards[i][j]
+        return dict(channels=list(fields.values()),
+                    mat=np.stack([row[field] for field in fields], axis=-2),
+                    **{key: np.array(row[field]) for field, key in matrices(self.shards[i].dtype, mode).items()},
+                    protein=protein)
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Compare row shards with one savez_compressed file per protein")
+    parser.add_argument("--proteins", type=int, default=20000)
+    parser.add_argument("--features", type=int, default=73)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = [dict(channels=['raw', 'norm'], features=list(range(args.features)), protein=f"{i:07d}A00",
+                    mat=np.stack([counts, counts / max(counts.sum(), 1)]))
+               for i, counts in enumerate(rng.integers(0, 10**6, (args.proteins, args.features)).astype(np.float64))]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        (tmpdir / "npz").mkdir()
+        start = time.perf_counter()
+        for result in results:
+            np.savez_compressed(tmpdir / "npz" / f"{result['protein']}.npz", **result)
+        npz_write = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = [np.load(tmpdir / "npz" / f"{result['protein']}.npz")['mat'] for result in results]
+        npz_read = time.perf_counter() - start
+
+        start = time.perf_counter()
+        writer = RowShardWriter(tmpdir)
+        for result in results:
+            writer.add(result)
+        writer.close()
+        rows_write = time.perf_counter() - start
+        start = time.perf_counter()
+        rows, meta = read_rows(writer.path)
+        mat = np.stack([rows[field] for field in channels(rows.dtype)], axis=1)
+        rows_read = time.perf_counter() - start
+
+        same = np.array_equal(np.stack(expected).astype(np.float32), mat.astype(np.float32)) and \
+            rows['protein'].astype(str).tolist() == [result['protein'] for result in results]
+        print(f"{args.proteins} proteins: npz write {npz_write:.2f}s read {npz_read:.2f}s, "
+              f"rows write {rows_write:.2f}s read {rows_read:.3f}s, {'identical' if same else 'DIFFERENT'}")
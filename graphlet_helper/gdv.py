@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per-residue graphlet degree vectors (node x 73 orbit counts) kept next to the global counts
+
+The orca runners normally collapse the node x 73 orbit matrix into 30 global counts; with
+`local=True` they also keep it as `gdv`, (nodes, 73) uint32, or (thresholds, nodes, 73) for a
+sweep (`{mode}_gdv` in multi-mode files). Contact graphs leave 70-95% of the entries non-zero,
+so a sparse layout saves nothing over the dense uint32 matrix once the npz is compressed, while
+the dense one stacks along the threshold axis like `mat`. Readers only need NumPy (`load_gdv`).
+"""
+
+import numpy as np
+
+def compact(node_gdv):
+    """(nodes, orbits) counts as uint32, which holds the orbit counts of any contact graph"""
+    node_gdv = np.asarray(node_gdv)
+    if node_gdv.size and node_gdv.max() > np.iinfo(np.uint32).max:
+        raise OverflowError(f"orbit count {node_gdv.max()} doesn't fit uint32")
+    return node_gdv.astype(np.uint32)
+
+def load_gdv(npz, mode=None):
+    """
+    Per-residue orbit counts saved by count_graphlets.py / batch_graphlets.py with --local
+    args:
+        :mode (str) - the mode to read from a multi-mode file
+    returns:
+        :uint32 array (nodes, 73), or (thresholds, nodes, 73)
+    """
+    key = 'gdv' if mode is None else f"{mode}_gdv"
+    with np.load(npz) as data:
+        if key not in data.files:
+            raise KeyError(f"{npz} holds no per-residue counts{'' if mode is None else ' of ' + mode} "
+                           f"(count with --local)")
+        return data[key]
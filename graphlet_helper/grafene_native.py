@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+In-process replacement for GRAFENE's `ncount-ordered` + `normalize-graphlets`: counts of the
+42 ordered graphlets on 3 and 4 nodes (NormOrderedGraphlet-3-4), computed directly from a sparse
+adjacency matrix.
+
+An ordered graphlet is a connected induced subgraph together with the order of its nodes along
+the chain, i.e. by residue index. Connected 3- and 4-sets are enumerated once each with the
+level-wise NumPy enumeration of orca_native; every set's induced adjacency is then repacked
+with its nodes in ascending id order and looked up in a table of the 42 ordered graphlets,
+numbered as by `ncount-ordered` (the numbering was read off the binary).
+
+`normalize-graphlets` divides every number of the count file, the graphlet ids included, by
+their total; `normalize` reproduces that (at full rather than 6 digit precision).
+"""
+
+import functools
+import itertools
+
+import numpy as np
+
+from .orca_native import Adjacency, extend, pair_bit, _chunks
+
+# ncount-ordered's graphlet id -> edges between the node positions in ascending id order
+ORDERED_GRAPHLETS = {
+    1: ((0, 1), (1, 2)),
+    2: ((0, 2), (1, 2)),
+    3: ((0, 1), (0, 2)),
+    4: ((0, 1), (0, 2), (1, 2)),
+    5: ((0, 1), (1, 2), (2, 3)),
+    6: ((0, 1), (1, 3), (2, 3)),
+    7: ((0, 2), (1, 2), (1, 3)),
+    8: ((0, 2), (1, 3), (2, 3)),
+    9: ((0, 3), (1, 2), (1, 3)),
+    10: ((0, 3), (1, 2), (2, 3)),
+    11: ((0, 1), (0, 2), (2, 3)),
+    12: ((0, 1), (0, 3), (2, 3)),
+    13: ((0, 2), (0, 3), (1, 2)),
+    14: ((0, 1), (0, 2), (1, 3)),
+    15: ((0, 2), (0, 3), (1, 3)),
+    16: ((0, 1), (0, 3), (1, 2)),
+    17: ((0, 1), (0, 2), (0, 3)),
+    18: ((0, 1), (1, 2), (1, 3)),
+    19: ((0, 2), (1, 2), (2, 3)),
+    20: ((0, 3), (1, 3), (2, 3)),
+    21: ((0, 1), (0, 3), (1, 2), (2, 3)),
+    22: ((0, 2), (0, 3), (1, 2), (1, 3)),
+    23: ((0, 1), (0, 2), (1, 3), (2, 3)),
+    24: ((0, 1), (1, 2), (1, 3), (2, 3)),
+    25: ((0, 2), (1, 2), (1, 3), (2, 3)),
+    26: ((0, 3), (1, 2), (1, 3), (2, 3)),
+    27: ((0, 1), (0, 2), (0, 3), (2, 3)),
+    28: ((0, 2), (0, 3), (1, 2), (2, 3)),
+    29: ((0, 2), (0, 3), (1, 3), (2, 3)),
+    30: ((0, 1), (0, 2), (0, 3), (1, 3)),
+    31: ((0, 1), (0, 3), (1, 2), (1, 3)),
+    32: ((0, 1), (0, 3), (1, 3), (2, 3)),
+    33: ((0, 1), (0, 2), (0, 3), (1, 2)),
+    34: ((0, 1), (0, 2), (1, 2), (1, 3)),
+    35: ((0, 1), (0, 2), (1, 2), (2, 3)),
+    36: ((0, 1), (0, 2), (0, 3), (1, 2), (1, 3)),
+    37: ((0, 1), (0, 2), (0, 3), (1, 2), (2, 3)),
+    38: ((0, 1), (0, 2), (0, 3), (1, 3), (2, 3)),
+    39: ((0, 1), (0, 2), (1, 2), (1, 3), (2, 3)),
+    40: ((0, 1), (0, 3), (1, 2), (1, 3), (2, 3)),
+    41: ((0, 2), (0, 3), (1, 2), (1, 3), (2, 3)),
+    42: ((0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3)),
+}
+NUM_ORDERED = len(ORDERED_GRAPHLETS)
+
+@functools.lru_cache(maxsize=None)
+def ordered_table(k):
+    """(2 ** (k choose 2),) table mapping a packed mask in ascending id order to a 0-based graphlet id"""
+    table = np.full(1 << (k * (k - 1) // 2), -1, dtype=np.int16)
+    for graphlet, edges in ORDERED_GRAPHLETS.items():
+        if max(map(max, edges)) + 1 == k:
+            table[sum(1 << pair_bit(a, b) for a, b in edges)] = graphlet - 1
+    return table
+
+def sorted_masks(sets, masks):
+    """
+    Repacks masks of k-sets given in insertion order so that position p is the p-th smallest id
+    """
+    k = sets.shape[1]
+    order = np.argsort(sets, axis=1)
+    sorted_masks = np.zeros_like(masks)
+    for p, q in itertools.combinations(range(k), 2):
+        a, b = order[:, p], order[:, q]
+        bit = np.maximum(a, b) * (np.maximum(a, b) - 1) // 2 + np.minimum(a, b)
+        sorted_masks |= ((masks >> bit) & 1) << pair_bit(p, q)
+    return sorted_masks
+
+def ordered_counts(adjmat):
+    """
+    Ordered 3-4 node graphlet counts, identical to the output of `ncount-ordered`
+    args:
+        :adjmat (array-like or scipy.sparse matrix) - N x N adjacency, node ids in residue order
+    returns:
+        :np.ndarray (42,) int64, entry i is the count of graphlet i + 1
+    """
+    graph = Adjacency(adjmat)
+    counts = np.zeros(NUM_ORDERED, dtype=np.int64)
+
+    def descend(sets, masks):
+        if sets.shape[1] > 2:
+            counts[:] += np.bincount(ordered_table(sets.shape[1])[sorted_masks(sets, masks)],
+                                     minlength=NUM_ORDERED)
+        if sets.shape[1] == 4 or sets.shape[0] == 0:
+            return
+        for chunk in _chunks(graph, sets):
+            descend(*extend(graph, sets[chunk], masks[chunk]))
+
+    edges = graph.edges()
+    descend(edges, np.ones(edges.shape[0], dtype=np.int64))
+    return counts
+
+def normalize(counts):
+    """
+    `normalize-graphlets` applied to a count file: (id, count) pairs divided by the sum of both columns
+    returns:
+        :np.ndarray (84,) of interleaved id / total, count / total
+    """
+    ids = np.arange(1, counts.shape[0] + 1)
+    pairs = np.column_stack([ids, counts]).astype(np.float64)
+    return (pairs / pairs.sum()).ravel()
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+    import subprocess
+    from pathlib import Path
+
+    import torch
+
+    from .toolbox import Composer, ContactGraphMaker, listfile
+    from .compute_grafene_features import write_leda, BIN
+
+    parser = argparse.ArgumentParser(description="Check native ordered graphlet counts against GRAFENE")
+    parser.add_argument("listfile", type=Path, help="List of IDs")
+    parser.add_argument("input_dir", type=Path, help="Directory to look for IDs")
+    parser.add_argument("-t", "--threshold", dest="threshold", type=float, default=6.)
+    parser.add_argument("--timeout", type=float, default=600., help="Seconds a binary may take on one graph")
+    args = parser.parse_args()
+
+    as_adjmat = Composer(torch.load, ContactGraphMaker(args.threshold, selfloop=False))
+
+    mismatches = 0
+    for ID in listfile.read(args.listfile):
+        adjmat = as_adjmat(args.input_dir / f"{ID}.pt")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ledafile, countfile, normfile = (Path(tmpdir) / name for name in ("graph.gw", "graph.ogf", "graph.norm"))
+            write_leda(adjmat, ledafile)
+            subprocess.run([BIN / 'ncount-ordered', ledafile, countfile], stdout=subprocess.DEVNULL,
+                           timeout=args.timeout, check=True)
+            subprocess.run([BIN / 'normalize-graphlets', countfile, normfile], stdout=subprocess.DEVNULL,
+                           timeout=args.timeout, check=True)
+            expected = np.loadtxt(countfile, ndmin=2)[:, 1].astype(np.int64)
+            expected_norm = np.loadtxt(normfile)
+
+        counts = ordered_counts(adjmat)
+        same = np.array_equal(expected, counts) and np.allclose(expected_norm, normalize(counts), rtol=1e-5, atol=1e-9)
+        mismatches += not same
+        print(f"{ID}\t{adjmat.shape[0]}\t{adjmat.nnz // 2}\t{'ok' if same else 'MISMATCH'}")
+
+    print(f"{mismatches} mismatches")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Record of which proteins of a graphlet campaign are done, failed, or still to do
+
+A manifest is a tab separated, append-only log of `ID mode threshold status attempts seconds
+error` lines, one per attempt; the last line of a key (ID, mode, threshold) is its state. Lines
+are short single writes in append mode, so several disBatch tasks can share one manifest, and
+a run killed halfway leaves every finished protein recorded. Batch runs skip `done` keys and
+retry `failed` (and `missing`: no input file) ones until they used up their attempts.
+
+`python -m graphlet_helper.manifest manifest.tsv` summarizes a manifest.
+"""
+
+import time
+import signal
+from pathlib import Path
+from contextlib import contextmanager
+
+DONE = 'done'
+FAILED = 'failed'
+MISSING = 'missing'
+
+class Entry(object):
+    """State of one key: last status, attempts so far, seconds and error of the last attempt"""
+    __slots__ = ('status', 'attempts', 'seconds', 'error')
+
+    def __init__(self, status, attempts, seconds, error=''):
+        self.status = status
+        self.attempts = attempts
+        self.seconds = seconds
+        self.error = error
+
+def _clean(text):
+    return ' '.join(str(text).split())
+
+class Manifest(object):
+    """
+    Per-(ID, mode, threshold) status log of a campaign
+    """
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        self.entries = {}
+        if self.filename.exists():
+            with open(self.filename, 'r') as fRead:
+                for line in fRead:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) < 6:
+                        # a line cut short by a killed writer
+                        continue
+                    ID, mode, threshold, status, attempts, seconds = fields[:6]
+                    self.entries[ID, mode, threshold] = Entry(status, int(attempts), float(seconds),
+                                                              fields[6] if len(fields) > 6 else '')
+
+    @staticmethod
+    def key(ID, mode, threshold):
+        """
+        args:
+            :mode (str or list) - mode or modes
+            :threshold (float or list) - threshold, or the thresholds of a sweep
+        """
+        mode = ','.join(mode) if isinstance(mode, (list, tuple)) else str(mode)
+        threshold = ','.join(map(str, map(float, threshold))) if isinstance(threshold, (list, tuple)) \
+            else str(float(threshold))
+        return str(ID), mode, threshold
+
+    def get(self, ID, mode, threshold):
+        return self.entries.get(self.key(ID, mode, threshold))
+
+    def done(self, ID, mode, threshold):
+        entry = self.get(ID, mode, threshold)
+        return entry is not None and entry.status == DONE
+
+    def pending(self, IDs, mode, threshold, attempts=3):
+        """
+        returns:
+            :IDs neither done nor failed `attempts` times already, in the given order, once each
+        """
+        todo = []
+        for ID in dict.fromkeys(IDs):
+            entry = self.get(ID, mode, threshold)
+            if entry is None or (entry.status != DONE and entry.attempts < attempts):
+                todo.append(ID)
+        return todo
+
+    def record(self, ID, mode, threshold, status, seconds=0., error=''):
+        """Appends the outcome of one attempt and returns the key's new Entry"""
+        key = self.key(ID, mode, threshold)
+        previous = self.entries.get(key)
+        entry = Entry(status, (previous.attempts if previous is not None else 0) + 1, seconds, _clean(error))
+        self.entries[key] = entry
+        with open(self.filename, 'a') as fWrite:
+            print(*key, entry.status, entry.attempts, f"{entry.seconds:.3f}", entry.error, sep='\t', file=fWrite)
+        return entry
+
+    def summary(self):
+        """
+        returns:
+            :dict status -> number of keys
+        """
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry.status] = counts.get(entry.status, 0) + 1
+        return counts
+
+    def mean_seconds(self):
+        """Mean time of the proteins done so far, None if there are none"""
+        seconds = [entry.seconds for entry in self.entries.values() if entry.status == DONE]
+        return sum(seconds) / len(seconds) if seconds else None
+
+class Progress(object):
+    """Counts finished tasks and estimates the time left from the rate so far"""
+    def __init__(self, total):
+        self.total = total
+        self.finished = 0
+        self.failed = 0
+        self._start = time.perf_counter()
+
+    def update(self, failed=False):
+        self.finished += 1
+        self.failed += bool(failed)
+
+    @property
+    def eta(self):
+        """Seconds left at the current rate, None before the first task finished"""
+        if not self.finished:
+            return None
+        elapsed = time.perf_counter() - self._start
+        return elapsed / self.finished * (self.total - self.finished)
+
+    def __str__(self):
+        eta = self.eta
+        eta = '?' if eta is None else time.strftime('%H:%M:%S', time.gmtime(eta)) if eta < 86400 else \
+            f"{eta / 86400:.1f} days"
+        return f"{self.finished}/{self.total} done, {self.failed} failed, ETA {eta}"
+
+@contextmanager
+def time_limit(seconds):
+    """
+    Raises TimeoutError in the enclosed block after `seconds` (None: no limit). Uses SIGALRM, so
+    it works in the main thread of a process only (toolbox.MultiRunner passes it on to the threads
+    of its modes). It takes effect at the next Python step, i.e. once the NumPy call under way
+    returns; subprocess.run kills its child on the way out.
+    """
+    if not seconds:
+        yield
+        return
+
+    def expire(signum, frame):
+        raise TimeoutError(f"exceeded {seconds:g}s")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize a graphlet manifest")
+    parser.add_argument("manifest", type=Path)
+    parser.add_argument("--failed", action='store_true', help="List the keys not done and their last error")
+    args = parser.parse_args()
+
+    manifest = Manifest(args.manifest)
+    print(', '.join(f"{count} {status}" for status, count in sorted(manifest.summary().items())))
+    mean = manifest.mean_seconds()
+    if mean is not None:
+        print(f"{mean:.2f}s per protein done")
+    if args.failed:
+        for (ID, mode, threshold), entry in manifest.entries.items():
+            if entry.status != DONE:
+                print(ID, mode, threshold, entry.status, entry.attempts, entry.error, sep='\t')
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per-protein, per-stage timings of the runner pipelines, written as JSON lines
+
+A record looks like
+    {"protein": ..., "mode": ..., "seconds": {"load": ..., "graph": ..., "subprocess": ...},
+     "calls": {...}, "graphs": [{"threshold": ..., "nodes": ..., "edges": ...}],
+     "peak_rss_mb": {stage: ...}, "total": ...}
+Peak RSS is the process high-water mark (getrusage) as of the end of each stage, so it only
+grows within a worker; memory of the external binaries is not included.
+
+`python -m graphlet_helper.metrics metrics.jsonl` summarizes a metrics file.
+"""
+
+import json
+import time
+import resource
+import functools
+from contextlib import contextmanager
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Metrics(object):
+    """Collects one record per protein between `begin` and `end`"""
+    def __init__(self, filename=None):
+        """
+        args:
+            :filename (str or Path) - JSON-lines file records are appended to by `write`
+        """
+        self.filename = filename
+        self.current = None
+
+    def begin(self, protein, **info):
+        self.current = dict(protein=str(protein), **info, seconds={}, calls={}, graphs=[], peak_rss_mb={})
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Times the enclosed block as (one more call of) stage `name`"""
+        if self.current is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = self.current
+            record['seconds'][name] = record['seconds'].get(name, 0.) + time.perf_counter() - start
+            record['calls'][name] = record['calls'].get(name, 0) + 1
+            record['peak_rss_mb'][name] = _peak_rss_mb()
+
+    def timed(self, fn, name=None):
+        """Wraps a callable (e.g. a Composer stage) so each call is timed as a stage"""
+        name = name or getattr(fn, 'stage', None) or getattr(fn, '__name__', type(fn).__name__)
+
+        @functools.wraps(fn)
+        def h(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return h
+
+    def graph(self, adjmat, threshold):
+        """Notes the size of a contact graph that is about to be counted (once, if several modes count it)"""
+        if self.current is not None:
+            graph = dict(threshold=float(threshold), nodes=int(adjmat.shape[0]), edges=int(adjmat.nnz // 2))
+            if graph not in self.current['graphs']:
+                self.current['graphs'].append(graph)
+
+    def end(self, **info):
+        """
+        returns:
+            :the finished record (None if none was begun)
+        """
+        record, self.current = self.current, None
+        if record is not None:
+            record.update(info, total=time.perf_counter() - self._start)
+        return record
+
+    def write(self, record):
+        with open(self.filename, 'a') as fWrite:
+            print(json.dumps(record), file=fWrite)
+
+def read_metrics(filename):
+    with open(filename, 'r') as fRead:
+        return [json.loads(line) for line in fRead if line.strip()]
+
+if __name__ == '__main__':
+    import argparse
+
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description="Summarize a metrics file")
+    parser.add_argument("metrics", help="JSON-lines metrics file")
+    parser.add_argument("-n", "--outliers", type=int, default=10, help="Slowest proteins to list")
+    args = parser.parse_args()
+
+    records = read_metrics(args.metrics)
+    total = np.array([record['total'] for record in records])
+    stages = sorted({name for record in records for name in record['seconds']})
+
+    print(f"{len(records)} proteins, {total.sum():.1f}s total")
+    print(f"{'stage':<12}{'total s':>10}{'share':>8}{'mean':>10}{'p50':>10}{'p99':>10}{'max':>10}")
+    for name in stages:
+        seconds = np.array([record['seconds'].get(name, 0.) for record in records])
+        print(f"{name:<12}{seconds.sum():>10.2f}{seconds.sum() / total.sum():>8.1%}{seconds.mean():>10.4f}"
+              f"{np.median(seconds):>10.4f}{np.percentile(seconds, 99):>10.4f}{seconds.max():>10.4f}")
+
+    print(f"\nslowest {args.outliers}:")
+    for i in np.argsort(total)[::-1][:args.outliers]:
+        record = records[i]
+        edges = max((graph['edges'] for graph in record['graphs']), default=0)
+        nodes = max((graph['nodes'] for graph in record['graphs']), default=0)
+        print(f"{record['protein']:<16}{record['total']:>10.3f}s  {nodes} nodes  {edges} edges  "
+              f"peak {max(record['peak_rss_mb'].values(), default=0.):.0f} MiB")
@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+In-process replacement for `bin/orca.exe 5`: per-node orbit counts for graphlets of
+up to 5 nodes, computed directly from a sparse adjacency matrix.
+
+Connected induced subgraphs on 2..4 nodes are enumerated exactly once, level by level,
+with NumPy array operations:
+    1) a connected k-set T is extended by every neighbour v of T (each v is attached via its
+       first neighbour in T, so no (T, v) pair is produced twice)
+    2) T + {v} is kept only if v is the largest non-cut vertex of T + {v}; since removing
+       any non-cut vertex leaves a connected k-set, this picks exactly one parent per set
+    3) the induced adjacency of each set is packed into a bitmask and looked up in
+       precomputed (mask, position) -> orbit tables built from the reference graphlets below
+
+5-node orbits are not enumerated. As in ORCA, they follow from combinatorial counts over the
+4-node sets: for every 4-set T and every non-empty P within T, the number of outside nodes whose
+neighbourhood in T is exactly P comes from common-neighbour counts (bitset popcounts) by
+inclusion-exclusion, and T + {w} is then classified from (mask(T), P). Each 5-node graphlet is
+reached once per non-cut vertex w, so every orbit is divided by that (orbit-specific) multiplicity.
+
+Orbit numbering follows ORCA (Hočevar & Demšar, 2014), so the output matches orca.exe
+column for column.
+"""
+
+import functools
+import itertools
+
+import numpy as np
+import scipy.sparse as sp
+
+NUM_ORBITS = 73
+MAX_NODES = 5
+
+# upper bound on the number of (set, neighbour) candidates materialized at once
+CHUNK_CANDIDATES = 1 << 22
+
+# (edge list, orbit of each node) for graphlets G0..G29
+GRAPHLETS = [
+    ([(0, 1)], (0, 0)),
+    ([(0, 1), (0, 2)], (2, 1, 1)),
+    ([(0, 1), (0, 2), (1, 2)], (3, 3, 3)),
+    ([(0, 1), (1, 2), (0, 3)], (5, 5, 4, 4)),
+    ([(0, 1), (0, 2), (0, 3)], (7, 6, 6, 6)),
+    ([(0, 2), (1, 2), (0, 3), (1, 3)], (8, 8, 8, 8)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3)], (11, 10, 10, 9)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3), (1, 3)], (13, 13, 12, 12)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3), (1, 3), (2, 3)], (14, 14, 14, 14)),
+    ([(0, 2), (1, 2), (1, 3), (0, 4)], (16, 16, 17, 15, 15)),
+    ([(0, 1), (1, 2), (0, 3), (0, 4)], (21, 20, 18, 19, 19)),
+    ([(0, 1), (0, 2), (0, 3), (0, 4)], (23, 22, 22, 22, 22)),
+    ([(0, 1), (0, 2), (1, 2), (1, 3), (0, 4)], (26, 26, 25, 24, 24)),
+    ([(0, 1), (1, 2), (1, 3), (2, 3), (0, 4)], (28, 30, 29, 29, 27)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3), (0, 4)], (33, 32, 32, 31, 31)),
+    ([(1, 2), (0, 3), (2, 3), (0, 4), (1, 4)], (34, 34, 34, 34, 34)),
+    ([(0, 2), (1, 2), (0, 3), (1, 3), (0, 4)], (38, 36, 37, 37, 35)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3), (1, 3), (0, 4)], (42, 41, 40, 40, 39)),
+    ([(0, 1), (0, 2), (0, 3), (2, 3), (0, 4), (1, 4)], (44, 43, 43, 43, 43)),
+    ([(0, 1), (0, 2), (1, 2), (1, 3), (2, 3), (0, 4)], (47, 48, 48, 46, 45)),
+    ([(0, 2), (1, 2), (0, 3), (1, 3), (0, 4), (1, 4)], (50, 50, 49, 49, 49)),
+    ([(0, 1), (1, 2), (0, 3), (2, 3), (0, 4), (1, 4)], (53, 53, 51, 51, 52)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3), (1, 3), (0, 4), (1, 4)], (55, 55, 54, 54, 54)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3), (1, 3), (2, 3), (0, 4)], (58, 57, 57, 57, 56)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3), (2, 3), (0, 4), (1, 4)], (61, 60, 60, 59, 59)),
+    ([(0, 2), (1, 2), (0, 3), (1, 3), (2, 3), (0, 4), (1, 4)], (63, 63, 64, 64, 62)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3), (1, 3), (2, 3), (0, 4), (1, 4)], (67, 67, 66, 66, 65)),
+    ([(0, 1), (0, 2), (0, 3), (1, 3), (2, 3), (0, 4), (1, 4), (2, 4)], (69, 68, 68, 68, 68)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3), (1, 3), (2, 3), (0, 4), (1, 4), (2, 4)], (71, 71, 71, 70, 70)),
+    ([(0, 1), (0, 2), (1, 2), (0, 3), (1, 3), (2, 3), (0, 4), (1, 4), (2, 4), (3, 4)], (72, 72, 72, 72, 72)),
+]
+
+# orbit -> graphlet weights: graphlet class x orbit, 1 where the orbit belongs to the class, and the
+# classes' node counts; a graphlet holds one node per position, so the column sums of a node x 73
+# orbit matrix times MEMBERSHIP.T count every graphlet SIZES times
+MEMBERSHIP = np.array([np.isin(np.arange(NUM_ORBITS), orbits) for _, orbits in GRAPHLETS], dtype=np.int64)
+SIZES = np.array([len(orbits) for _, orbits in GRAPHLETS], dtype=np.int64)
+
+def graphlet_counts(node_gdv):
+    """(30,) int64 global graphlet counts of a node x 73 orbit matrix, one product with MEMBERSHIP"""
+    return np.asarray(node_gdv, dtype=np.int64).sum(axis=0) @ MEMBERSHIP.T // SIZES
+
+def pair_bit(i, j):
+    """Bit holding edge (i, j) in a packed k-node adjacency mask; nodes added later get higher bits"""
+    i, j = min(i, j), max(i, j)
+    return j * (j - 1) // 2 + i
+
+@functools.lru_cache(maxsize=None)
+def orbit_table(k):
+    """
+    (2 ** (k choose 2), k) table mapping a packed adjacency mask to the orbit of each position,
+    -1 for disconnected masks
+    """
+    table = np.full((1 << (k * (k - 1) // 2), k), -1, dtype=np.int16)
+    for edges, orbits in GRAPHLETS:
+        if len(orbits) != k:
+            continue
+        for perm in itertools.permutations(range(k)):
+            mask = sum(1 << pair_bit(perm[a], perm[b]) for a, b in edges)
+            for node, orbit in enumerate(orbits):
+                table[mask, perm[node]] = orbit
+    return table
+
+@functools.lru_cache(maxsize=None)
+def noncut_table(k):
+    """(2 ** (k choose 2),) table of bitmasks flagging positions whose removal keeps the mask connected"""
+    table = np.zeros(1 << (k * (k - 1) // 2), dtype=np.uint8)
+    connected = orbit_table(k - 1)[:, 0] >= 0 if k > 2 else np.ones(1, dtype=bool)
+    for mask in np.flatnonzero(orbit_table(k)[:, 0] >= 0):
+        for p in range(k):
+            rest = [q for q in range(k) if q != p]
+            sub = 0
+            for (a, qa), (b, qb) in itertools.combinations(enumerate(rest), 2):
+                if mask >> pair_bit(qa, qb) & 1:
+                    sub |= 1 << pair_bit(a, b)
+            if connected[sub]:
+                table[mask] |= 1 << p
+    return table
+
+def as_csr(adjmat):
+    """Binary, symmetric CSR adjacency without self loops"""
+    A = sp.csr_matrix(adjmat, dtype=bool)
+    A = (A + A.T).tocsr()
+    A.setdiag(False)
+    A.eliminate_zeros()
+    A.sort_indices()
+    return A
+
+class PairLookup(object):
+    """Vectorized entry lookup in a sparse N x N matrix; dense table for small graphs, sorted keys otherwise"""
+    def __init__(self, matrix, dense_limit=1 << 24):
+        matrix = sp.csr_matrix(matrix)
+        matrix.sort_indices()
+        self.n = n = matrix.shape[0]
+        if n * n <= dense_limit:
+            self._dense = matrix.toarray()
+        else:
+            self._dense = None
+            rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(matrix.indptr))
+            self._keys = np.append(rows * n + matrix.indices, -1)
+            self._values = np.append(matrix.data, np.zeros(1, dtype=matrix.dtype))
+
+    def __call__(self, u, v):
+        if self._dense is not None:
+            return self._dense[u, v]
+        keys = u.astype(np.int64) * self.n + v
+        pos = np.searchsorted(self._keys[:-1], keys)
+        pos[self._keys[pos] != keys] = -1
+        return self._values[pos]
+
+def ball(csr, roots, hops):
+    """Sorted nodes within `hops` of any of the roots of a CSR adjacency"""
+    seen = np.zeros(csr.shape[0], dtype=bool)
+    seen[roots] = True
+    frontier = np.asarray(roots)
+    for _ in range(hops):
+        reached = csr[frontier].indices
+        frontier = np.unique(reached[~seen[reached]])
+        if frontier.shape[0] == 0:
+            break
+        seen[frontier] = True
+    return np.flatnonzero(seen)
+
+class Adjacency(object):
+    """Binary CSR adjacency with the vectorized lookups used during enumeration"""
+    def __init__(self, adjmat):
+        self.csr = csr = as_csr(adjmat)
+        self.n = csr.shape[0]
+        self.degree = np.diff(csr.indptr)
+        self.keys = np.repeat(np.arange(self.n, dtype=np.int64), self.degree) * self.n + csr.indices
+        self.has_edge = PairLookup(csr)
+
+    def neighbours(self, x, above=None):
+        """
+        Flattened neighbour lists of the nodes in x, with the index into x each one came from
+        args:
+            :x (np.ndarray) - node ids
+            :above (np.ndarray) - if given, only neighbours with a larger id than above[i] are listed
+        """
+        if above is None:
+            starts = self.csr.indptr[x]
+        else:
+            starts = np.searchsorted(self.keys, x * self.n + above, side='right')
+        deg = self.csr.indptr[x + 1] - starts
+        src = np.repeat(np.arange(x.shape[0]), deg)
+        offsets = np.arange(src.shape[0]) - np.repeat(np.cumsum(deg) - deg, deg)
+        return src, self.csr.indices[np.repeat(starts, deg) + offsets]
+
+    def edges(self):
+        """(E, 2) array of edges (u < v)"""
+        upper = sp.triu(self.csr, k=1).tocoo()
+        return np.column_stack([upper.row, upper.col]).astype(np.int64)
+
+def extend(graph, sets, masks):
+    """
+    Grows connected k-sets by one node, returning each connected (k+1)-set exactly once
+    args:
+        :graph (Adjacency) - the graph
+        :sets (np.ndarray) - (m, k) node ids, in insertion order
+        :masks (np.ndarray) - (m,) packed induced adjacency of each set
+    returns:
+        :(sets, masks) for the (k+1)-sets
+    """
+    k = sets.shape[1]
+    noncut = noncut_table(k + 1)
+
+    # at least one of the two largest non-cut vertices of T stays non-cut in T + {v},
+    # so v has to exceed the smaller of the two
+    flagged = (noncut_table(k)[masks][:, None] >> np.arange(k, dtype=np.uint8)) & 1 == 1
+    lower = np.sort(np.where(flagged, sets, -1), axis=1)[:, -2]
+
+    grown, grown_masks = [], []
+    for j in range(k):
+        row, v = graph.neighbours(sets[:, j], above=lower)
+        members = sets[row]
+        keep = np.ones(row.shape[0], dtype=bool)
+        bits = np.full(row.shape[0], 1 << pair_bit(j, k), dtype=masks.dtype)
+        for i in range(k):
+            if i == j:
+                continue
+            keep &= members[:, i] != v
+            linked = graph.has_edge(members[:, i], v)
+            if i < j:
+                keep &= ~linked  # v is attached through its first neighbour only
+            else:
+                bits |= linked.astype(masks.dtype) << pair_bit(i, k)
+        row, v, members, bits = row[keep], v[keep], members[keep], bits[keep]
+        new_masks = masks[row] | bits
+        # keep v only when it is the largest non-cut vertex of the new set
+        cut = noncut[new_masks]
+        for i in range(k):
+            keep = ((cut >> i) & 1 == 0) | (members[:, i] < v)
+            members, v, new_masks, cut = members[keep], v[keep], new_masks[keep], cut[keep]
+        grown.append(np.column_stack([members, v]))
+        grown_masks.append(new_masks)
+    return np.concatenate(grown), np.concatenate(grown_masks)
+
+def _chunks(graph, sets):
+    """Splits the rows of `sets` so that no chunk expands into more than CHUNK_CANDIDATES pairs"""
+    cost = graph.degree[sets].sum(axis=1).cumsum()
+    bounds = np.searchsorted(cost, np.arange(CHUNK_CANDIDATES, cost[-1], CHUNK_CANDIDATES))
+    return np.split(np.arange(sets.shape[0]), np.unique(bounds))
+
+@functools.lru_cache(maxsize=None)
+def five_node_tables():
+    """
+    Tables used to classify T + {w} from a 4-set mask and the neighbourhood P of w in T
+    returns:
+        :connected (64,) - row of each connected 4-node mask in `orbit_map`, -1 otherwise
+        :inside (64, 16) - number of members of T adjacent to every member of P
+        :moebius (16, 16) - exact-neighbourhood counts from at-least counts, exact = atleast @ moebius
+        :orbit_map (C * 4 * 15, 73) - one-hot (connected mask, position in T, P) -> orbit in T + {w}
+        :multiplicity (73,) - non-cut vertices of the orbit's graphlet other than the orbit's node
+    """
+    table5 = orbit_table(5)
+    masks = np.flatnonzero(orbit_table(4)[:, 0] >= 0)
+    connected = np.full(64, -1, dtype=np.int64)
+    connected[masks] = np.arange(masks.shape[0])
+
+    inside = np.zeros((64, 16))
+    orbit_map = np.zeros((masks.shape[0], 4, 15, NUM_ORBITS))
+    for mask in range(64):
+        for P in range(1, 16):
+            inside[mask, P] = sum(all(mask >> pair_bit(t, q) & 1 for q in range(4) if P >> q & 1)
+                                  for t in range(4) if not P >> t & 1)
+            if connected[mask] >= 0:
+                extra = sum(1 << pair_bit(i, 4) for i in range(4) if P >> i & 1)
+                for x, orbit in enumerate(table5[mask | extra, :4]):
+                    orbit_map[connected[mask], x, P - 1, orbit] = 1
+
+    moebius = np.zeros((16, 16))
+    for Q, P in itertools.product(range(1, 16), repeat=2):
+        if Q & P == P:
+            moebius[Q, P] = (-1) ** (bin(Q).count('1') - bin(P).count('1'))
+
+    multiplicity = np.ones(NUM_ORBITS)
+    for edges, graphlet_orbits in GRAPHLETS:
+        if len(graphlet_orbits) != 5:
+            continue
+        noncut = noncut_table(5)[sum(1 << pair_bit(a, b) for a, b in edges)]
+        for node, orbit in enumerate(graphlet_orbits):
+            multiplicity[orbit] = bin(noncut).count('1') - (noncut >> node & 1)
+    return connected, inside, moebius, orbit_map.reshape(-1, NUM_ORBITS), multiplicity
+
+def bitset_columns(csr):
+    """(ceil(N / 64), N) uint64 neighbourhood bitsets, one column per node"""
+    n = csr.shape[0]
+    words = np.zeros((max(1, -(-n // 64)), n), dtype=np.uint64)
+    nodes = np.repeat(np.arange(n), np.diff(csr.indptr))
+    cols = csr.indices.astype(np.uint64)
+    np.bitwise_or.at(words, (cols >> np.uint64(6), nodes), np.uint64(1) << (cols & np.uint64(63)))
+    return words
+
+_BYTE_POPCOUNT = np.array([bin(b).count('1') for b in range(256)], dtype=np.uint8)
+
+def popcount(words):
+    """Number of set bits in each column of a (words, m) uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=0, dtype=np.int64)
+    return _BYTE_POPCOUNT[words.view(np.uint8)].reshape(words.shape[0], -1, 8).sum(axis=(0, 2), dtype=np.int64)
+
+class FiveNodeCounter(object):
+    """Accumulates multiplicity-weighted 5-node orbit counts from batches of connected 4-sets"""
+    def __init__(self, graph):
+        self.n = graph.n
+        self.degree = graph.degree
+        self.bits = bitset_columns(graph.csr)
+        csr = graph.csr.astype(np.int64)
+        self.common = PairLookup(csr @ csr)
+        self.totals = np.zeros((self.n, NUM_ORBITS))
+
+    @property
+    def batch_size(self):
+        """4-sets per batch, keeping the (m, 64 * words) bitset intersections bounded"""
+        return max(1, CHUNK_CANDIDATES // (8 * self.bits.shape[0] + 128))
+
+    def add(self, sets, masks):
+        """
+        args:
+            :sets (np.ndarray) - (m, 4) connected 4-sets
+            :masks (np.ndarray) - (m,) their packed adjacency
+        """
+        connected, inside, moebius, orbit_map, _ = five_node_tables()
+        m = sets.shape[0]
+
+        # atleast[Q] = number of nodes adjacent to every member of Q
+        rows = [self.bits[:, sets[:, i]] for i in range(4)]
+        common = {}
+        atleast = np.zeros((16, m))
+        for Q in range(1, 16):
+            members = [i for i in range(4) if Q >> i & 1]
+            if len(members) == 1:
+                atleast[Q] = self.degree[sets[:, members[0]]]
+            elif len(members) == 2:
+                atleast[Q] = self.common(sets[:, members[0]], sets[:, members[1]])
+                if members[0] > 0:
+                    common[Q] = rows[members[0]] & rows[members[1]]
+            else:
+                common[Q] = common[Q & (Q - 1)] & rows[members[0]]
+                atleast[Q] = popcount(common[Q])
+        exact = (moebius.T @ (atleast - inside[masks].T))[1:].T
+
+        # sum the exact counts per (node, mask, position), then map (mask, position, P) to orbits
+        touched = np.zeros(self.n, dtype=bool)
+        touched[sets] = True
+        nodes = np.flatnonzero(touched)
+        local = (np.cumsum(touched) - 1)[sets]
+        width = orbit_map.shape[0] // 15
+        keys = (local * (width // 4) + connected[masks][:, None]) * 4 + np.arange(4)
+        scatter = sp.csc_matrix((np.ones(4 * m), keys.ravel(), np.arange(0, 4 * m + 1, 4)),
+                                shape=(nodes.shape[0] * width, m))
+        per_node = (scatter @ exact).reshape(nodes.shape[0], -1)
+        self.totals[nodes] += per_node @ orbit_map
+
+    def counts(self):
+        """(N, 73) int64 5-node orbit counts"""
+        return np.rint(self.totals / five_node_tables()[-1]).astype(np.int64)
+
+def count_orbits(graph, edges, max_nodes=MAX_NODES):
+    """
+    Orbit counts credited by the connected sets grown from `edges`: every connected set whose
+    lowest-id node is the lower end of one of the edges is enumerated exactly once, since the
+    lowest-id node of a set is never its largest non-cut vertex and so is never removed on the
+    way down to the set's edge
+    args:
+        :graph (Adjacency) - the graph
+        :edges (np.ndarray) - (E, 2) starting edges (u < v)
+        :max_nodes (int) - largest graphlet size to count (2..5)
+    returns:
+        :np.ndarray (N, 73) int64 orbit counts; exact for every node that is the lowest id of
+         all the sets containing it, i.e. for all nodes when starting from all edges
+    """
+    n = graph.n
+    counts = np.zeros(n * NUM_ORBITS, dtype=np.int64)
+    five = FiveNodeCounter(graph) if max_nodes == 5 else None
+
+    def descend(sets, masks):
+        orbits = orbit_table(sets.shape[1])[masks]
+        counts[:] += np.bincount((sets * NUM_ORBITS + orbits).ravel(), minlength=n * NUM_ORBITS)
+        if sets.shape[1] == 4 and five is not None:
+            for start in range(0, sets.shape[0], five.batch_size):
+                batch = slice(start, start + five.batch_size)
+                five.add(sets[batch], masks[batch])
+            return
+        if sets.shape[1] == max_nodes or sets.shape[0] == 0:
+            return
+        for chunk in _chunks(graph, sets):
+            descend(*extend(graph, sets[chunk], masks[chunk]))
+
+    descend(edges, np.ones(edges.shape[0], dtype=np.int64))
+
+    counts = counts.reshape(n, NUM_ORBITS)
+    if five is not None:
+        counts += five.counts()
+    return counts
+
+def orbit_counts(adjmat, max_nodes=MAX_NODES):
+    """
+    Per-node orbit counts, identical to the output of `orca.exe node 5`
+    args:
+        :adjmat (array-like or scipy.sparse matrix) - N x N adjacency
+        :max_nodes (int) - largest graphlet size to count (2..5)
+    returns:
+        :np.ndarray (N, 73) int64 orbit counts; orbits of larger graphlets are left at 0
+    """
+    graph = Adjacency(adjmat)
+    return count_orbits(graph, graph.edges(), max_nodes)
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+    import subprocess
+    from pathlib import Path
+
+    import torch
+
+    from .toolbox import Composer, AdjacencyMatrixMaker, CoordLoader, listfile
+
+    parser = argparse.ArgumentParser(description="Check native orbit counts against orca.exe")
+    parser.add_argument("listfile", type=Path, help="List of IDs")
+    parser.add_argument("input_dir", type=Path, help="Directory to look for IDs")
+    parser.add_argument("-t", "--threshold", dest="threshold", type=float, default=6.)
+    parser.add_argument("--timeout", type=float, default=600., help="Seconds orca.exe may take on one graph")
+    args = parser.parse_args()
+
+    orca = Path(__file__).resolve().absolute().parent / "bin" / "orca.exe"
+    as_adjmat = Composer(torch.load,
+                         CoordLoader(silent_if_square=True),
+                         AdjacencyMatrixMaker(args.threshold, selfloop=False))
+
+    mismatches = 0
+    for ID in listfile.read(args.listfile):
+        graph = Adjacency(as_adjmat(args.input_dir / f"{ID}.pt").numpy())
+        edges = graph.edges()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            infile, outfile = Path(tmpdir) / "graph.in", Path(tmpdir) / "graph.out"
+            with open(infile, 'w') as f:
+                print(graph.n, edges.shape[0], file=f)
+                np.savetxt(f, edges, fmt='%d')
+            subprocess.run([orca, '5', infile, outfile], stdout=subprocess.DEVNULL, timeout=args.timeout, check=True)
+            expected = np.loadtxt(outfile, ndmin=2).astype(np.int64)
+
+        same = np.array_equal(expected, orbit_counts(graph.csr))
+        mismatches += not same
+        print(f"{ID}\t{graph.n}\t{edges.shape[0]}\t{'ok' if same else 'MISMATCH'}")
+
+    print(f"{mismatches} mismatches")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Approximate global graphlet counts (the 30 classes of ORCA's summary) from a sample of nodes
+
+A graphlet class's global count is the sum over nodes of the class's orbit counts, divided by
+its number of nodes, so it can be estimated from a uniform sample of nodes (without
+replacement): N x the sample mean / nodes, with a normal confidence interval from the sample
+variance and the finite population correction. Sampling stops at `samples` nodes or after
+`budget` seconds, whichever comes first.
+
+The orbit counts of a sampled node are exact. All graphlets containing a node lie within
+4 hops of it, so batches of sampled roots are counted on the subgraph induced by the union of
+their 4-hop balls, with the roots relabelled to the lowest ids and the enumeration of
+orca_native started from their edges only (see orca_native.count_orbits): the work per root is
+that of the graphlets it is in, not of the whole ball.
+"""
+
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+from .orca_native import GRAPHLETS, MAX_NODES, MEMBERSHIP, SIZES, Adjacency, ball, count_orbits, orbit_counts, \
+    graphlet_counts
+
+def participation(node_gdv):
+    """(n, 30) graphlets of each class every node is in, from its (n, 73) orbit counts"""
+    return node_gdv @ MEMBERSHIP.T
+
+def rooted_orbit_counts(graph, roots, max_nodes=MAX_NODES):
+    """
+    Exact orbit counts of some nodes only
+    args:
+        :graph (Adjacency) - the graph
+        :roots (np.ndarray) - distinct node ids
+    returns:
+        :np.ndarray (len(roots), 73) int64, rows as orbit_counts(graph)[roots]
+    """
+    roots = np.asarray(roots, dtype=np.int64)
+    around = ball(graph.csr, roots, max_nodes - 1)
+    order = np.concatenate([roots, np.setdiff1d(around, roots, assume_unique=True)])
+    sub = Adjacency(graph.csr[order][:, order])
+    edges = sub.edges()
+    return count_orbits(sub, edges[edges[:, 0] < roots.shape[0]], max_nodes)[:roots.shape[0]]
+
+class Estimate(object):
+    """Running sample of per-node graphlet participation and the estimates it gives"""
+    def __init__(self, n):
+        """
+        args:
+            :n (int) - number of nodes sampled from
+        """
+        self.n = n
+        self.rows = []
+
+    @property
+    def sampled(self):
+        return sum(rows.shape[0] for rows in self.rows)
+
+    def add(self, rows):
+        self.rows.append(rows)
+
+    def __call__(self, confidence=0.95):
+        """
+        returns:
+            :(counts, lower, upper) (30,) float estimates of the global counts and the bounds of
+             their `confidence` interval (exact, with lower = upper, when every node was sampled)
+        """
+        y = np.concatenate(self.rows).astype(np.float64)
+        m = y.shape[0]
+        counts = self.n * y.mean(axis=0) / SIZES
+        variance = y.var(axis=0, ddof=1) if m > 1 else np.zeros(y.shape[1])
+        error = self.n * np.sqrt(max(1 - m / self.n, 0) * variance / m) / SIZES
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        return counts, np.maximum(counts - z * error, 0), counts + z * error
+
+def sample_graphlets(adjmat, samples=2048, budget=None, confidence=0.95, seed=0, ball_limit=1 << 10):
+    """
+    Estimated global graphlet counts of a graph
+    args:
+        :adjmat (array-like or scipy.sparse matrix) - N x N adjacency
+        :samples (int) - nodes to sample at most; without a budget, graphs of at most this many
+         nodes are counted exactly
+        :budget (float) - seconds to sample for at most (at least one batch is counted)
+        :confidence (float) - level of the intervals
+        :seed (int) - seed of the node order
+        :ball_limit (int) - subgraph size above which a batch of roots is counted
+    returns:
+        :(counts, lower, upper, sampled nodes)
+    """
+    graph = Adjacency(adjmat)
+    n = graph.n
+    estimate = Estimate(n)
+    if n <= samples and budget is None:
+        estimate.add(participation(count_orbits(graph, graph.edges())))
+        return (*estimate(confidence), n)
+
+    start = time.perf_counter()
+    order = np.random.default_rng(seed).permutation(n)[:samples]
+    batch, covered = [], np.zeros(n, dtype=bool)
+    for i, root in enumerate(order):
+        batch.append(root)
+        covered[ball(graph.csr, [root], MAX_NODES - 1)] = True
+        if covered.sum() < ball_limit and i + 1 < order.shape[0]:
+            continue
+        estimate.add(participation(rooted_orbit_counts(graph, np.array(batch))))
+        batch, covered[:] = [], False
+        if budget is not None and time.perf_counter() - start > budget:
+            break
+    return (*estimate(confidence), estimate.sampled)
+
+if __name__ == '__main__':
+    import argparse
+    from pathlib import Path
+
+    from .toolbox import load, ContactGraphMaker
+
+    parser = argparse.ArgumentParser(description="Compare sampled graphlet counts with exact ones")
+    parser.add_argument("input", type=Path, help="Coordinate or distance map file (.pt / .npy)")
+    parser.add_argument("-t", "--threshold", type=float, default=10.)
+    parser.add_argument("--samples", type=int, default=2048)
+    parser.add_argument("--budget", type=float, default=None)
+    args = parser.parse_args()
+
+    adjmat = ContactGraphMaker(args.threshold, selfloop=False)(load(args.input))
+    start = time.perf_counter()
+    counts, lower, upper, sampled = sample_graphlets(adjmat, args.samples, args.budget)
+    sampled_time = time.perf_counter() - start
+    start = time.perf_counter()
+    exact = graphlet_counts(orbit_counts(adjmat))
+    exact_time = time.perf_counter() - start
+
+    print(f"{sampled} of {adjmat.shape[0]} nodes in {sampled_time:.2f}s, exact in {exact_time:.2f}s")
+    for g in range(len(GRAPHLETS)):
+        inside = lower[g] <= exact[g] <= upper[g]
+        print(f"G{g}\t{exact[g]}\t{counts[g]:.0f}\t[{lower[g]:.0f}, {upper[g]:.0f}]\t{'' if inside else 'outside'}")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Wire format of the graphlet server (graphlet_server.py / graphlet_client.py)
+
+A message is a JSON header followed by an opaque payload, each preceded by its length:
+    [4 byte header length][header JSON][8 byte payload length][payload]
+lengths big-endian. Requests carry the count parameters in the header and, optionally, an .npy
+coordinate / distance matrix as payload; responses carry the result npz as payload, so a client
+can write it out as it is. Standard library only, so clients start fast.
+"""
+
+import os
+import json
+import struct
+import socket
+import tempfile
+from pathlib import Path
+
+HEADER = struct.Struct(">I")
+PAYLOAD = struct.Struct(">Q")
+
+def default_socket():
+    """Per-user socket path, in $XDG_RUNTIME_DIR if set"""
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return Path(directory) / f"graphlets-{os.getuid()}.sock"
+
+def _recv_exactly(sock, n):
+    buffer = bytearray(n)
+    view = memoryview(buffer)
+    received = 0
+    while received < n:
+        k = sock.recv_into(view[received:], n - received)
+        if k == 0:
+            raise ConnectionError("connection closed mid-message")
+        received += k
+    return bytes(buffer)
+
+def send_message(sock, header, payload=b''):
+    header = json.dumps(header).encode()
+    sock.sendall(HEADER.pack(len(header)) + header + PAYLOAD.pack(len(payload)))
+    if payload:
+        sock.sendall(payload)
+
+def recv_message(sock):
+    """
+    returns:
+        :(header dict, payload bytes), or None if the peer closed the connection between messages
+    """
+    first = sock.recv(HEADER.size)
+    if not first:
+        return None
+    if len(first) < HEADER.size:
+        first += _recv_exactly(sock, HEADER.size - len(first))
+    header = json.loads(_recv_exactly(sock, HEADER.unpack(first)[0]))
+    size, = PAYLOAD.unpack(_recv_exactly(sock, PAYLOAD.size))
+    return header, _recv_exactly(sock, size) if size else b''
+
+def connect(path=None, timeout=None):
+    """Client socket connected to the server at `path` (default_socket() by default)"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(str(path or default_socket()))
+    return sock
+
+def request(header, payload=b'', path=None, sock=None, timeout=None):
+    """
+    Sends one request and waits for its response, on `sock` or on a new connection to `path`
+    returns:
+        :(header dict, payload bytes)
+    """
+    own = sock is None
+    if own:
+        sock = connect(path, timeout)
+    try:
+        send_message(sock, header, payload)
+        response = recv_message(sock)
+        if response is None:
+            raise ConnectionError("server closed the connection")
+        return response
+    finally:
+        if own:
+            sock.close()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+On-disk reduced feature matrix that can be filled out of core and appended to
+
+A store is a directory holding
+    proteins.txt, channels.txt   - row and channel labels (listfile format)
+    mask.npy                     - bool (N,), True where the protein's features were filled in
+    <channel>.npy                - (N, ...) features of one channel; `raw` counts as int64,
+                                   everything else as float32
+The .npy headers are written with room to spare so that appending rows only rewrites the header
+and extends the file, leaving the existing rows untouched. Arrays are opened memory-mapped.
+"""
+
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from .toolbox import listfile
+
+HEADER_BYTES = 256
+
+def channel_dtype(channel):
+    """Counts are stored as integers, everything else (normalized values) as float32"""
+    return np.dtype(np.int64) if channel == 'raw' else np.dtype(np.float32)
+
+def _npy_header(dtype, shape, header_bytes=HEADER_BYTES):
+    """Version 1.0 .npy header padded to `header_bytes`, so the row count can grow in place"""
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                   'shape': tuple(shape)})
+    header = header.ljust(header_bytes - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+def grow_npy(path, dtype, shape, header_bytes=HEADER_BYTES):
+    """(Re)sizes a C-ordered .npy file written by this module to `shape`, zero filling new rows"""
+    with open(path, 'r+b' if Path(path).exists() else 'w+b') as f:
+        f.write(_npy_header(dtype, shape, header_bytes))
+        f.truncate(header_bytes + int(np.prod(shape)) * dtype.itemsize)
+
+class ReducedStore(object):
+    """
+    Rows of per-protein features, one memory-mapped array per channel
+    """
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.proteins = listfile.read(self.directory / "proteins.txt")
+        self.channels = listfile.read(self.directory / "channels.txt")
+        self._open()
+
+    def _open(self):
+        self.mask = np.load(self.directory / "mask.npy", mmap_mode='r+')
+        self.mats = {channel: np.load(self.directory / f"{channel}.npy", mmap_mode='r+')
+                     for channel in self.channels}
+        self.row = {protein: i for i, protein in enumerate(self.proteins)}
+
+    @classmethod
+    def create(cls, directory, channels, shape):
+        """
+        Empty store for features of the given per-protein `shape` (all but the protein axis)
+        """
+        directory = Path(directory)
+        directory.mkdir(exist_ok=True, parents=True)
+        if (directory / "channels.txt").exists():
+            # replacing a store: drop the channels it had that the new one doesn't
+            for channel in set(listfile.read(directory / "channels.txt")) - set(channels):
+                (directory / f"{channel}.npy").unlink(missing_ok=True)
+        open(directory / "proteins.txt", 'w').close()
+        listfile.write(list(channels), directory / "channels.txt")
+        grow_npy(directory / "mask.npy", np.dtype(bool), (0,))
+        for channel in channels:
+            grow_npy(directory / f"{channel}.npy", channel_dtype(channel), (0, *shape))
+        return cls(directory)
+
+    @property
+    def shape(self):
+        """Per-protein feature shape"""
+        return self.mats[self.channels[0]].shape[1:]
+
+    def append(self, proteins):
+        """
+        Adds empty (masked) rows for new proteins without touching the existing ones
+        returns:
+            :row index of the first new protein
+        """
+        start = len(self.proteins)
+        N = start + len(proteins)
+        shape = self.shape
+        self.flush()
+        self.mask = self.mats = None
+
+        grow_npy(self.directory / "mask.npy", np.dtype(bool), (N,))
+        for channel in self.channels:
+            grow_npy(self.directory / f"{channel}.npy", channel_dtype(channel), (N, *shape))
+
+        self.proteins = self.proteins + list(proteins)
+        with open(self.directory / "proteins.txt", 'a') as f:
+            for protein in proteins:
+                print(protein, file=f)
+        self._open()
+        return start
+
+    def write(self, protein, mat):
+        """Fills a protein's row from a runner result `mat` of shape (..., channels, d)"""
+        i = self.row[protein]
+        for c, channel in enumerate(self.channels):
+            values = mat[..., c, :]
+            if np.issubdtype(channel_dtype(channel), np.integer):
+                values = np.rint(values)
+            self.mats[channel][i] = values
+        self.mask[i] = True
+
+    def write_rows(self, proteins, columns):
+        """
+        Fills the rows of several proteins at once, one block per channel
+        args:
+            :columns (dict) - {channel: (len(proteins), ...) values}, e.g. the fields of featurestore rows
+        """
+        rows = np.array([self.row[protein] for protein in proteins], dtype=np.int64)
+        for channel in self.channels:
+            self.mats[channel][rows] = columns[channel]
+        self.mask[rows] = True
+
+    def flush(self):
+        """Writes the memory-mapped arrays back to disk"""
+        if self.mats is None:
+            return
+        self.mask.flush()
+        for mat in self.mats.values():
+            mat.flush()
+
+    def to_npz(self, filename):
+        """The reduce_graphlets.py npz layout, `mat` of shape (channels, N, ...) as float64"""
+        mat = np.stack([self.mats[channel] for channel in self.channels]).astype(np.float64)
+        np.savez_compressed(filename, proteins=self.proteins, channels=self.channels,
+                            mat=mat, mask=np.asarray(self.mask))
+
+def load_reduced(directory):
+    """
+    Read-only view of a store, like np.load of a reduced npz but with a `mat` per channel
+    returns:
+        :dict with proteins, channels, mask and {channel: memory-mapped array}
+    """
+    directory = Path(directory)
+    channels = listfile.read(directory / "channels.txt")
+    return dict(proteins=listfile.read(directory / "proteins.txt"),
+                channels=channels,
+                mask=np.load(directory / "mask.npy", mmap_mode='r'),
+                **{channel: np.load(directory / f"{channel}.npy", mmap_mode='r') for channel in channels})
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Cheap per-protein cost estimates and longest-first packing of graphlet tasks
+
+Counting time grows with the number of residues and, faster, with contact density, so the
+estimate uses the edge count of the contact graph when it is known and falls back to the residue
+count read from the tensor's header otherwise. Edge counts are cached in a small index file so
+they only have to be computed once per (ID, threshold).
+"""
+
+import heapq
+from pathlib import Path
+
+import numpy as np
+
+from .toolbox import load, ContactGraphMaker
+
+def residue_count(filename):
+    """Number of residues in a coordinate or distance map file, without reading its data"""
+    if Path(filename).suffix == '.npy':
+        return np.load(filename, mmap_mode='r').shape[0]
+    import torch
+
+    try:
+        x = torch.load(filename, mmap=True)
+    except RuntimeError:
+        # legacy (non-zipfile) serialization can't be memory-mapped
+        x = torch.load(filename)
+    return x.shape[0]
+
+def task_cost(residues, edges=None):
+    """
+    Estimated counting cost of one protein, in arbitrary units
+    args:
+        :residues (int) - number of nodes
+        :edges (int or None) - number of contacts, if known
+    returns:
+        :float - edges x (mean degree)^2 if `edges` is given, else `residues`
+    """
+    if edges is None:
+        return float(residues)
+    degree = 2 * edges / max(residues, 1)
+    return float(edges) * degree ** 2
+
+class CostIndex(object):
+    """
+    Tab separated cache of `ID threshold residues edges` lines, extended as new IDs are measured
+    """
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        self.entries = {}
+        if self.filename.exists():
+            with open(self.filename, 'r') as fRead:
+                for line in fRead:
+                    ID, threshold, residues, edges = line.split()
+                    self.entries[ID, float(threshold)] = (int(residues), int(edges))
+
+    def measure(self, ID, filename, threshold, load=load):
+        """
+        Residue and edge count of one protein at `threshold`, computed and recorded if not cached
+        """
+        key = (ID, float(threshold))
+        if key not in self.entries:
+            x = load(filename)
+            rows, _ = ContactGraphMaker(threshold).contacts(x)
+            self.entries[key] = (x.shape[0], rows.shape[0])
+            with open(self.filename, 'a') as fWrite:
+                print(ID, float(threshold), *self.entries[key], sep='\t', file=fWrite)
+        return self.entries[key]
+
+def pack_longest_first(costs, bins):
+    """
+    Longest-processing-time-first packing of tasks into `bins` groups of similar total cost
+    returns:
+        :list of index lists, one per bin, heaviest bin first
+    """
+    heap = [(0., k, []) for k in range(bins)]
+    for i in np.argsort(costs, kind='stable')[::-1]:
+        load, k, members = heapq.heappop(heap)
+        members.append(int(i))
+        heapq.heappush(heap, (load + costs[i], k, members))
+    return [members for _, _, members in sorted(heap, key=lambda b: -b[0]) if members]
+
+def makespan(costs, workers):
+    """Finish time of the last task when `workers` slots take tasks in the given order"""
+    slots = [0.] * workers
+    for cost in costs:
+        heapq.heapreplace(slots, slots[0] + cost)
+    return max(slots)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+All-pairs similarity of reduced graphlet features, computed in tiles
+
+Replaces `cosine-similarity-allpair-from-matrix` (+ `sim2dist`), whose N x N text output doesn't
+fit for large N. Rows are split into blocks of `block` proteins; each (row block, column block)
+tile is one matrix product, so memory stays at a few tiles per thread whatever N is. Row blocks
+are handed to a thread pool (the products release the GIL). Results are either
+    - a dense N x N float32 .npy, written tile by tile through a memory map, or
+    - the k nearest neighbours of every protein, kept as a running per-row-block top-k
+in an output directory holding proteins.txt and similarity.json (metric, channel, ...).
+"""
+
+import json
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .toolbox import listfile
+from .reduced import load_reduced
+
+METRICS = ('cosine', 'euclidean')
+
+def load_features(path, channel='raw'):
+    """
+    Features of one channel of a reduced store (directory) or reduce_graphlets.py npz
+    returns:
+        :(proteins, (N, D) float array), masked (unfilled) proteins dropped and any threshold
+         axis flattened into the features
+    """
+    path = Path(path)
+    if path.is_dir():
+        data = load_reduced(path)
+        mat, mask = data[channel], np.asarray(data['mask'])
+    else:
+        data = np.load(path)
+        mat = data['mat'][list(data['channels']).index(channel)]
+        mask = data['mask'] if 'mask' in data.files else np.ones(mat.shape[0], dtype=bool)
+    proteins = [protein for protein, filled in zip(data['proteins'], mask) if filled]
+    X = np.asarray(mat[np.flatnonzero(mask)], dtype=np.float64)
+    return proteins, X.reshape(X.shape[0], -1)
+
+def lognormalize(X):
+    """Row-wise log(1 + x) / log(1 + sum(x)), as `lognormalize-graphlets` does per graphlet vector"""
+    total = np.log1p(X.sum(axis=1, keepdims=True))
+    return np.divide(np.log1p(X), total, out=np.zeros_like(X, dtype=np.float64), where=total > 0)
+
+class Similarity(object):
+    """
+    Tiled all-pairs similarity (cosine) or distance (euclidean) between the rows of a matrix
+    """
+    def __init__(self, X, metric='cosine', block=4096, dtype=np.float32):
+        """
+        args:
+            :X (array-like) - (N, D) features
+            :metric (str) - 'cosine' (similarity, higher is closer) or 'euclidean' (distance)
+            :block (int) - proteins per row / column block
+            :dtype - precision of the products
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        self.metric = metric
+        self.block = block
+        X = np.asarray(X, dtype=np.float64)
+        norms = np.linalg.norm(X, axis=1)
+        if metric == 'cosine':
+            # zero vectors get similarity 0 to everything, like the binary
+            X = np.divide(X, norms[:, None], out=np.zeros_like(X), where=norms[:, None] > 0)
+        self.X = X.astype(dtype)
+        self.sqnorms = (norms ** 2).astype(dtype)
+
+    @property
+    def N(self):
+        return self.X.shape[0]
+
+    @property
+    def closer_is_larger(self):
+        return self.metric == 'cosine'
+
+    def blocks(self):
+        return [slice(start, min(start + self.block, self.N)) for start in range(0, self.N, self.block)]
+
+    def tile(self, rows, cols):
+        """Similarities (or distances) of rows x cols"""
+        S = self.X[rows] @ self.X[cols].T
+        if self.metric == 'euclidean':
+            S = np.sqrt(np.maximum(self.sqnorms[rows, None] + self.sqnorms[None, cols] - 2 * S, 0))
+        return S
+
+    def dense(self, filename, workers=4):
+        """
+        Writes the N x N matrix to a .npy file; tiles above the diagonal are computed once and
+        mirrored, and each row block's task only writes its own tiles
+        """
+        out = np.lib.format.open_memmap(filename, mode='w+', dtype=self.X.dtype, shape=(self.N, self.N))
+        blocks = self.blocks()
+
+        def fill(i):
+            rows = blocks[i]
+            for cols in blocks[i:]:
+                S = self.tile(rows, cols)
+                out[rows, cols] = S
+                out[cols, rows] = S.T
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fill, range(len(blocks))))
+        out.flush()
+        return out
+
+    def topk(self, k, workers=4):
+        """
+        k nearest neighbours of every row (itself excluded)
+        returns:
+            :(indices (N, k) int64, values (N, k)), nearest first
+        """
+        k = max(0, min(k, self.N - 1))
+        sign = 1 if self.closer_is_larger else -1
+        indices = np.zeros((self.N, k), dtype=np.int64)
+        values = np.zeros((self.N, k), dtype=self.X.dtype)
+        if k == 0:
+            # a single row has no neighbours
+            return indices, values
+
+        def rank(rows):
+            n = rows.stop - rows.start
+            # running top-k of the row block, sorted nearest first; score is higher-is-closer for both metrics
+            best = np.full((n, k), -np.inf, dtype=self.X.dtype)
+            best_index = np.full((n, k), -1, dtype=np.int64)
+            for cols in self.blocks():
+                S = sign * self.tile(rows, cols)
+                if cols.start < rows.stop and rows.start < cols.stop:
+                    r = np.arange(max(rows.start, cols.start), min(rows.stop, cols.stop))
+                    S[r - rows.start, r - cols.start] = -np.inf
+                best, best_index = merge_topk(best, best_index, S, cols.start)
+            indices[rows] = best_index
+            values[rows] = sign * best
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(rank, self.blocks()))
+        return indices, values
+
+def merge_topk(best, best_index, S, offset):
+    """
+    Merges a tile of scores into running top-k lists
+    args:
+        :best, best_index (n, k) - current best scores (descending) and their column indices
+        :S (n, m) - scores of the columns offset..offset + m
+    returns:
+        :updated (best, best_index)
+    """
+    n, k = best.shape
+    if k == 0:
+        return best, best_index
+    if np.isinf(best[:, -1]).any():
+        # lists not full yet: select from everything
+        candidates = np.concatenate([best, S], axis=1)
+        columns = np.broadcast_to(np.arange(offset, offset + S.shape[1]), S.shape)
+        candidate_index = np.concatenate([best_index, columns], axis=1)
+        keep = np.argpartition(-candidates, k - 1, axis=1)[:, :k]
+        best = np.take_along_axis(candidates, keep, axis=1)
+        best_index = np.take_along_axis(candidate_index, keep, axis=1)
+        order = np.argsort(-best, axis=1, kind='stable')
+        return np.take_along_axis(best, order, axis=1), np.take_along_axis(best_index, order, axis=1)
+
+    # only entries beating a row's k-th best can enter, usually a handful per row
+    r, c = np.nonzero(S > best[:, -1:])
+    if r.size == 0:
+        return best, best_index
+    rows = np.concatenate([np.repeat(np.arange(n), k), r])
+    scores = np.concatenate([best.ravel(), S[r, c]])
+    columns = np.concatenate([best_index.ravel(), c + offset])
+    order = np.lexsort((-scores, rows))
+    # every row has at least k entries, so the first k of each row's run form an (n, k) block
+    counts = np.bincount(rows, minlength=n)
+    rank = np.arange(order.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+    keep = order[rank < k]
+    return scores[keep].reshape(n, k), columns[keep].reshape(n, k)
+
+def write_info(directory, proteins, **info):
+    """Labels and parameters of a result, replacing whatever result `directory` held before"""
+    directory = Path(directory)
+    directory.mkdir(exist_ok=True, parents=True)
+    for name in ('matrix', 'indices', 'values'):
+        (directory / f"{name}.npy").unlink(missing_ok=True)
+    listfile.write(proteins, directory / "proteins.txt")
+    with open(directory / "similarity.json", 'w') as fWrite:
+        json.dump(info, fWrite, indent=1)
+
+def load_similarity(directory):
+    """
+    returns:
+        :dict with proteins, the similarity.json entries and `matrix` (memory-mapped) or
+         `indices` / `values` (top-k), whichever was written
+    """
+    directory = Path(directory)
+    with open(directory / "similarity.json", 'r') as fRead:
+        result = json.load(fRead)
+    result['proteins'] = listfile.read(directory / "proteins.txt")
+    for name in ('matrix', 'indices', 'values'):
+        if (directory / f"{name}.npy").exists():
+            result[name] = np.load(directory / f"{name}.npy", mmap_mode='r')
+    return result
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic protein-like Cα backbones, for benchmarking
+
+A backbone is a random walk with the Cα-Cα spacing (3.8 Å) and virtual bond angle (~85-130°)
+of real chains. It is confined to a sphere of the radius of gyration of a globular protein of
+that length (Rg ≈ 2.2 N^0.38 Å), and no two residues come closer than the spacing, so the contact
+density at the usual thresholds is close to that of real structures.
+"""
+
+import numpy as np
+
+CA_SPACING = 3.8
+
+def globular_radius(residues):
+    """Radius (Å) of the sphere with the radius of gyration of a globular protein of `residues`"""
+    return np.sqrt(5 / 3) * 2.2 * residues ** 0.38
+
+def random_backbone(residues, seed=0, spacing=CA_SPACING, tries=32):
+    """
+    args:
+        :residues (int) - chain length
+        :seed (int) - random seed, the same seed gives the same backbone
+        :spacing (float) - distance between consecutive residues (and the minimum between any two)
+        :tries (int) - candidate steps drawn per residue before a clash is accepted
+    returns:
+        :np.ndarray (residues, 3) float32 coordinates
+    """
+    rng = np.random.default_rng(seed)
+    radius = globular_radius(residues)
+    coords = np.zeros((residues, 3))
+    # uniform grid of cell size `spacing`: a clash can only be with residues in the 27 cells around
+    grid = {}
+
+    def cell(x):
+        return tuple((x // spacing).astype(int))
+
+    def clashes(x, i):
+        cx, cy, cz = cell(x)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    for j in grid.get((cx + dx, cy + dy, cz + dz), ()):
+                        if j < i - 1 and np.sum((coords[j] - x) ** 2) < spacing ** 2:
+                            return True
+        return False
+
+    def place(i, x):
+        coords[i] = x
+        grid.setdefault(cell(x), []).append(i)
+
+    place(0, np.zeros(3))
+    bond = rng.normal(size=3)
+    bond /= np.linalg.norm(bond)
+    for i in range(1, residues):
+        # turn away from the previous bond by 50-95°, i.e. a 85-130° virtual bond angle
+        cos_turn = rng.uniform(np.cos(np.radians(95)), np.cos(np.radians(50)), size=tries)
+        phi = rng.uniform(0, 2 * np.pi, size=tries)
+        u = np.cross(bond, [1., 0., 0.] if abs(bond[0]) < 0.9 else [0., 1., 0.])
+        u /= np.linalg.norm(u)
+        v = np.cross(bond, u)
+        sin_turn = np.sqrt(1 - cos_turn ** 2)
+        steps = (cos_turn[:, None] * bond + sin_turn[:, None] * (np.cos(phi)[:, None] * u + np.sin(phi)[:, None] * v))
+        candidates = coords[i - 1] + spacing * steps
+
+        inside = np.linalg.norm(candidates, axis=1) <= radius
+        # prefer steps inside the sphere; if none, the one heading most towards the centre
+        order = np.flatnonzero(inside) if inside.any() else np.argsort(np.linalg.norm(candidates, axis=1))[:1]
+        k = next((k for k in order if not clashes(candidates[k], i)), order[0])
+        place(i, candidates[k])
+        bond = steps[k]
+
+    return coords.astype(np.float32)
+
+if __name__ == '__main__':
+    import argparse
+
+    from .toolbox import ContactGraphMaker
+
+    parser = argparse.ArgumentParser(description="Contact statistics of synthetic backbones")
+    parser.add_argument("residues", type=int, nargs='+')
+    parser.add_argument("-t", "--thresholds", type=float, nargs='+', default=[6., 8., 10., 12.])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for n in args.residues:
+        x = random_backbone(n, seed=args.seed)
+        gaps = np.linalg.norm(np.diff(x, axis=0), axis=1)
+        degrees = [ContactGraphMaker(t).contacts(x)[0].shape[0] * 2 / n for t in args.thresholds]
+        print(f"{n}\tspacing {gaps.mean():.2f}\t" + "\t".join(f"deg@{t:g} {d:.1f}" for t, d in zip(args.thresholds, degrees)))
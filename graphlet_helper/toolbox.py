@@ -4,10 +4,21 @@
 #
 # 
 # author: dan berenberg
+import os
+import inspect
 import functools
+import threading
+import contextlib
+import tempfile
+from pathlib import Path
 from datetime import datetime
 
-import torch
+import numpy as np
+
+from .cache import file_digest
+
+# torch and scipy are imported where they are used, so that the package (and the scripts that
+# only need e.g. `listfile`) start without them
 
 class _filetype(object):
     @staticmethod
@@ -84,6 +95,10 @@ class Composer(object):
     def feeding_to(self, fn):
         return Composer(*self._callables, fn)
 
+    def instrument(self, hook):
+        """Composer of the same stages, each wrapped by `hook` (e.g. metrics.Metrics.timed)"""
+        return Composer(*map(hook, self._callables))
+
     def __getitem__(self, key):
         if isinstance(key, slice):
             start, stop, step = key.indices(len(self))
@@ -123,6 +138,8 @@ class AdjacencyMatrixMaker(object):
         return self._threshold
 
     def convert(self, distance_map):
+        import torch
+
         A = distance_map.clone()
         A = ( A <= self._threshold ).float()
         if not self._selfloop:
@@ -147,6 +164,8 @@ class CoordLoader(object):
         self.silent_if_square = silent_if_square
 
     def convert(self, coords):
+        import torch
+
         shape = coords.shape
         assert len(shape) == 2 
         
@@ -159,6 +178,429 @@ class CoordLoader(object):
     def __call__(self, coords):
         return self.convert(coords)
 
+def format_rows(template, array):
+    """Formats each row of a 2D integer array with a %-style line template, in one call"""
+    array = np.asarray(array)
+    return (template * array.shape[0]) % tuple(array.ravel().tolist())
+
+class Scratch(object):
+    """
+    Scratch files handed to the external binaries.
+        'disk'  - files in a tempfile.TemporaryDirectory (default)
+        'shm'   - files in a temporary directory on the /dev/shm tmpfs
+        'memfd' - anonymous in-memory files (Linux memfd_create), passed as /proc/self/fd/N
+        'pipe'  - inputs are streamed to the binary over stdin, outputs go to memfds
+    Only 'disk' touches the shared filesystem.
+    """
+    kinds = ('disk', 'shm', 'memfd', 'pipe')
+
+    def __init__(self, kind='disk'):
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown scratch kind: {kind}")
+        self.kind = kind
+        self._tmpdir = None
+        self._fds = {}
+
+    def __enter__(self):
+        if self.kind in ('disk', 'shm'):
+            self._tmpdir = tempfile.TemporaryDirectory(dir='/dev/shm' if self.kind == 'shm' else None)
+        return self
+
+    def __exit__(self, *exc):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+    @property
+    def pass_fds(self):
+        """File descriptors the binaries need to inherit"""
+        return tuple(self._fds.values())
+
+    def path(self, name):
+        """Path a child process can open for reading or writing the scratch file `name`"""
+        if self._tmpdir is not None:
+            return Path(self._tmpdir.name) / name
+        if name not in self._fds:
+            self._fds[name] = os.memfd_create(name)
+        return Path(f"/proc/self/fd/{self._fds[name]}")
+
+    def feed(self, name, text):
+        """
+        Makes `text` available as the input file `name`
+        returns:
+            :(path, stdin) - path to pass to the binary and the bytes to send on its stdin (or None)
+        """
+        if self.kind == 'pipe':
+            return Path("/dev/stdin"), text.encode()
+        path = self.path(name)
+        if self._tmpdir is not None:
+            path.write_text(text)
+        else:
+            os.pwrite(self._fds[name], text.encode(), 0)
+        return path, None
+
+    def read(self, name):
+        """Contents of the scratch file `name`, as written by a binary"""
+        if self._tmpdir is not None:
+            return self.path(name).read_text()
+        fd = self._fds[name]
+        return os.pread(fd, os.fstat(fd).st_size, 0).decode()
+
+def to_array(x):
+    """Returns a NumPy view of a tensor (or array)"""
+    return x.numpy() if hasattr(x, 'numpy') else np.asarray(x)
+
+def load(filename):
+    """
+    Coordinates or distance map of an input file, the first stage of the runners' pipelines
+    args:
+        :filename (str or Path) - a .npy file (read without torch) or a PyTorch tensor file
+    """
+    if Path(filename).suffix == '.npy':
+        return np.load(filename)
+    try:
+        import torch
+    except ImportError as e:
+        raise ImportError(f"reading {filename} needs torch; use .npy inputs or a packed archive") from e
+    return torch.load(filename)
+
+class ContactGraphMaker(object):
+    """
+    Converts an N x 3 coordinate matrix to a sparse (CSR) contact graph without building
+    an N x N distance matrix; contacts are found with a KD-tree at a fixed threshold.
+    An N x N input is taken to be a precomputed distance map and is thresholded directly.
+    """
+    stage = 'graph'
+
+    def __init__(self, threshold, selfloop=False, silent_if_square=True):
+        """
+        initialize
+        args:
+            :threshold (float) - contact distance (inclusive)
+            :selfloop (bool) - keep the diagonal
+            :silent_if_square (bool) - treat a square input as a distance map
+        """
+        self._threshold = threshold
+        self._selfloop  = selfloop
+        self.silent_if_square = silent_if_square
+
+    @property
+    def threshold(self):
+        return self._threshold
+
+    def contacts(self, x, distances=False):
+        """
+        Upper-triangle contacts (i < j) of a coordinate matrix or distance map
+        returns:
+            :(rows, cols) or (rows, cols, dist) if distances=True
+        """
+        x = to_array(x)
+        shape = x.shape
+        assert len(shape) == 2
+
+        if (shape[0] == shape[1]) and self.silent_if_square:
+            rows, cols = np.nonzero(np.triu(x <= self._threshold, k=1))
+            dist = x[rows, cols]
+        else:
+            from scipy.spatial import cKDTree
+
+            assert shape[1] == 3
+            pairs = cKDTree(x).query_pairs(self._threshold, output_type='ndarray')
+            rows, cols = pairs[:, 0], pairs[:, 1]
+            dist = np.linalg.norm(x[rows] - x[cols], axis=1) if distances else None
+        return (rows, cols, dist) if distances else (rows, cols)
+
+    def convert(self, x):
+        return symmetric_csr(*self.contacts(x), x.shape[0], selfloop=self._selfloop)
+
+    def __call__(self, x):
+        return self.convert(x)
+
+def symmetric_csr(rows, cols, n, selfloop=False):
+    """N x N float32 CSR adjacency from upper-triangle contacts"""
+    import scipy.sparse as sp
+
+    rows, cols = np.concatenate([rows, cols]), np.concatenate([cols, rows])
+    if selfloop:
+        rows = np.concatenate([rows, np.arange(n)])
+        cols = np.concatenate([cols, np.arange(n)])
+    A = sp.csr_matrix((np.ones(rows.shape[0], dtype=np.float32), (rows, cols)), shape=(n, n))
+    A.sort_indices()
+    return A
+
+class ThresholdSweep(object):
+    """
+    Converts coordinates (or a distance map) to contact graphs at several thresholds at once.
+    Contacts within the largest threshold are found and sorted by distance a single time; the
+    graph at each cutoff is the prefix of that list, so it grows from one cutoff to the next.
+    """
+    stage = 'graph'
+
+    def __init__(self, thresholds, selfloop=False, silent_if_square=True):
+        """
+        initialize
+        args:
+            :thresholds (iterable of float) - contact distances, reordered ascending
+            :selfloop (bool) - keep the diagonal
+            :silent_if_square (bool) - treat a square input as a distance map
+        """
+        self.thresholds = sorted(thresholds)
+        self._selfloop = selfloop
+        self._maker = ContactGraphMaker(self.thresholds[-1], selfloop=selfloop,
+                                        silent_if_square=silent_if_square)
+
+    def convert(self, x):
+        """list of CSR adjacencies, one per (ascending) threshold"""
+        rows, cols, dist = self._maker.contacts(x, distances=True)
+        order = np.argsort(dist, kind='stable')
+        rows, cols, dist = rows[order], cols[order], dist[order]
+        stops = np.searchsorted(dist, self.thresholds, side='right')
+        return [symmetric_csr(rows[:k], cols[:k], x.shape[0], selfloop=self._selfloop) for k in stops]
+
+    def __call__(self, x):
+        return self.convert(x)
+
+class ContactRunner(object):
+    """
+    Shared driver of the runners; subclasses provide `as_adjmat`, a Composer that loads a file into a
+    sparse contact graph, and `count(adjmat, protein)`, which computes the features of one graph.
+    Setting `cache` to a cache.ResultCache serves graphs that were counted before from it, and
+    `timeout` bounds the seconds an external binary may run on one graph (subprocess.TimeoutExpired).
+    """
+    cache = None
+    archive = None
+    metrics = None
+    timeout = None
+
+    def read_from(self, archive):
+        """
+        Loads inputs by ID from a packed archive (see archive.CoordArchive) instead of from .pt files
+        """
+        self.archive = archive
+        self.as_adjmat = Composer(archive.load, *(self.as_adjmat[i] for i in range(1, len(self.as_adjmat))))
+        return self
+
+    def instrument(self, metrics):
+        """
+        Times every stage of the pipeline into a metrics.Metrics; the caller begins/ends its records
+        """
+        self.metrics = metrics
+        self.as_adjmat = self.as_adjmat.instrument(metrics.timed)
+        return self
+
+    def stage(self, name):
+        """Context timing a block of `count` as stage `name` when instrumented"""
+        return self.metrics.stage(name) if self.metrics is not None else contextlib.nullcontext()
+
+    def protein(self, filename):
+        """ID of an input, given as a path or (with an archive) an ID"""
+        return self.archive.protein(filename) if self.archive is not None else Path(filename).stem
+
+    @property
+    def version(self):
+        """Digest of whatever does the counting, part of the cache key; the runner's module by default"""
+        return file_digest(inspect.getfile(type(self)))
+
+    def cached_count(self, adjmat, protein, threshold):
+        """
+        `count`, looked up in / recorded to `cache` if one is set
+        """
+        if self.metrics is not None:
+            self.metrics.graph(adjmat, threshold)
+        if self.cache is None:
+            return self.count(adjmat, protein)
+
+        with self.stage('cache'):
+            key = self.cache.key(adjmat, threshold, self.__class__.__name__, self.version)
+            result = self.cache.get(key)
+        if result is None:
+            result = self.count(adjmat, protein)
+            with self.stage('cache'):
+                self.cache.put(key, {name: value for name, value in result.items() if name != 'protein'})
+            return result
+        return dict(result, channels=result['channels'].tolist(), protein=protein)
+
+    def run(self, filename):
+        """
+        Builds the contact graph of a tensor file and computes its features.
+        """
+        return self.cached_count(self.as_adjmat(filename), self.protein(filename), self.threshold)
+
+    def sweep(self, filename, thresholds):
+        """
+        Contact graphs of one load of the input at several thresholds
+        returns:
+            :(list of graphs, ascending thresholds)
+        """
+        sweep = ThresholdSweep(thresholds, selfloop=False)
+        graphs = self.as_adjmat[:-1].feeding_to(sweep if self.metrics is None else self.metrics.timed(sweep))(filename)
+        return graphs, sweep.thresholds
+
+    def count_thresholds(self, graphs, thresholds, protein):
+        """
+        `cached_count` of each graph of a sweep
+        returns:
+            :dict with `mat` of shape (thresholds, channels, features) and the `thresholds`
+        """
+        results = [self.cached_count(A, protein, t) for A, t in zip(graphs, thresholds)]
+        return dict(stack_results(results), thresholds=np.asarray(thresholds), protein=protein)
+
+    def run_thresholds(self, filename, thresholds):
+        """
+        Computes features at several thresholds from one load of the input
+        returns:
+            :dict with `mat` of shape (thresholds, channels, features) and the (ascending) `thresholds`
+        """
+        return self.count_thresholds(*self.sweep(filename, thresholds), self.protein(filename))
+
+    def frames(self, filename):
+        """Contact graphs of the frames of a T x N x 3 coordinate stack, from one load of the input"""
+        coords = self.as_adjmat[:-1](filename)
+        to_graph = self.as_adjmat[-1]
+        return [to_graph(x) for x in to_array(coords)]
+
+    def count_frames(self, graphs, protein):
+        """
+        Features of every frame of a trajectory; `cached_count` of each graph unless a runner
+        updates its counts from the contacts that change between frames (see trajectory.py)
+        returns:
+            :dict with `mat` of shape (frames, channels, features) and the `frames` indices
+        """
+        results = [self.cached_count(A, protein, self.threshold) for A in graphs]
+        return dict(stack_results(results), frames=np.arange(len(graphs)), protein=protein)
+
+    def run_frames(self, filename):
+        """
+        Computes features of every frame of a trajectory file (T x N x 3 coordinates)
+        returns:
+            :dict with `mat` of shape (frames, channels, features) and the `frames` indices
+        """
+        return self.count_frames(self.frames(filename), self.protein(filename))
+
+    def __str__(self):
+        return f"{self.__class__.__name__}({self.threshold})"
+
+def stop(threads, lock, exception):
+    """Raises `exception` in the threads (idents) of a set that's emptied under `lock` as they finish"""
+    import ctypes
+
+    with lock:
+        for ident in threads:
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(ident), ctypes.py_object(exception))
+
+def stack_results(results):
+    """
+    Results of several graphs (thresholds, frames) as one: `mat`, any other per-graph `*_mat`
+    (e.g. intervals) and per-residue `gdv` get a new first axis, the rest is the first result's
+    """
+    stacked = {key: np.stack([result[key] for result in results])
+               for key in results[0] if key in ('mat', 'gdv') or key.endswith('_mat')}
+    return dict(results[0], **stacked)
+
+class MultiRunner(ContactRunner):
+    """
+    Feeds each input's contact graph(s) to several runners at once, so the input is loaded and
+    thresholded a single time. The runners count concurrently in threads, which overlaps the
+    external binaries and the NumPy-bound native counters.
+    Results hold `modes` and, per mode, `{mode}_channels`, `{mode}_mat` and any other entry of the
+    mode's results as `{mode}_{key}`.
+    """
+    def __init__(self, runners, threshold=6):
+        """
+        args:
+            :runners (dict) - mode name -> runner; their loading stages are replaced by this runner's
+            :threshold (float) - contact map threshold
+        """
+        self.runners = dict(runners)
+        self.threshold = threshold
+        self.as_adjmat = Composer(load, ContactGraphMaker(self.threshold, selfloop=False))
+
+    @property
+    def cache(self):
+        return next(iter(self.runners.values())).cache
+
+    @cache.setter
+    def cache(self, cache):
+        for runner in self.runners.values():
+            runner.cache = cache
+
+    @property
+    def timeout(self):
+        return next(iter(self.runners.values())).timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        for runner in self.runners.values():
+            runner.timeout = timeout
+
+    def instrument(self, metrics):
+        for runner in self.runners.values():
+            runner.metrics = metrics
+        return super().instrument(metrics)
+
+    def each(self, fn):
+        """
+        {mode: fn(runner)}, the runners called concurrently. The threads are not waited for if the
+        wait is interrupted (e.g. TimeoutError of manifest.time_limit): the same exception is raised
+        in those still counting, which stops them at their next Python step, as it does the main thread.
+        """
+        results, errors, running = {}, {}, set()
+        lock = threading.Lock()
+
+        def call(mode, runner):
+            try:
+                results[mode] = fn(runner)
+            except BaseException as e:
+                errors[mode] = e
+            finally:
+                with lock:
+                    running.discard(threading.get_ident())
+
+        threads = [threading.Thread(target=call, args=item, daemon=True) for item in self.runners.items()]
+        for thread in threads:
+            with lock:
+                thread.start()
+                running.add(thread.ident)
+        try:
+            for thread in threads:
+                thread.join()
+        except BaseException as e:
+            stop(running, lock, type(e))
+            raise
+        for mode in self.runners:
+            if mode in errors:
+                raise errors[mode]
+        return {mode: results[mode] for mode in self.runners}
+
+    def merge(self, results, protein, thresholds=None, frames=None):
+        merged = dict(modes=list(results), protein=protein)
+        for mode, result in results.items():
+            for key, value in result.items():
+                if key not in ('protein', 'thresholds', 'frames'):
+                    merged[f"{mode}_{key}"] = value
+        if thresholds is not None:
+            merged['thresholds'] = np.asarray(thresholds)
+        if frames is not None:
+            merged['frames'] = np.asarray(frames)
+        return merged
+
+    def cached_count(self, adjmat, protein, threshold):
+        return self.merge(self.each(lambda runner: runner.cached_count(adjmat, protein, threshold)), protein)
+
+    def count_thresholds(self, graphs, thresholds, protein):
+        return self.merge(self.each(lambda runner: runner.count_thresholds(graphs, thresholds, protein)),
+                          protein, thresholds)
+
+    def count_frames(self, graphs, protein):
+        return self.merge(self.each(lambda runner: runner.count_frames(graphs, protein)),
+                          protein, frames=np.arange(len(graphs)))
+
+    def __str__(self):
+        return f"{self.__class__.__name__}({','.join(self.runners)}, {self.threshold})"
+
 if __name__ == '__main__':
     pass
 
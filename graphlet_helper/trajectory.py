@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Graphlet and clique counts along a trajectory, updated from the contacts that change between frames
+
+Consecutive frames of a molecular-dynamics trajectory share almost all of their contacts, so
+only what a changed contact (u, v) can reach is recounted:
+    - orbits: a graphlet (connected induced node set) that doesn't hold both ends of a changed
+      contact is the same in both frames. Contacts are toggled one at a time, and each one's
+      change is what the sets holding both u and v credit with the contact minus without it.
+      With u and v relabelled 0 and 1, orca_native.extend grows every connected set (of the
+      graph with the contact) that holds them from {0, 1} exactly once, as the largest non-cut
+      vertex of such a set is never u or v; the sets are classified with and without the
+      contact's bit, on the subgraph within 3 hops of u and v. When more than `max_fraction` of
+      the contacts change, the frame is counted from scratch.
+    - cliques: a clique without any endpoint of a changed contact is a clique, and maximal or
+      not, in both frames alike, so the histogram is updated by the cliques that hold an
+      endpoint, before and after (cliques.local_clique_sizes), unless the changed contacts reach
+      more than `max_fraction` of the nodes.
+The first frame is always counted in full.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+from .orca_native import NUM_ORBITS, MAX_NODES, Adjacency, as_csr, ball, orbit_table, extend, orbit_counts
+from . import cliques
+
+def edge_changes(previous, current):
+    """
+    Contacts inserted and deleted from one graph to the next
+    returns:
+        :(inserted (m, 2), deleted (m', 2)) upper-triangle node pairs
+    """
+    previous, current = sp.csr_matrix(previous, dtype=bool), sp.csr_matrix(current, dtype=bool)
+    rows, cols = sp.triu(previous != current, k=1).nonzero()
+    added = np.asarray(current[rows, cols]).ravel()
+    pairs = np.column_stack([rows, cols])
+    return pairs[added], pairs[~added]
+
+def frame_changes(graphs):
+    """
+    returns:
+        :list of (inserted, deleted) per frame, everything inserted in the first
+    """
+    empty = sp.csr_matrix(graphs[0].shape, dtype=bool)
+    return [edge_changes(previous, current) for previous, current in zip([empty] + list(graphs[:-1]), graphs)]
+
+def endpoints(inserted, deleted):
+    return np.unique(np.concatenate([inserted.ravel(), deleted.ravel()]))
+
+def contact_orbit_counts(csr, u, v, max_nodes=MAX_NODES):
+    """
+    Orbit counts a contact adds: what the connected sets holding both u and v credit with the
+    contact, minus what they credit without it
+    args:
+        :csr (scipy.sparse.csr_matrix) - binary symmetric adjacency holding the contact (u, v)
+    returns:
+        :(nodes, counts (len(nodes), 73) int64) for the nodes within max_nodes - 2 hops of u, v
+    """
+    around = ball(csr, [u, v], max_nodes - 2)
+    order = np.concatenate([[u, v], np.setdiff1d(around, [u, v], assume_unique=True)])
+    graph = Adjacency(csr[order][:, order])
+    counts = np.zeros(order.shape[0] * NUM_ORBITS, dtype=np.int64)
+    # bit 0 of a mask is the pair (0, 1), i.e. (u, v)
+    sets, masks = np.array([[0, 1]]), np.ones(1, dtype=np.int64)
+    while sets.shape[0]:
+        table = orbit_table(sets.shape[1])
+        counts += np.bincount((sets * NUM_ORBITS + table[masks]).ravel(), minlength=counts.shape[0])
+        without = table[masks & ~1]
+        connected = without[:, 0] >= 0
+        counts -= np.bincount((sets[connected] * NUM_ORBITS + without[connected]).ravel(),
+                              minlength=counts.shape[0])
+        if sets.shape[1] == max_nodes:
+            break
+        sets, masks = extend(graph, sets, masks)
+    return order, counts.reshape(-1, NUM_ORBITS)
+
+def toggled(csr, pairs, sign):
+    """`csr` (int8) with the contacts `pairs` added (sign 1) or removed (sign -1)"""
+    rows, cols = np.concatenate([pairs[:, 0], pairs[:, 1]]), np.concatenate([pairs[:, 1], pairs[:, 0]])
+    change = sp.csr_matrix((np.full(rows.shape[0], sign, dtype=np.int8), (rows, cols)), shape=csr.shape)
+    csr = (csr + change).tocsr()
+    csr.eliminate_zeros()
+    return csr
+
+class OrbitTracker(object):
+    """Node x 73 orbit counts of successive graphs, updated contact by contact"""
+    def __init__(self, max_fraction=0.05):
+        """
+        args:
+            :max_fraction (float) - share of changed contacts above which a frame is counted in full
+        """
+        self.max_fraction = max_fraction
+        self.csr = None
+        self.node_gdv = None
+        # frames counted in full
+        self.full = 0
+
+    def __call__(self, adjmat, changes):
+        """
+        args:
+            :adjmat - the next frame's adjacency
+            :changes - (inserted, deleted) contacts since the previous frame, see edge_changes
+        returns:
+            :np.ndarray (nodes, 73) int64
+        """
+        inserted, deleted = changes
+        csr = as_csr(adjmat).astype(np.int8)
+        if self.csr is None or inserted.shape[0] + deleted.shape[0] > self.max_fraction * max(csr.nnz // 2, 1):
+            self.node_gdv = orbit_counts(csr)
+            self.full += 1
+        else:
+            node_gdv, current = self.node_gdv.copy(), self.csr
+            for pair in deleted:
+                nodes, counts = contact_orbit_counts(current, *pair)
+                node_gdv[nodes] -= counts
+                current = toggled(current, pair[None], -1)
+            for pair in inserted:
+                current = toggled(current, pair[None], 1)
+                nodes, counts = contact_orbit_counts(current, *pair)
+                node_gdv[nodes] += counts
+            self.node_gdv = node_gdv
+        self.csr = csr
+        return self.node_gdv
+
+class CliqueTracker(object):
+    """Clique size histograms (cliques.maximal_clique_sizes / clique_counts) of successive graphs"""
+    def __init__(self, K=8, maximal=True, max_fraction=0.5):
+        """
+        args:
+            :max_fraction (float) - share of the nodes around the changed contacts above which a frame
+             is counted in full (the update counts that neighbourhood twice)
+        """
+        self.K = K
+        self.maximal = maximal
+        self.max_fraction = max_fraction
+        self.previous = None
+        self.counts = None
+        self.full = 0
+
+    def count(self, adjmat):
+        self.full += 1
+        if self.maximal:
+            return cliques.maximal_clique_sizes(adjmat, K=self.K)
+        return cliques.clique_counts(adjmat, K=self.K)
+
+    def __call__(self, adjmat, changes):
+        """
+        args:
+            :changes - (inserted, deleted) contacts since the previous frame, see edge_changes
+        returns:
+            :np.ndarray (K + 1,) int64, as the full count of `adjmat` would
+        """
+        changed = endpoints(*changes)
+        adjmat = sp.csr_matrix(adjmat)
+        if self.previous is None or \
+                np.union1d(changed, adjmat[changed].indices).shape[0] > self.max_fraction * adjmat.shape[0]:
+            self.counts = self.count(adjmat)
+        elif changed.shape[0]:
+            self.counts = self.counts \
+                - cliques.local_clique_sizes(self.previous, changed, K=self.K, maximal=self.maximal) \
+                + cliques.local_clique_sizes(adjmat, changed, K=self.K, maximal=self.maximal)
+        self.previous = adjmat
+        return self.counts
+
+if __name__ == '__main__':
+    import time
+    import argparse
+    from pathlib import Path
+
+    from .toolbox import load, to_array, ContactGraphMaker
+
+    parser = argparse.ArgumentParser(description="Compare incremental trajectory counts with per-frame ones")
+    parser.add_argument("input", type=Path, help="T x N x 3 coordinate stack (.pt / .npy)")
+    parser.add_argument("-t", "--threshold", type=float, default=10.)
+    args = parser.parse_args()
+
+    maker = ContactGraphMaker(args.threshold, selfloop=False)
+    graphs = [maker(x) for x in to_array(load(args.input))]
+    changes = frame_changes(graphs)
+    print(f"{len(graphs)} frames, {np.mean([len(i) + len(d) for i, d in changes[1:]]):.1f} changed contacts per frame")
+
+    for name, tracker, full in (('orbits', OrbitTracker(), orbit_counts),
+                                ('cliques', CliqueTracker(K=9), lambda A: cliques.maximal_clique_sizes(A, K=9))):
+        start = time.perf_counter()
+        incremental = [tracker(A, change) for A, change in zip(graphs, changes)]
+        incremental_time = time.perf_counter() - start
+        start = time.perf_counter()
+        exact = [full(A) for A in graphs]
+        exact_time = time.perf_counter() - start
+        same = all(np.array_equal(a, b) for a, b in zip(incremental, exact))
+        print(f"{name}: incremental {incremental_time:.2f}s, per frame {exact_time:.2f}s, "
+              f"{'identical' if same else 'DIFFERENT'}")
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Serve graphlet counts from warm worker processes over a Unix domain socket
+
+Workers import torch and the runners once and keep one runner per (modes, threshold, scratch,
+archive) they have been asked for. Every client connection gets a thread; requests from all of
+them share a bounded pool of -j worker processes, and at most --queue requests may be pending or
+running at once. A request that can't get a slot within --wait seconds is answered with a busy
+error, so a flood of clients is pushed back on instead of piling up in memory.
+
+Requests (see graphlet_helper/protocol.py and graphlet_client.py) are JSON headers:
+    {"op": "count", "input": path or ID, "mode": [...], "threshold": t, "thresholds": [...] or null,
+     "scratch": ..., "archive": path or null, "protein": name,
+     "sampling": {"samples": ..., "budget": ..., "confidence": ...} or null}
+with an .npy coordinate / distance matrix as payload instead of "input" to count an array.
+The other ops are "ping", "stats" and "shutdown".
+"""
+
+import io
+import os
+import time
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from graphlet_helper.toolbox import ThresholdSweep
+from graphlet_helper.cache import ResultCache
+from graphlet_helper.archive import CoordArchive
+from graphlet_helper.protocol import default_socket, send_message, recv_message
+from count_graphlets import make_runner, modes
+
+RUNNERS = {}
+CACHE = None
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--socket", type=Path, default=default_socket(), help="Socket path")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--queue", type=int, default=None,
+                        help="Requests pending or running at once (default: 4 x workers)")
+    parser.add_argument("--wait", type=float, default=60.,
+                        help="Seconds a request waits for a queue slot before it is refused as busy")
+    parser.add_argument("--cache-dir", type=Path, default=None,
+                        help="Result cache shared by the workers, see count_graphlets.py")
+    parser.add_argument("--cache-size", type=float, default=1.,
+                        help="Cache size limit in GiB")
+    return parser.parse_args()
+
+def init_worker(cache_dir, cache_size):
+    global CACHE
+    if cache_dir is not None:
+        CACHE = ResultCache(cache_dir, max_bytes=int(cache_size * 2**30))
+
+def runner_for(names, threshold, scratch, archive, sampling=None):
+    """The worker's runner for these parameters, built on first use"""
+    key = (tuple(names), threshold, scratch, archive, tuple(sorted((sampling or {}).items())))
+    if key not in RUNNERS:
+        runner = make_runner(names, threshold, scratch=scratch, sampling=sampling)
+        runner.cache = CACHE
+        if archive is not None:
+            runner.read_from(CoordArchive(archive))
+        RUNNERS[key] = runner
+    return RUNNERS[key]
+
+def count(header, payload):
+    """
+    Serves one count request in a worker process
+    returns:
+        :(response header, npz bytes)
+    """
+    start = time.perf_counter()
+    try:
+        names = modes(header['mode']) if isinstance(header['mode'], str) else list(header['mode'])
+        runner = runner_for(names, header.get('threshold', 10), header.get('scratch', 'disk'),
+                            header.get('archive'), header.get('sampling'))
+        thresholds = header.get('thresholds')
+        if payload:
+            # an array sent inline: skip the loading stage
+            x = np.load(io.BytesIO(payload), allow_pickle=False)
+            protein = header.get('protein', 'array')
+            if thresholds:
+                sweep = ThresholdSweep(thresholds, selfloop=False)
+                result = runner.count_thresholds(sweep(x), sweep.thresholds, protein)
+            else:
+                result = runner.cached_count(runner.as_adjmat[1:](x), protein, runner.threshold)
+        elif thresholds:
+            result = runner.run_thresholds(header['input'], thresholds)
+        else:
+            result = runner.run(header['input'])
+    except Exception as e:
+        return dict(ok=False, error=f"{type(e).__name__}: {e}"), b''
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **result)
+    return dict(ok=True, protein=str(result['protein']), seconds=time.perf_counter() - start,
+                worker=os.getpid()), buffer.getvalue()
+
+class GraphletServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, pool, queue, wait):
+        self.pool = pool
+        self.slots = threading.BoundedSemaphore(queue)
+        self.wait = wait
+        self.lock = threading.Lock()
+        self.stats = dict(served=0, failed=0, busy=0, running=0, clients=0, started=time.time())
+        super().__init__(str(path), Handler)
+        os.chmod(path, 0o600)
+
+    def note(self, **changes):
+        with self.lock:
+            for name, change in changes.items():
+                self.stats[name] += change
+
+    def count(self, header, payload):
+        if not self.slots.acquire(timeout=self.wait):
+            self.note(busy=1)
+            return dict(ok=False, busy=True, error="server busy, try again later"), b''
+        self.note(running=1)
+        try:
+            response = self.pool.submit(count, header, payload).result()
+        except Exception as e:
+            # a worker died; the pool is broken from here on
+            response = dict(ok=False, error=f"{type(e).__name__}: {e}"), b''
+        finally:
+            self.note(running=-1)
+            self.slots.release()
+        self.note(**({'served': 1} if response[0]['ok'] else {'failed': 1}))
+        return response
+
+class Handler(socketserver.BaseRequestHandler):
+    """Serves the requests of one client connection, in order, until it closes"""
+    def handle(self):
+        server = self.server
+        server.note(clients=1)
+        try:
+            while True:
+                message = recv_message(self.request)
+                if message is None:
+                    return
+                header, payload = message
+                op = header.get('op', 'count')
+                if op == 'count':
+                    send_message(self.request, *server.count(header, payload))
+                elif op == 'ping':
+                    send_message(self.request, dict(ok=True, pid=os.getpid()))
+                elif op == 'stats':
+                    with server.lock:
+                        stats = dict(server.stats, uptime=time.time() - server.stats['started'])
+                    send_message(self.request, dict(ok=True, **stats))
+                elif op == 'shutdown':
+                    send_message(self.request, dict(ok=True))
+                    threading.Thread(target=server.shutdown).start()
+                    return
+                else:
+                    send_message(self.request, dict(ok=False, error=f"unknown op {op}"))
+        except (ConnectionError, ValueError):
+            return
+        finally:
+            server.note(clients=-1)
+
+def claim(path):
+    """Removes a stale socket file left by a server that is gone; fails if one is still listening"""
+    if not path.exists():
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        path.unlink()
+    else:
+        raise SystemExit(f"a server is already listening on {path}")
+    finally:
+        probe.close()
+
+if __name__ == '__main__':
+    args = arguments()
+    claim(args.socket)
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.cache_dir, args.cache_size)) as pool:
+        server = GraphletServer(args.socket, pool, args.queue or 4 * args.workers, args.wait)
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+        print(f"serving on {args.socket} with {args.workers} workers", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            args.socket.unlink(missing_ok=True)
+    print("server stopped")
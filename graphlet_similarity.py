@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+All-pairs similarity (or top-k neighbours) of reduced graphlet features
+
+Reads a reduce_graphlets.py store or npz, takes one channel (optionally log-normalized like
+`lognormalize-graphlets`) and writes to output_dir either matrix.npy, the dense N x N similarity
+(cosine) or distance (euclidean) matrix, or with --top-k K, indices.npy / values.npy holding every
+protein's K nearest neighbours. Read the result with graphlet_helper.similarity.load_similarity.
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from graphlet_helper.toolbox import Timer
+from graphlet_helper.similarity import METRICS, Similarity, load_features, lognormalize, write_info
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("reduced", type=Path, help="Reduced store directory or npz (reduce_graphlets.py)")
+    parser.add_argument("output_dir", type=Path, help="Directory to write the result to")
+    parser.add_argument("--channel", default='raw', help="Feature channel")
+    parser.add_argument("--log", action='store_true', default=False,
+                        help="Log-normalize each protein's features, log(1 + x) / log(1 + sum)")
+    parser.add_argument("--metric", choices=METRICS, default='cosine',
+                        help="cosine similarity or euclidean distance")
+    parser.add_argument("--top-k", type=int, default=0,
+                        help="Keep each protein's K nearest neighbours instead of the dense matrix")
+    parser.add_argument("--block", type=int, default=4096, help="Proteins per tile side")
+    parser.add_argument("--float64", action='store_true', default=False,
+                        help="Compute in double instead of single precision")
+    parser.add_argument("-j", "--workers", type=int, default=4,
+                        help="Threads over row blocks (with many, consider OMP_NUM_THREADS=1)")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = arguments()
+
+    proteins, X = load_features(args.reduced, args.channel)
+    if args.log:
+        X = lognormalize(X)
+    print(f"{len(proteins)} proteins x {X.shape[1]} features, channel {args.channel}, {args.metric}")
+
+    timer = Timer().start()
+    engine = Similarity(X, metric=args.metric, block=args.block,
+                        dtype=np.float64 if args.float64 else np.float32)
+    write_info(args.output_dir, proteins, metric=args.metric, channel=args.channel, log=args.log,
+               top_k=args.top_k, closer_is_larger=engine.closer_is_larger)
+    if args.top_k > 0:
+        indices, values = engine.topk(args.top_k, workers=args.workers)
+        np.save(args.output_dir / "indices.npy", indices)
+        np.save(args.output_dir / "values.npy", values)
+    else:
+        engine.dense(args.output_dir / "matrix.npy", workers=args.workers)
+    timer.stop()
+    print(f"written to {args.output_dir} in {timer.elapsed_time}")
@@ -1,38 +1,144 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import sys
+import math
 import argparse
 from pathlib import Path
 
 from graphlet_helper.toolbox import listfile
+from graphlet_helper.scheduling import residue_count, task_cost, CostIndex, pack_longest_first, makespan
+from graphlet_helper.archive import CoordArchive, is_archive
+from graphlet_helper.manifest import Manifest
+from count_graphlets import modes, thresholds, add_sampling_arguments, SAMPLED_MODES
 
 script = ( Path(__file__).parent / "count_graphlets.py" ).resolve().absolute()
+batch_script = ( Path(__file__).parent / "batch_graphlets.py" ).resolve().absolute()
 
 def arguments():
     parser = argparse.ArgumentParser(description="generate disBatch taskfile for graphlets")
     parser.add_argument("listfile", type=Path, help="List of IDs")
-    parser.add_argument("input_dir", type=Path, help="Directory to look for IDs")
+    parser.add_argument("input_dir", type=Path, help="Directory to look for IDs, or a packed archive")
     parser.add_argument("output_dir", type=Path, help="Directory to place individual files")
-    parser.add_argument("-mode", choices=['grafene', 'orca'], default='orca')
+    parser.add_argument("-mode", type=modes, default=['orca'],
+                        help="Mode, comma-separated modes or all, see count_graphlets.py")
     parser.add_argument("-t", type=int, default=10, help="Contact map threshold")
+    parser.add_argument("--thresholds", type=str, default=None,
+                        help="Comma-separated thresholds, one sweep task per ID instead of -t")
+    parser.add_argument("--chunk-size", type=int, default=0,
+                        help="Emit one batch_graphlets.py task per this many IDs instead of one task per ID")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Worker processes per chunked task")
+    parser.add_argument("--balance", action='store_true', default=False,
+                        help="Estimate each ID's cost and emit tasks longest-first, packing chunks to "
+                             "similar total cost")
+    parser.add_argument("--cost-index", type=Path, default=None,
+                        help="Residue/edge count cache; with it, costs account for contact density "
+                             "(implies --balance)")
+    parser.add_argument("--slots", type=int, default=1,
+                        help="Concurrent disBatch tasks, used to report the predicted makespan")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Seconds a protein may take before its run fails")
+    parser.add_argument("--local", action='store_true', default=False,
+                        help="Also save per-residue orbit counts, see count_graphlets.py")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="Attempts per ID; IDs done, or failed this many times, in output_dir/manifest.tsv "
+                             "are left out of the taskfile")
+    add_sampling_arguments(parser)
     return parser.parse_args()
 
+def estimate_costs(inlist, input_dir, threshold, cost_index=None):
+    """Per-ID cost, from the cost index if given, from the tensor's shape otherwise"""
+    index = CostIndex(cost_index) if cost_index is not None else None
+    archive = CoordArchive(input_dir) if is_archive(input_dir) else None
+    costs = []
+    for ID in inlist:
+        input_file = input_dir / f"{ID}.pt"
+        try:
+            if index is not None and archive is not None:
+                costs.append(task_cost(*index.measure(ID, ID, threshold, load=archive.load)))
+            elif index is not None:
+                costs.append(task_cost(*index.measure(ID, input_file, threshold)))
+            elif archive is not None:
+                costs.append(task_cost(archive.shape(ID)[0]))
+            else:
+                costs.append(task_cost(residue_count(input_file)))
+        except (OSError, KeyError):
+            # missing inputs fail fast, their tasks are still emitted
+            costs.append(0.)
+    return costs
+
+def report(costs, slots):
+    """Prints the predicted makespan of the tasks, in the order they are emitted, to stderr"""
+    total = sum(costs)
+    predicted = makespan(costs, slots)
+    print(f"[I] {len(costs)} tasks, total cost {total:.4g}, predicted makespan {predicted:.4g} on "
+          f"{slots} slots (lower bound {max(total / slots, max(costs, default=0.)):.4g})", file=sys.stderr)
+
 if __name__ == '__main__':
     args = arguments()
     
-    mode = args.mode
+    mode = ','.join(args.mode)
     threshold = args.t
 
-    command_formatter = (f"python {script} ""{input_file} {output_file} "f"-t {threshold} -mode {mode}").format
+    # threshold (and sampling) options shared by every emitted command
+    threshold_flag = f"--thresholds {args.thresholds}" if args.thresholds else f"-t {threshold}"
+    if any(name in SAMPLED_MODES for name in args.mode):
+        threshold_flag += f" --samples {args.samples} --confidence {args.confidence}" + \
+                          (f" --budget {args.budget}" if args.budget is not None else "")
+    # every task records its outcome, so regenerating the taskfile after a run only emits what is left
+    manifest = Manifest(args.output_dir / "manifest.tsv")
+    threshold_flag += f" --manifest {manifest.filename}" + (f" --timeout {args.timeout}" if args.timeout else "") + \
+                      (" --local" if args.local else "")
+    command_formatter = (f"python {script} ""{input_file} {output_file} "f"{threshold_flag} -mode {mode}").format
+    archived = is_archive(args.input_dir)
+    if archived:
+        command_formatter = (f"python {script} ""{input_file} {output_file} "
+                             f"{threshold_flag} -mode {mode} --archive {args.input_dir}").format
     
     inlist = listfile.read(args.listfile)
+    todo = manifest.pending(inlist, args.mode, thresholds(args.thresholds) if args.thresholds else threshold,
+                            attempts=args.retries)
+    if len(todo) < len(inlist):
+        print(f"[I] {len(inlist) - len(todo)} IDs done or out of attempts in {manifest.filename}", file=sys.stderr)
+    inlist = todo
 
     args.output_dir.mkdir(exist_ok=True, parents=True)
 
-    for ID in inlist:
-        input_file  = args.input_dir / f"{ID}.pt"
-        output_file = args.output_dir / f"{ID}.npz"
-        cmd = command_formatter(input_file=input_file, output_file=output_file)
-        print(cmd)
+    balance = args.balance or args.cost_index is not None
+    if balance:
+        # a sweep's cost is dominated by its largest threshold
+        costs = estimate_costs(inlist, args.input_dir,
+                               max(map(float, args.thresholds.split(","))) if args.thresholds else threshold,
+                               cost_index=args.cost_index)
+
+    if args.chunk_size > 0:
+        chunk_dir = args.output_dir / "chunks"
+        chunk_dir.mkdir(exist_ok=True)
+        batch_formatter = (f"python {batch_script} ""{chunk_file} "f"{args.input_dir} {args.output_dir} "
+                           f"{threshold_flag} -mode {mode} -j {args.workers} --retries {args.retries}").format
+
+        if balance:
+            chunks = pack_longest_first(costs, math.ceil(len(inlist) / args.chunk_size))
+            report([sum(costs[i] for i in chunk) / args.workers for chunk in chunks], args.slots)
+            chunks = [[inlist[i] for i in chunk] for chunk in chunks]
+        else:
+            chunks = [inlist[start:start + args.chunk_size] for start in range(0, len(inlist), args.chunk_size)]
+
+        for k, chunk in enumerate(chunks):
+            chunk_file = chunk_dir / f"chunk_{k:05d}.txt"
+            listfile.write(chunk, chunk_file)
+            print(batch_formatter(chunk_file=chunk_file))
+    else:
+        if balance:
+            order = sorted(range(len(inlist)), key=lambda i: -costs[i])
+            report([costs[i] for i in order], args.slots)
+            inlist = [inlist[i] for i in order]
+
+        for ID in inlist:
+            input_file  = ID if archived else args.input_dir / f"{ID}.pt"
+            output_file = args.output_dir / f"{ID}.npz"
+            cmd = command_formatter(input_file=input_file, output_file=output_file)
+            print(cmd)
 
 
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Pack the coordinate / distance map files of a list into one memory-mapped archive
+
+The archive directory can then be given wherever an input directory of .pt files is expected
+(batch_graphlets.py, make_graphlet_tasks.py) or with --archive to count_graphlets.py.
+"""
+
+import argparse
+from pathlib import Path
+
+from graphlet_helper.toolbox import Timer, listfile
+from graphlet_helper.archive import pack, CoordArchive
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("listfile", type=Path, help="List of IDs")
+    parser.add_argument("input_dir", type=Path, help="Directory to look for IDs")
+    parser.add_argument("archive_dir", type=Path, help="Archive directory to write")
+    parser.add_argument("-j", "--workers", type=int, default=8, help="Reader threads")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = arguments()
+
+    proteins = listfile.read(args.listfile)
+    timer = Timer().start()
+    missing = pack(proteins, args.input_dir, args.archive_dir, workers=args.workers)
+    timer.stop()
+
+    archive = CoordArchive(args.archive_dir)
+    print(f"packed {len(archive)}/{len(proteins)} proteins ({archive.data.nbytes / 2**20:.1f} MiB) "
+          f"into {args.archive_dir} in {timer.elapsed_time}")
+    if missing:
+        listfile.write(missing, args.archive_dir / "missing.txt")
+        print(f"{len(missing)} missing, listed in {args.archive_dir / 'missing.txt'}")
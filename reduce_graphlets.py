@@ -6,49 +6,209 @@ Extract global graphlet degree vectors
 """
 
 import argparse
+import zipfile
+import tempfile
+import functools
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 from graphlet_helper.toolbox import listfile
+from graphlet_helper.reduced import ReducedStore
+from graphlet_helper.featurestore import read_rows, shard_files, channels as row_channels
 
 def arguments():
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("listfile", type=Path, help="Domain list")
     parser.add_argument("input_dir", type=Path, help="Input directory")
-    parser.add_argument("--output-npz", type=Path, help="final npz output path")
+    parser.add_argument("--output-dir", type=Path,
+                        help="Reduced store (see graphlet_helper/reduced.py) to keep; with --no-npz or --append "
+                             "it defaults to <input_dir>_reduced, otherwise the store is only a scratch copy "
+                             "of the npz export")
+    parser.add_argument("--output-npz", type=Path,
+                        help="Single npz export of the store (dense, float64), default <input_dir>.npz")
+    parser.add_argument("--no-npz", action='store_true', default=False,
+                        help="Only write the store, e.g. when the dense matrix wouldn't fit in memory")
+    parser.add_argument("--append", action='store_true', default=False,
+                        help="Add proteins missing from an existing store (and retry its masked ones)")
+    sharding = parser.add_mutually_exclusive_group()
+    sharding.add_argument("--shards", action='store_true', default=False,
+                          help="Read batch_graphlets.py shard_*.npz files instead of one npz per protein")
+    sharding.add_argument("--rows", action='store_true', default=False,
+                          help="Read batch_graphlets.py --rows shards (rows_*.npy, and the rows_*.part of killed "
+                               "workers) instead of one npz per protein")
+    parser.add_argument("--mode", default=None,
+                        help="Mode to extract from files holding several (count_graphlets.py -mode a,b)")
+    parser.add_argument("-j", "--workers", type=int, default=8, help="Reader threads")
     return parser.parse_args()
 
-def get_shape(filename):
-    data = np.load(filename)
-    mat = data['mat']
-    
-    nc, d = mat.shape
-    return nc, d
+def keys(mode=None):
+    """(channels, mat) keys of the features of `mode`, or of a single-mode file"""
+    return ('channels', 'mat') if mode is None else (f"{mode}_channels", f"{mode}_mat")
+
+def get_shape(filename, reader, mode=None):
+    """Channels and per-protein feature shape (thresholds, d) or (d,) of the first protein in a file"""
+    with np.load(filename) as data:
+        channels = list(data[keys(mode)[0]])
+    _, mat = reader(filename)[0]
+    *shape, nc, d = mat.shape
+    return channels, (*shape, d)
+
+def read_one(npz, mode=None):
+    """
+    returns:
+        :[(protein, mat)] of one per-protein npz, empty if it is missing or unreadable
+    """
+    try:
+        with np.load(npz) as data:
+            return [(npz.stem, data[keys(mode)[1]])]
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return []
+
+def read_shard(npz, mode=None):
+    """
+    returns:
+        :[(protein, mat)] of every protein in a batch_graphlets.py shard, empty if it is unreadable
+         (e.g. cut short by a killed run; its proteins are reported missing)
+    """
+    try:
+        with np.load(npz) as data:
+            mat = data[keys(mode)[1]]
+            return [(protein, mat[..., i, :]) for i, protein in enumerate(data['proteins'])]
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        return []
+
+def modes_of(source):
+    """Modes of a file holding several, None if it holds one or can't be read"""
+    try:
+        if source.suffix in ('.npy', '.part'):
+            names = read_rows(source)[0].dtype.names
+            return sorted({name.split('/')[0] for name in names if '/' in name}) or None
+        with np.load(source) as data:
+            return list(data['modes']) if 'modes' in data else None
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        return None
+
+def first_readable(sources, reader, input_dir, mode=None):
+    """
+    returns:
+        :the first source `reader` finds a protein in; exits saying why if there is none
+    """
+    for source in sources:
+        found = reader(source)
+        if found and len(found[0]):
+            return source
+    existing = [source for source in sources if source.exists()]
+    modes = modes_of(existing[0]) if existing else None
+    if modes and mode is None:
+        raise SystemExit(f"{input_dir} holds the modes {','.join(modes)}: pick one with --mode")
+    if modes and mode not in modes:
+        raise SystemExit(f"no mode {mode} in {input_dir}, which holds {','.join(modes)}")
+    raise SystemExit(f"nothing readable in {input_dir}: {len(existing)} of {len(sources)} inputs found")
+
+def read_row_shard(path, mode=None):
+    """
+    returns:
+        :(proteins, {channel: rows}) of a featurestore row shard, the rows memory-mapped; empty if
+         it is unreadable or doesn't hold `mode`
+    """
+    try:
+        rows, _ = read_rows(path)
+    except (OSError, ValueError, EOFError):
+        return [], {}
+    fields = row_channels(rows.dtype, mode)
+    if not fields:
+        # several modes and none picked, or not this one
+        return [], {}
+    return rows['protein'].astype(str).tolist(), {channel: rows[field] for field, channel in fields.items()}
+
+def take_rows(proteins, todo):
+    """Indices of the first row of every protein still to do, each taken off `todo`"""
+    keep = []
+    for i, protein in enumerate(proteins):
+        if protein in todo:
+            todo.discard(protein)
+            keep.append(i)
+    return keep
 
 if __name__ == '__main__':
     args = arguments()
-    
-    output_npz = args.output_npz
-    if output_npz is None:
-        output_npz = f"{args.input_dir.stem}.npz" 
+
+    output_npz = args.output_npz or Path(f"{args.input_dir.stem}.npz")
+    output_dir = args.output_dir
+    scratch = None
+    if output_dir is None and (args.no_npz or args.append):
+        output_dir = Path(f"{args.input_dir.stem}_reduced")
+    elif output_dir is None:
+        # only the npz was asked for: fill the store next to it and drop it once exported
+        scratch = tempfile.TemporaryDirectory(dir=output_npz.resolve().parent, prefix=f".{output_npz.stem}_")
+        output_dir = Path(scratch.name)
 
     proteins = listfile.read(args.listfile)
-    
-    N = len(proteins)
-    nc, d = get_shape(args.input_dir / f"{proteins[0]}.npz")
-        
-    final = np.zeros((nc, N, d))
-    for i, protein in enumerate(proteins):
-        npz = args.input_dir / f"{protein}.npz"
-        data = np.load(npz)
-        gdv = data['mat']
-        channels = data['channels']
 
-        for channel in range(nc):
-            final[channel, i, :] = gdv[channel, :]
+    if args.shards:
+        sources = sorted(args.input_dir.glob("shard_*.npz"))
+        reader = functools.partial(read_shard, mode=args.mode)
+    elif args.rows:
+        sources = shard_files(args.input_dir)
+        reader = functools.partial(read_row_shard, mode=args.mode)
+    else:
+        sources = [args.input_dir / f"{protein}.npz" for protein in proteins]
+        reader = functools.partial(read_one, mode=args.mode)
+
+    if args.append and (output_dir / "channels.txt").exists():
+        store = ReducedStore(output_dir)
+        todo = {protein for protein, filled in zip(store.proteins, store.mask) if not filled}
+        new = list(dict.fromkeys(protein for protein in proteins if protein not in store.row))
+        store.append(new)
+        todo.update(new)
+        if not (args.shards or args.rows):
+            sources = [args.input_dir / f"{protein}.npz" for protein in proteins if protein in todo]
+    else:
+        first = first_readable(sources, reader, args.input_dir, args.mode)
+        if args.rows:
+            _, columns = reader(first)
+            channels, shape = list(columns), next(iter(columns.values())).shape[1:]
+        else:
+            channels, shape = get_shape(first, reader, args.mode)
+        store = ReducedStore.create(output_dir, channels, shape)
+        store.append(list(dict.fromkeys(proteins)))
+        todo = set(store.proteins)
 
-        print(f"\r{80 * ' '}\rfilling ({i}/{N}, {d}) graphlet count mat", end='', flush=True)
+    N = len(todo)
+    filled = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for found in pool.map(reader, sources):
+            if args.rows:
+                # a shard's rows are copied a channel at a time, all of them at once if they're all wanted
+                shard_proteins, columns = found
+                keep = take_rows(shard_proteins, todo)
+                index = slice(None) if len(keep) == len(shard_proteins) else keep
+                store.write_rows([shard_proteins[i] for i in keep],
+                                 {channel: values[index] for channel, values in columns.items()})
+                filled += len(keep)
+                found = []
+            for protein, mat in found:
+                if protein not in todo:
+                    continue
+                store.write(protein, mat)
+                todo.discard(protein)
+                filled += 1
+            print(f"\r{80 * ' '}\rfilling ({filled}/{N}, {store.shape}) graphlet count mat", end='', flush=True)
+    store.flush()
 
-    print(f"\nSaving to {output_npz}")
-    np.savez_compressed(output_npz, proteins=proteins, channels=channels, mat=final)
+    print(f"\n{filled} filled, {len(todo)} missing, {int(np.sum(store.mask))}/{len(store.proteins)} in "
+          f"{output_npz if scratch is not None else output_dir}")
+    if scratch is None:
+        if todo:
+            listfile.write(sorted(todo), output_dir / "missing.txt")
+        else:
+            (output_dir / "missing.txt").unlink(missing_ok=True)
 
+    if not args.no_npz:
+        print(f"Saving to {output_npz}")
+        store.to_npz(output_npz)
+    if scratch is not None:
+        store = None
+        scratch.cleanup()
@@ -0,0 +1,46 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from graphlet_helper.toolbox import ContactGraphMaker  # noqa: E402
+from graphlet_helper.synthetic import random_backbone  # noqa: E402
+
+BIN = ROOT / "graphlet_helper" / "bin"
+
+def needs_bin(*names):
+    """Skips a test unless the GRAFENE / ORCA binaries it compares against can be executed"""
+    missing = [name for name in names if not os.access(BIN / name, os.X_OK)]
+    return pytest.mark.skipif(bool(missing), reason=f"missing binaries: {', '.join(missing)}")
+
+def random_graph(n, density, seed):
+    """Symmetric float32 CSR adjacency without self loops; sparse ones have isolated nodes"""
+    A = sp.random(n, n, density=density, random_state=seed, format='csr')
+    A = sp.csr_matrix((A + A.T) > 0, dtype=np.float32)
+    A.setdiag(0)
+    A.eliminate_zeros()
+    return A
+
+def backbone_graph(n, threshold=7., seed=0):
+    return ContactGraphMaker(threshold, selfloop=False)(random_backbone(n, seed=seed))
+
+GRAPHS = {
+    'triangle': sp.csr_matrix(np.array([[0, 1, 1], [1, 0, 1], [1, 1, 0]], dtype=np.float32)),
+    'path+isolated': sp.csr_matrix(np.array([[0, 1, 0, 0], [1, 0, 1, 0], [0, 1, 0, 0], [0, 0, 0, 0]],
+                                            dtype=np.float32)),
+    'random-sparse': random_graph(40, 0.04, seed=1),
+    'random-dense': random_graph(25, 0.3, seed=2),
+    'backbone-30': backbone_graph(30, seed=3),
+    'backbone-80': backbone_graph(80, seed=4),
+}
+
+@pytest.fixture(params=list(GRAPHS), ids=list(GRAPHS))
+def graph(request):
+    """Small contact and random graphs, the references of the native engines are checked on"""
+    return GRAPHS[request.param]
@@ -0,0 +1,50 @@
+"""Packed coordinate archive: round trip, zero-copy loading by ID, unreadable inputs"""
+
+import numpy as np
+import pytest
+
+from graphlet_helper.archive import pack, CoordArchive
+from graphlet_helper.compute_orca_graphlets import NativeORCARunner
+from graphlet_helper.synthetic import random_backbone
+
+torch = pytest.importorskip("torch")
+
+@pytest.fixture
+def packed(tmp_path):
+    coords = {f"p{i}": random_backbone(n, seed=i) for i, n in enumerate([20, 75, 3, 140])}
+    (tmp_path / "pt").mkdir()
+    for ID, x in coords.items():
+        torch.save(torch.from_numpy(x), tmp_path / "pt" / f"{ID}.pt")
+    (tmp_path / "pt" / "garbage.pt").write_bytes(b'not a tensor file')
+    (tmp_path / "pt" / "torn.pt").write_bytes((tmp_path / "pt" / "p1.pt").read_bytes()[:200])
+    torch.save({'coords': torch.from_numpy(coords['p0'])}, tmp_path / "pt" / "dict.pt")
+    IDs = ['p0', 'garbage', 'p1', 'absent', 'torn', 'p2', 'dict', 'p3']
+    missing = pack(IDs, tmp_path / "pt", tmp_path / "archive", workers=3)
+    return tmp_path, coords, missing
+
+def test_round_trip(packed):
+    tmp_path, coords, missing = packed
+    assert missing == ['garbage', 'absent', 'torn', 'dict']
+    archive = CoordArchive(tmp_path / "archive")
+    assert archive.proteins == list(coords) and len(archive) == 4
+    for ID, x in coords.items():
+        assert archive.shape(ID) == x.shape
+        assert np.array_equal(archive[ID], x.astype(np.float32))
+        # by ID or by the path it stands in for
+        assert np.array_equal(archive.load(tmp_path / "pt" / f"{ID}.pt"), archive[ID])
+
+def test_zero_copy(packed):
+    tmp_path, coords, _ = packed
+    archive = CoordArchive(tmp_path / "archive")
+    x = archive.load('p1')
+    assert np.shares_memory(x, archive.data)
+    # copy-on-write: the view can be written to, the archive stays as it was
+    x[:] = 0
+    assert np.array_equal(CoordArchive(tmp_path / "archive")['p1'], coords['p1'].astype(np.float32))
+
+def test_runner_reads_archive(packed):
+    tmp_path, _, _ = packed
+    expected = NativeORCARunner(8).run(tmp_path / "pt" / "p3.pt")
+    result = NativeORCARunner(8).read_from(CoordArchive(tmp_path / "archive")).run('p3')
+    assert result['protein'] == 'p3'
+    assert np.array_equal(result['mat'], expected['mat'])
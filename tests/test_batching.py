@@ -0,0 +1,31 @@
+"""Bucketed contact graphs against ContactGraphMaker / ThresholdSweep"""
+
+import numpy as np
+import pytest
+
+from graphlet_helper.toolbox import ContactGraphMaker, ThresholdSweep
+from graphlet_helper.synthetic import random_backbone
+
+pytest.importorskip("torch")
+from graphlet_helper.batching import BucketedContacts  # noqa: E402
+
+@pytest.fixture(scope='module')
+def coords():
+    rng = np.random.default_rng(0)
+    # a few chains longer than max_length go the per-protein way
+    lengths = [*rng.integers(10, 200, 40), 500, 20]
+    return [random_backbone(int(n), seed=i) for i, n in enumerate(lengths)]
+
+def same(a, b):
+    return a.shape == b.shape and (a != b).nnz == 0
+
+def test_single_threshold(coords):
+    maker = ContactGraphMaker(8., selfloop=False)
+    graphs = BucketedContacts(8., bucket=16, max_elements=1 << 18)(coords)
+    assert all(same(graph, maker(x)) for graph, x in zip(graphs, coords))
+
+def test_sweep(coords):
+    sweep = ThresholdSweep([10., 6., 8.], selfloop=False)
+    graphs = BucketedContacts([10., 6., 8.])(coords)
+    for graph, x in zip(graphs, coords):
+        assert all(same(a, b) for a, b in zip(graph, sweep(x)))
@@ -0,0 +1,64 @@
+"""Result cache: keys, hits and misses, LRU eviction"""
+
+import os
+
+import numpy as np
+
+from graphlet_helper.cache import ResultCache
+from graphlet_helper.compute_orca_graphlets import NativeORCARunner
+
+from conftest import GRAPHS
+
+def entry(seed):
+    return dict(channels=np.array(['raw']), mat=np.random.default_rng(seed).random((1, 4096)))
+
+def test_key():
+    cache_key = ResultCache.key
+    A, B = GRAPHS['backbone-30'], GRAPHS['backbone-80']
+    key = cache_key(None, A, 10, 'NativeORCARunner', 'v1')
+    assert key == cache_key(None, A.copy(), 10., 'NativeORCARunner', 'v1')
+    # the pattern, not the stored values or their order, is hashed
+    assert key == cache_key(None, (A * 2).tocsr(), 10, 'NativeORCARunner', 'v1')
+    others = [cache_key(None, B, 10, 'NativeORCARunner', 'v1'), cache_key(None, A, 8, 'NativeORCARunner', 'v1'),
+              cache_key(None, A, 10, 'CliqueRunner', 'v1'), cache_key(None, A, 10, 'NativeORCARunner', 'v2')]
+    assert len({key, *others}) == 5
+
+def test_hit_and_miss(tmp_path):
+    cache = ResultCache(tmp_path)
+    assert cache.get('ab' * 32) is None
+    cache.put('ab' * 32, entry(0))
+    result = cache.get('ab' * 32)
+    assert np.array_equal(result['mat'], entry(0)['mat']) and result['channels'].tolist() == ['raw']
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = ResultCache(tmp_path)
+    for key, data in [('cd' * 32, b'not an npz'), ('ef' * 32, b'PK\x03\x04 torn zip')]:
+        cache._path(key).parent.mkdir(exist_ok=True)
+        cache._path(key).write_bytes(data)
+        assert cache.get(key) is None
+    assert cache.misses == 2
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(tmp_path)
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, entry(i))
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    size = cache._path(keys[0]).stat().st_size
+    cache.max_bytes = int(3.5 * size)
+    # the oldest entry is used again, so the second one is the least recently used
+    assert cache.get(keys[0]) is not None
+    cache.put("99" * 32, entry(9))
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) is not None for key in [keys[0], keys[2], "99" * 32])
+    assert cache.stats['bytes'] <= cache.max_bytes
+
+def test_runner_counts_once(tmp_path):
+    runner = NativeORCARunner(10)
+    runner.cache = ResultCache(tmp_path)
+    first = runner.cached_count(GRAPHS['backbone-80'], 'a', 10)
+    second = runner.cached_count(GRAPHS['backbone-80'], 'b', 10)
+    assert (runner.cache.hits, runner.cache.misses) == (1, 1)
+    assert second['protein'] == 'b' and second['channels'] == first['channels']
+    assert np.array_equal(second['mat'], first['mat'])
@@ -0,0 +1,30 @@
+"""Bitset clique engine against networkx, and CliqueRunner's binning against the networkx-based one"""
+
+import numpy as np
+import pytest
+
+from graphlet_helper import cliques
+from graphlet_helper.count_cliques import CliqueRunner
+
+nx = pytest.importorskip("networkx")
+
+def test_maximal_clique_sizes(graph):
+    expected = np.zeros(9, dtype=np.int64)
+    for clique in nx.find_cliques(nx.from_scipy_sparse_array(graph)):
+        expected[min(len(clique), 8)] += 1
+    assert np.array_equal(cliques.maximal_clique_sizes(graph, K=8), expected)
+
+def test_clique_counts(graph):
+    expected = np.zeros(6, dtype=np.int64)
+    for clique in nx.enumerate_all_cliques(nx.from_scipy_sparse_array(graph)):
+        if len(clique) <= 5:
+            expected[len(clique)] += 1
+    assert np.array_equal(cliques.clique_counts(graph, K=5), expected)
+
+def test_runner_binning(graph):
+    # the networkx-based runner: counts[sz - 2] of every maximal clique up to K, isolated nodes in the last bin
+    expected = np.zeros(7, dtype=np.int64)
+    for clique in nx.find_cliques(nx.from_scipy_sparse_array(graph)):
+        if len(clique) <= 8:
+            expected[len(clique) - 2] += 1
+    assert np.array_equal(CliqueRunner(6).clique_counts(graph), expected)
@@ -0,0 +1,18 @@
+"""In-process network descriptors against GRAFENE's avg-* / max-* / network-density / component binaries"""
+
+import numpy as np
+
+from graphlet_helper.descriptors import network_descriptors, binary_descriptors, FEATURES
+from graphlet_helper.count_descriptors import DescriptorRunner
+
+from conftest import needs_bin
+
+@needs_bin('avg-clusc', 'avg-degree', 'avg-closec', 'avg-diameter', 'max-diameter', 'max-distance',
+           'network-density', 'component')
+def test_descriptors_match_binaries(graph):
+    np.testing.assert_allclose(network_descriptors(graph), binary_descriptors(graph), rtol=1e-5, atol=1e-6)
+
+def test_runner(graph):
+    result = DescriptorRunner(8).count(graph, 'graph')
+    assert result['channels'] == ['descriptors'] and list(result['features']) == list(FEATURES)
+    assert np.array_equal(result['mat'][0], network_descriptors(graph))
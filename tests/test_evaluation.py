@@ -0,0 +1,84 @@
+"""Histogram PR / ROC areas against exact, sorted ones"""
+
+import numpy as np
+import pytest
+from scipy.stats import rankdata
+
+from graphlet_helper.evaluation import Evaluation, aucs, area
+from graphlet_helper.similarity import Similarity
+
+N, CLASSES = 150, 6
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, CLASSES, N)
+    X = rng.random((N, 10)) + 0.6 * np.eye(CLASSES, 10)[codes]
+    proteins = [f"p{i}" for i in range(N)]
+    # a few proteins without a label are left out
+    labels = {protein: f"c{code}" for protein, code in zip(proteins, codes) if protein not in ('p3', 'p70')}
+    return X, proteins, labels
+
+def exact(scores, same, positives, negatives):
+    """(AUPR, AUROC) from every distinct score of the pairs, sorted"""
+    order = np.argsort(-scores, kind='stable')
+    scores, same = scores[order], same[order]
+    last = np.r_[scores[1:] != scores[:-1], True]
+    TP, FP = np.cumsum(same)[last], np.cumsum(~same)[last]
+    return (area(np.r_[0., TP / positives], np.r_[1., TP / (TP + FP)]),
+            area(np.r_[0., FP / negatives], np.r_[0., TP / positives]))
+
+def labelled_pairs(S, proteins, labels, upper):
+    keep = np.array([protein in labels for protein in proteins])
+    codes = np.array([labels.get(protein) for protein in proteins])
+    i, j = np.triu_indices(N, 1) if upper else np.nonzero(~np.eye(N, dtype=bool))
+    valid = keep[i] & keep[j]
+    return S[i[valid], j[valid]], codes[i[valid]] == codes[j[valid]]
+
+@pytest.mark.parametrize("metric", ['cosine', 'euclidean'])
+def test_matrix(data, metric, tmp_path):
+    X, proteins, labels = data
+    similarity = Similarity(X, metric=metric, dtype=np.float64)
+    similarity.dense(tmp_path / "matrix.npy")
+    S = np.load(tmp_path / "matrix.npy")
+    result = dict(proteins=proteins, matrix=S, metric=metric, closer_is_larger=similarity.closer_is_larger)
+    curve, = Evaluation([result], labels, chunk=1000)()
+
+    scores, same = labelled_pairs(S, proteins, labels, upper=True)
+    scores = scores if similarity.closer_is_larger else -scores
+    aupr, auroc = exact(scores, same, same.sum(), (~same).sum())
+    assert (curve['TP'][-1], curve['FP'][-1]) == (same.sum(), (~same).sum())
+    assert np.allclose(aucs(curve), (aupr, auroc), atol=1e-4)
+    # Mann-Whitney U, ties counted half
+    ranks = rankdata(scores)
+    P, Q = same.sum(), (~same).sum()
+    assert auroc == pytest.approx((ranks[same].sum() - P * (P + 1) / 2) / (P * Q))
+
+def test_topk(data):
+    X, proteins, labels = data
+    similarity = Similarity(X, dtype=np.float64)
+    indices, values = similarity.topk(10)
+    result = dict(proteins=proteins, indices=indices, values=values, metric='cosine', closer_is_larger=True)
+    evaluation = Evaluation([result], labels, chunk=100)
+    curve, = evaluation()
+
+    S = np.full((N, N), -np.inf)
+    np.put_along_axis(S, indices, values, axis=1)
+    scores, same = labelled_pairs(S, proteins, labels, upper=False)
+    kept = np.isfinite(scores)
+    # partial curves: recall and FP rate out of every ordered labelled pair
+    positives, negatives = evaluation.totals(result)
+    assert curve['TP'][-1] == same[kept].sum() < positives
+    assert np.allclose(aucs(curve), exact(scores[kept], same[kept], positives, negatives), atol=1e-4)
+
+def test_results_share_a_pass(data, tmp_path):
+    X, proteins, labels = data
+    results = []
+    for channel in range(2):
+        Similarity(X[:, channel * 5:], dtype=np.float64).dense(tmp_path / f"{channel}.npy")
+        results.append(dict(proteins=proteins, matrix=np.load(tmp_path / f"{channel}.npy"), metric='cosine',
+                            closer_is_larger=True))
+    together = Evaluation(results, labels, chunk=1000)()
+    for result, curve in zip(results, together):
+        alone, = Evaluation([result], labels)()
+        assert aucs(curve) == aucs(alone)
@@ -0,0 +1,105 @@
+"""Row shards against one npz per protein, through reduce_graphlets.py"""
+
+import sys
+import subprocess
+
+import numpy as np
+import pytest
+
+from graphlet_helper.featurestore import RowShardWriter, RowShards, read_rows
+from graphlet_helper.reduced import load_reduced
+from graphlet_helper.toolbox import listfile
+
+from conftest import ROOT
+
+def make_results(n, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for i in range(n):
+        raw = rng.integers(0, 10**6, 30).astype(np.float64)
+        results.append(dict(channels=['raw', 'normed'], mat=np.stack([raw, raw / raw.sum()]),
+                            ci_mat=np.stack([0.9 * raw, 1.1 * raw]), confidence=0.95, protein=f"p{i:03d}"))
+    return results
+
+@pytest.fixture
+def outputs(tmp_path):
+    results = make_results(12)
+    (tmp_path / "npz").mkdir()
+    (tmp_path / "rows").mkdir()
+    for result in results:
+        np.savez_compressed(tmp_path / "npz" / f"{result['protein']}.npz", **result)
+    sealed = RowShardWriter(tmp_path / "rows", name="a")
+    for result in results[:7]:
+        sealed.add(result)
+    sealed.close()
+    # a killed worker: rows flushed, shard never sealed, half a row at the end
+    killed = RowShardWriter(tmp_path / "rows", name="b")
+    for result in results[7:]:
+        killed.add(result)
+    killed.file.write(b'\0' * 10)
+    killed.file.close()
+    listfile.write([result['protein'] for result in results] + ["absent"], tmp_path / "list.txt")
+    return tmp_path, results
+
+def reduce(tmp_path, input_dir, output_dir, *flags):
+    subprocess.run([sys.executable, ROOT / "reduce_graphlets.py", tmp_path / "list.txt", input_dir,
+                    "--output-dir", output_dir, *flags], check=True, capture_output=True, cwd=tmp_path)
+    return load_reduced(output_dir)
+
+def test_reduce_rows_matches_npz(outputs):
+    tmp_path, results = outputs
+    expected = reduce(tmp_path, tmp_path / "npz", tmp_path / "from_npz")
+    reduced = reduce(tmp_path, tmp_path / "rows", tmp_path / "from_rows", "--rows")
+    assert reduced['proteins'] == expected['proteins']
+    assert reduced['channels'] == expected['channels'] == ['raw', 'normed']
+    assert np.array_equal(reduced['mask'], expected['mask']) and not reduced['mask'][-1]
+    for channel in expected['channels']:
+        assert reduced[channel].dtype == expected[channel].dtype
+        assert np.array_equal(reduced[channel], expected[channel])
+    # the default dense export
+    assert (tmp_path / "npz.npz").exists()
+
+def test_shards_keep_results(outputs):
+    tmp_path, results = outputs
+    shards = RowShards(tmp_path / "rows")
+    assert shards.proteins == [result['protein'] for result in results]
+    for result in results:
+        row = shards[result['protein']]
+        assert np.array_equal(row['mat'][0], result['mat'][0])
+        np.testing.assert_allclose(row['mat'][1], result['mat'][1], rtol=1e-6)
+        assert np.array_equal(row['ci_mat'], result['ci_mat'])
+    rows, meta = read_rows(tmp_path / "rows" / "rows_a.npy")
+    assert rows.shape == (7,) and meta == dict(channels=['raw', 'normed'], confidence=0.95)
+
+def test_rejects_mismatched_rows(tmp_path):
+    writer = RowShardWriter(tmp_path, name="c")
+    result = make_results(1)[0]
+    writer.add(result)
+    with pytest.raises(ValueError):
+        writer.add(dict(result, channels=['raw'], mat=result['mat'][:1]))
+    with pytest.raises(ValueError):
+        writer.add(dict(result, ci_mat=result['ci_mat'][:1]))
+    assert writer.close() == tmp_path / "rows_c.npy"
+    assert read_rows(tmp_path / "rows_c.npy")[0].shape == (1,)
+
+def test_killed_while_sealing(tmp_path, monkeypatch):
+    from graphlet_helper import featurestore
+
+    results = [dict(result, features=[f"feature {j}" for j in range(200)]) for result in make_results(3)]
+    writer = RowShardWriter(tmp_path, name="d")
+    for result in results:
+        writer.add(result)
+
+    def killed(*args):
+        raise KeyboardInterrupt
+
+    # the footer, longer than a row, is written but the shard never renamed
+    monkeypatch.setattr(featurestore.os, 'replace', killed)
+    with pytest.raises(KeyboardInterrupt):
+        writer.close()
+    monkeypatch.undo()
+    size = (tmp_path / "rows_d.part").stat().st_size - featurestore.header_bytes(writer.dtype)
+    assert size // writer.dtype.itemsize > 3
+    rows, _ = read_rows(tmp_path / "rows_d.part")
+    assert rows['protein'].astype(str).tolist() == ['p000', 'p001', 'p002']
+    assert RowShards(tmp_path).proteins == ['p000', 'p001', 'p002']
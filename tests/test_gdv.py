@@ -0,0 +1,65 @@
+"""Per-residue orbit counts: compact storage, load_gdv, and the global counts summed from them"""
+
+import sys
+import subprocess
+
+import numpy as np
+import pytest
+
+from graphlet_helper.gdv import compact, load_gdv
+from graphlet_helper.orca_native import orbit_counts
+from graphlet_helper.compute_orca_graphlets import count_graphlets
+from graphlet_helper.synthetic import random_backbone
+
+from conftest import ROOT
+
+# the per-graphlet orbit lists and sizes count_graphlets summed over before the membership matrix
+GRAPHLETS = [([0], 2), ([1, 2], 3), ([3], 3), ([4, 5], 4), ([6, 7], 4), ([8], 4), ([9, 10, 11], 4), ([12, 13], 4),
+             ([14], 4), ([15, 16, 17], 5), ([18, 19, 20, 21], 5), ([22, 23], 5), ([24, 25, 26], 5),
+             ([27, 28, 29, 30], 5), ([31, 32, 33], 5), ([34], 5), ([35, 36, 37, 38], 5), ([39, 40, 41, 42], 5),
+             ([43, 44], 5), ([45, 46, 47, 48], 5), ([49, 50], 5), ([51, 52, 53], 5), ([54, 55], 5),
+             ([56, 57, 58], 5), ([59, 60, 61], 5), ([62, 63, 64], 5), ([65, 66, 67], 5), ([68, 69], 5),
+             ([70, 71], 5), ([72], 5)]
+
+def test_graphlet_counts(graph):
+    gdv = orbit_counts(graph)
+    expected = np.asarray([float(gdv[:, idx].sum()) / nodes for idx, nodes in GRAPHLETS], dtype=np.int64)
+    assert np.array_equal(count_graphlets(gdv), expected)
+
+def test_compact(graph):
+    gdv = orbit_counts(graph)
+    assert compact(gdv).dtype == np.uint32 and np.array_equal(compact(gdv), gdv)
+    with pytest.raises(OverflowError):
+        compact(np.array([[2**32]]))
+
+@pytest.fixture(scope='module')
+def infile(tmp_path_factory):
+    path = tmp_path_factory.mktemp("gdv") / "backbone.npy"
+    np.save(path, random_backbone(60, seed=3))
+    return path
+
+def count(infile, outfile, *flags):
+    subprocess.run([sys.executable, ROOT / "count_graphlets.py", infile, outfile, "-t", "8", *flags],
+                   check=True, capture_output=True)
+    return outfile
+
+def test_load_gdv(infile, tmp_path):
+    from graphlet_helper.toolbox import ContactGraphMaker
+
+    expected = orbit_counts(ContactGraphMaker(8, selfloop=False)(np.load(infile)))
+    gdv = load_gdv(count(infile, tmp_path / "one.npz", "-mode", "orca-native", "--local"))
+    assert gdv.dtype == np.uint32 and np.array_equal(gdv, expected)
+    with np.load(tmp_path / "one.npz") as data:
+        assert np.array_equal(data['mat'][0], count_graphlets(gdv))
+
+    several = count(infile, tmp_path / "several.npz", "-mode", "orca-native,clique", "--local")
+    assert np.array_equal(load_gdv(several, mode='orca-native'), expected)
+    with pytest.raises(KeyError):
+        load_gdv(several, mode='clique')
+
+    sweep = load_gdv(count(infile, tmp_path / "sweep.npz", "-mode", "orca-native", "--local",
+                           "--thresholds", "6,8"))
+    assert sweep.shape == (2, 60, 73) and np.array_equal(sweep[1], expected)
+
+    with pytest.raises(KeyError):
+        load_gdv(count(infile, tmp_path / "global.npz", "-mode", "orca-native"))
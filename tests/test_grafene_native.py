@@ -0,0 +1,14 @@
+"""grafene-native against GRAFENE's ncount-ordered + normalize-graphlets"""
+
+import numpy as np
+
+from graphlet_helper.compute_grafene_features import GRAFENERunner, NativeGRAFENERunner
+
+from conftest import needs_bin
+
+@needs_bin('ncount-ordered', 'normalize-graphlets')
+def test_grafene_native_matches_binaries(graph):
+    expected = GRAFENERunner().count(graph, 'graph')['mat']
+    native = NativeGRAFENERunner().count(graph, 'graph')['mat']
+    assert np.array_equal(native[0], expected[0])
+    np.testing.assert_allclose(native[1], expected[1], rtol=1e-5, atol=1e-9)
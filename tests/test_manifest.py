@@ -0,0 +1,128 @@
+"""Campaign manifest: done / skip, bounded retries and time limits"""
+
+import sys
+import time
+import threading
+import subprocess
+
+import numpy as np
+import pytest
+
+from graphlet_helper.manifest import Manifest, DONE, FAILED, MISSING, time_limit
+from graphlet_helper.toolbox import MultiRunner
+from graphlet_helper.synthetic import random_backbone
+
+from conftest import ROOT, random_graph
+from count_graphlets import make_runner
+
+def test_record_and_pending(tmp_path):
+    manifest = Manifest(tmp_path / "manifest.tsv")
+    manifest.record('a', ['orca', 'clique'], 10, DONE, 1.5)
+    manifest.record('b', ['orca', 'clique'], 10, FAILED, 2., "ValueError: bad\tinput\n")
+    manifest.record('c', ['orca', 'clique'], 10, MISSING)
+    manifest.record('b', ['orca', 'clique'], 10, FAILED, 2.)
+    # a line cut short by a killed writer
+    with open(tmp_path / "manifest.tsv", 'a') as f:
+        f.write("d\torca,clique\t10.0\tdo")
+
+    manifest = Manifest(tmp_path / "manifest.tsv")
+    assert manifest.done('a', 'orca,clique', 10.) and not manifest.done('b', ['orca', 'clique'], 10)
+    assert manifest.get('b', ['orca', 'clique'], 10).attempts == 2
+    assert manifest.get('d', ['orca', 'clique'], 10) is None
+    assert manifest.pending(['a', 'b', 'c', 'd', 'c'], ['orca', 'clique'], 10, attempts=2) == ['c', 'd']
+    # other keys are other campaigns
+    assert manifest.pending(['a'], ['orca'], 10) == ['a'] and manifest.pending(['a'], ['orca', 'clique'], [8, 10])
+    assert manifest.summary() == {DONE: 1, FAILED: 1, MISSING: 1}
+    assert manifest.mean_seconds() == 1.5
+
+def test_time_limit():
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        with time_limit(0.2):
+            time.sleep(5)
+    assert time.perf_counter() - start < 1
+    with time_limit(None):
+        time.sleep(0.01)
+
+class Slow(object):
+    """Stands in for a runner counting for `seconds`, in Python steps"""
+    cache = metrics = timeout = None
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.steps = 0
+
+    def cached_count(self, adjmat, protein, threshold):
+        for _ in range(int(self.seconds / 0.01)):
+            time.sleep(0.01)
+            self.steps += 1
+        return dict(channels=['raw'], mat=np.zeros((1, 1)), protein=protein)
+
+def test_multi_mode_timeout():
+    runners = {'a': Slow(5), 'b': Slow(5)}
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        with time_limit(0.5):
+            MultiRunner(runners).cached_count(None, 'p', 10)
+    assert time.perf_counter() - start < 1
+    # and the modes stop counting too
+    time.sleep(0.3)
+    steps = [runner.steps for runner in runners.values()]
+    time.sleep(0.3)
+    assert [runner.steps for runner in runners.values()] == steps and max(steps) < 100
+    assert threading.active_count() == 1
+
+def test_multi_mode_engines_timeout():
+    # the in-process engines of `all` take several seconds on this graph
+    runner = make_runner(['orca-native', 'grafene-native', 'clique', 'descriptors'], 10)
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        with time_limit(0.5):
+            runner.cached_count(random_graph(200, 0.2, seed=0), 'p', 10)
+    assert time.perf_counter() - start < 1.5
+
+def test_multi_mode_errors():
+    class Failing(Slow):
+        def cached_count(self, adjmat, protein, threshold):
+            raise ValueError("bad graph")
+
+    with pytest.raises(ValueError, match="bad graph"):
+        MultiRunner({'a': Slow(0.05), 'b': Failing(0)}).cached_count(None, 'p', 10)
+    result = MultiRunner({'a': Slow(0.05), 'b': Slow(0.01)}).cached_count(None, 'p', 10)
+    assert result['modes'] == ['a', 'b'] and result['b_channels'] == ['raw']
+
+def batch(tmp_path, *flags):
+    return subprocess.run([sys.executable, ROOT / "batch_graphlets.py", tmp_path / "list.txt", tmp_path / "inputs",
+                           tmp_path / "out", "-mode", "orca-native,clique", "-j", "1", *flags],
+                          check=True, capture_output=True, text=True)
+
+def test_batch_resume(tmp_path):
+    torch = pytest.importorskip("torch")
+    (tmp_path / "inputs").mkdir()
+    for i in range(3):
+        torch.save(torch.from_numpy(random_backbone(40, seed=i)), tmp_path / "inputs" / f"p{i}.pt")
+    (tmp_path / "inputs" / "torn.pt").write_bytes(b'not a tensor')
+    # a distance map with a dense contact graph, which takes far longer than the limit to count
+    D = np.where(random_graph(200, 0.2, seed=0).toarray() > 0, 1., 20.)
+    np.fill_diagonal(D, 0)
+    torch.save(torch.from_numpy(D), tmp_path / "inputs" / "dense.pt")
+    (tmp_path / "list.txt").write_text("p0\np1\ntorn\nabsent\ndense\np2\n")
+
+    start = time.perf_counter()
+    batch(tmp_path, "--retries", "2", "--timeout", "1")
+    assert time.perf_counter() - start < 20
+    manifest = Manifest(tmp_path / "out" / "manifest.tsv")
+    key = (['orca-native', 'clique'], 10)
+    assert [ID for ID in ['p0', 'p1', 'p2'] if manifest.done(ID, *key)] == ['p0', 'p1', 'p2']
+    # failures are retried up to --retries attempts, a missing input is not retried right away
+    assert (manifest.get('torn', *key).status, manifest.get('torn', *key).attempts) == (FAILED, 2)
+    assert (manifest.get('dense', *key).attempts, manifest.get('dense', *key).error) == (2, "TimeoutError: exceeded 1s")
+    assert (manifest.get('absent', *key).status, manifest.get('absent', *key).attempts) == (MISSING, 1)
+    assert (tmp_path / "out" / "failed_list.txt").read_text().split() == ['torn', 'absent', 'dense']
+
+    # a rerun only tries the missing input again; done and exhausted IDs are skipped
+    (tmp_path / "out" / "p0.npz").unlink()
+    output = batch(tmp_path, "--retries", "2", "--timeout", "1").stdout
+    assert "6 IDs, 5 done or out of attempts" in output
+    manifest = Manifest(tmp_path / "out" / "manifest.tsv")
+    assert manifest.get('absent', *key).attempts == 2 and not (tmp_path / "out" / "p0.npz").exists()
@@ -0,0 +1,14 @@
+"""orca-native against orca.exe"""
+
+import numpy as np
+
+from graphlet_helper.compute_orca_graphlets import ORCARunner, NativeORCARunner
+
+from conftest import needs_bin
+
+@needs_bin('orca.exe')
+def test_orca_native_matches_orca_exe(graph):
+    expected = ORCARunner(local=True).count(graph, 'graph')
+    native = NativeORCARunner(local=True).count(graph, 'graph')
+    assert np.array_equal(native['gdv'], expected['gdv'])
+    assert np.array_equal(native['mat'], expected['mat'])
@@ -0,0 +1,86 @@
+"""Reduced store and reduce_graphlets.py: missing inputs, --append, the npz export"""
+
+import sys
+import subprocess
+
+import numpy as np
+import pytest
+
+from graphlet_helper.reduced import ReducedStore, load_reduced
+from graphlet_helper.toolbox import listfile
+
+from conftest import ROOT
+
+def result(i):
+    raw = np.arange(30, dtype=np.float64) * (i + 1)
+    return np.stack([raw, raw / raw.sum()])
+
+def test_store(tmp_path):
+    store = ReducedStore.create(tmp_path / "store", ['raw', 'normed'], (30,))
+    store.append(['a', 'b'])
+    store.write('b', result(1))
+    assert store.append(['c']) == 2
+    store.write('c', result(2))
+    store.flush()
+    reduced = load_reduced(tmp_path / "store")
+    assert reduced['proteins'] == ['a', 'b', 'c'] and reduced['mask'].tolist() == [False, True, True]
+    assert reduced['raw'].dtype == np.int64 and reduced['normed'].dtype == np.float32
+    assert np.array_equal(reduced['raw'][1:], [result(1)[0], result(2)[0]]) and not reduced['raw'][0].any()
+    store.to_npz(tmp_path / "reduced.npz")
+    with np.load(tmp_path / "reduced.npz") as data:
+        assert data['mat'].shape == (2, 3, 30)
+        np.testing.assert_allclose(data['mat'][:, 2], result(2), rtol=1e-6)
+
+def test_create_replaces_store(tmp_path):
+    ReducedStore.create(tmp_path, ['raw', 'normed'], (30,))
+    ReducedStore.create(tmp_path, ['descriptors'], (12,))
+    assert sorted(path.name for path in tmp_path.glob("*.npy")) == ['descriptors.npy', 'mask.npy']
+
+@pytest.fixture
+def inputs(tmp_path):
+    (tmp_path / "counts").mkdir()
+    for i, protein in enumerate(['p0', 'p1', 'p2', 'p3']):
+        if protein != 'p2':
+            np.savez(tmp_path / "counts" / f"{protein}.npz", channels=['raw', 'normed'], mat=result(i),
+                     protein=protein)
+    listfile.write(['p0', 'p1', 'p2'], tmp_path / "list.txt")
+    return tmp_path
+
+def reduce(cwd, *args):
+    return subprocess.run([sys.executable, ROOT / "reduce_graphlets.py", *args], cwd=cwd,
+                          check=True, capture_output=True, text=True)
+
+def test_default_writes_only_the_npz(inputs):
+    reduce(inputs, "list.txt", "counts")
+    assert sorted(path.name for path in inputs.iterdir()) == ['counts', 'counts.npz', 'list.txt']
+    with np.load(inputs / "counts.npz") as data:
+        assert data['proteins'].tolist() == ['p0', 'p1', 'p2'] and data['mask'].tolist() == [True, True, False]
+        assert not data['mat'][:, 2].any()
+
+def test_append(inputs):
+    reduce(inputs, "list.txt", "counts", "--output-dir", "store", "--no-npz")
+    assert listfile.read(inputs / "store" / "missing.txt") == ['p2']
+    raw = np.array(load_reduced(inputs / "store")['raw'])
+
+    # p2 turns up and p3 joins the list: only they are read
+    np.savez(inputs / "counts" / "p2.npz", channels=['raw', 'normed'], mat=result(2), protein='p2')
+    (inputs / "counts" / "p0.npz").unlink()
+    listfile.write(['p0', 'p1', 'p2', 'p3'], inputs / "list.txt")
+    reduce(inputs, "list.txt", "counts", "--output-dir", "store", "--append")
+    reduced = load_reduced(inputs / "store")
+    assert reduced['proteins'] == ['p0', 'p1', 'p2', 'p3'] and reduced['mask'].all()
+    assert np.array_equal(reduced['raw'][:2], raw[:2])
+    assert np.array_equal(reduced['raw'][2:], [result(2)[0], result(3)[0]])
+    assert not (inputs / "store" / "missing.txt").exists()
+    with np.load(inputs / "counts.npz") as data:
+        assert data['mask'].all() and np.array_equal(data['mat'][0], reduced['raw'])
+
+def test_multi_mode_needs_mode(inputs):
+    np.savez(inputs / "counts" / "p0.npz", modes=['clique'], clique_channels=['raw'], clique_mat=result(0)[:1])
+    listfile.write(['p0'], inputs / "list.txt")
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        reduce(inputs, "list.txt", "counts")
+    assert "pick one with --mode" in error.value.stderr
+    reduce(inputs, "list.txt", "counts", "--mode", "clique")
+    with np.load(inputs / "counts.npz") as data:
+        assert data['channels'].tolist() == ['raw'] and data['mat'].shape == (1, 1, 30)
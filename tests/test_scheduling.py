@@ -0,0 +1,43 @@
+"""Cost estimates and longest-first packing of tasks"""
+
+import numpy as np
+
+from graphlet_helper.scheduling import pack_longest_first, makespan, task_cost, residue_count, CostIndex
+from graphlet_helper.toolbox import ContactGraphMaker
+from graphlet_helper.synthetic import random_backbone
+
+def test_pack_longest_first():
+    costs = np.array([3., 7., 2., 5., 3., 4.])
+    bins = pack_longest_first(costs, 2)
+    assert sorted(i for members in bins for i in members) == list(range(len(costs)))
+    assert [costs[members].sum() for members in bins] == [12., 12.]
+
+def test_pack_bounds():
+    costs = np.random.default_rng(0).pareto(1.5, 200) + 1
+    bins = pack_longest_first(costs, 16)
+    loads = [costs[members].sum() for members in bins]
+    assert loads == sorted(loads, reverse=True)
+    # LPT is within the largest task of the average load
+    assert loads[0] <= costs.sum() / 16 + costs.max()
+
+def test_pack_more_bins_than_tasks():
+    assert pack_longest_first(np.array([1., 2.]), 5) == [[1], [0]]
+
+def test_makespan():
+    assert makespan([3., 3., 3.], 2) == 6.
+    assert makespan([1., 1., 1., 1., 4.], 2) == 6.
+    assert makespan([4., 1., 1., 1., 1.], 2) == 4.
+
+def test_task_cost():
+    assert task_cost(100) == 100.
+    assert task_cost(100, edges=300) == 300. * 6. ** 2
+
+def test_cost_index(tmp_path):
+    x = random_backbone(50, seed=0)
+    np.save(tmp_path / "p.npy", x)
+    assert residue_count(tmp_path / "p.npy") == 50
+    index = CostIndex(tmp_path / "costs.tsv")
+    edges = ContactGraphMaker(8.).contacts(x)[0].shape[0]
+    assert index.measure("p", tmp_path / "p.npy", 8) == (50, edges)
+    # read back from the index file, without loading the input
+    assert CostIndex(tmp_path / "costs.tsv").measure("p", None, 8., load=None) == (50, edges)
@@ -0,0 +1,24 @@
+"""Tiled similarity and top-k against dense NumPy"""
+
+import numpy as np
+import pytest
+
+from graphlet_helper.similarity import Similarity
+
+@pytest.mark.parametrize("metric", ['cosine', 'euclidean'])
+def test_topk(metric):
+    X = np.random.default_rng(0).random((50, 8))
+    indices, values = Similarity(X, metric=metric, block=16, dtype=np.float64).topk(5)
+    if metric == 'cosine':
+        unit = X / np.linalg.norm(X, axis=1, keepdims=True)
+        S = unit @ unit.T
+    else:
+        S = -np.linalg.norm(X[:, None] - X[None], axis=2)
+    np.fill_diagonal(S, -np.inf)
+    expected = np.argsort(-S, axis=1, kind='stable')[:, :5]
+    assert np.array_equal(indices, expected)
+    np.testing.assert_allclose(np.abs(values), np.abs(np.take_along_axis(S, expected, axis=1)), rtol=1e-9)
+
+def test_topk_single_row():
+    indices, values = Similarity(np.ones((1, 4))).topk(3)
+    assert indices.shape == values.shape == (1, 0)
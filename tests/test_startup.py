@@ -0,0 +1,16 @@
+"""Import-time budget of the light entry points (see check_startup.py)"""
+
+import os
+
+import pytest
+
+import check_startup
+
+# e.g. STARTUP_BUDGET_SCALE=3 on a slow or busy machine
+SCALE = float(os.environ.get("STARTUP_BUDGET_SCALE", 1.))
+
+@pytest.mark.parametrize("module, budget", list(check_startup.BUDGETS.items()))
+def test_import_budget(module, budget):
+    ms, heavy = check_startup.import_time(module, repeats=3)
+    assert not heavy, f"{module} imports {', '.join(heavy)}"
+    assert ms <= budget * SCALE, f"{module} took {ms:.1f} ms to import (budget {budget * SCALE:.0f} ms)"
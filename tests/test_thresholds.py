@@ -0,0 +1,28 @@
+"""One sweep of several thresholds against a run per threshold"""
+
+import numpy as np
+import pytest
+
+from graphlet_helper.synthetic import random_backbone
+
+from count_graphlets import make_runner, ALL_MODES
+
+THRESHOLDS = [10., 6., 8.]
+
+@pytest.fixture(scope='module')
+def infile(tmp_path_factory):
+    path = tmp_path_factory.mktemp("sweep") / "backbone.npy"
+    np.save(path, random_backbone(70, seed=7))
+    return path
+
+@pytest.mark.parametrize("modes", [['orca-native'], ['grafene-native'], ['clique'], ['descriptors'], ALL_MODES],
+                         ids=['orca-native', 'grafene-native', 'clique', 'descriptors', 'all'])
+def test_run_thresholds(infile, modes):
+    result = make_runner(modes, THRESHOLDS[0]).run_thresholds(infile, THRESHOLDS)
+    assert result['thresholds'].tolist() == sorted(THRESHOLDS)
+    for i, threshold in enumerate(sorted(THRESHOLDS)):
+        expected = make_runner(modes, threshold).run(infile)
+        keys = [key for key in expected if key.endswith('mat')]
+        assert keys
+        for key in keys:
+            assert np.array_equal(result[key][i], expected[key]), key
@@ -0,0 +1,32 @@
+"""Incremental trajectory counts against counting every frame from scratch"""
+
+import numpy as np
+import pytest
+
+from graphlet_helper import cliques
+from graphlet_helper.orca_native import orbit_counts
+from graphlet_helper.trajectory import OrbitTracker, CliqueTracker, frame_changes
+from graphlet_helper.toolbox import ContactGraphMaker
+from graphlet_helper.synthetic import random_backbone
+
+@pytest.fixture(scope='module')
+def frames():
+    x = random_backbone(60, seed=5)
+    rng = np.random.default_rng(0)
+    maker = ContactGraphMaker(7., selfloop=False)
+    return [maker(x + rng.normal(0, 0.5, x.shape) * (i > 0)) for i in range(5)]
+
+# max_fraction 1: every frame after the first is updated; the default falls back on busy frames
+@pytest.mark.parametrize("max_fraction", [1., 0.05])
+def test_orbit_tracker(frames, max_fraction):
+    tracker = OrbitTracker(max_fraction=max_fraction)
+    for adjmat, changes in zip(frames, frame_changes(frames)):
+        assert np.array_equal(tracker(adjmat, changes), orbit_counts(adjmat))
+
+@pytest.mark.parametrize("maximal", [True, False])
+def test_clique_tracker(frames, maximal):
+    tracker = CliqueTracker(K=6, maximal=maximal, max_fraction=1.)
+    for adjmat, changes in zip(frames, frame_changes(frames)):
+        expected = cliques.maximal_clique_sizes(adjmat, K=6) if maximal else cliques.clique_counts(adjmat, K=6)
+        assert np.array_equal(tracker(adjmat, changes), expected)
+    assert tracker.full == 1